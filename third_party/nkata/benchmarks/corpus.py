@@ -0,0 +1,176 @@
+# Copyright 2015 The Offline Content Packager Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Synthetic content to benchmark the commands on.
+
+Writes a source directory of generated sections, each holding HTML pages
+in nested directories, a videos section, and the config.yaml bundling it.
+Run from the nkata directory:
+
+  python -m benchmarks.corpus /tmp/corpus --preset pages
+"""
+from os import makedirs
+from os import urandom
+from os.path import join
+
+import click
+from .html_transform import make_page
+import yaml
+
+# preset: (sections, pages, page size in KB, depth, videos,
+#          video size in MB, divisions)
+PRESETS = {
+    "small": (4, 40, 8, 2, 2, 1, 0),
+    "pages": (20, 5000, 4, 3, 1, 1, 0),
+    "videos": (2, 20, 8, 1, 4, 512, 0),
+    "divisions": (40, 2000, 4, 8, 2, 8, 10),
+}
+
+BLOCK_SIZE = 1024 * 1024
+
+
+def make_corpus(root, sections, pages, page_kb, depth, videos, video_mb,
+                divisions):
+  """Writes a source directory and its config.yaml under root.
+
+  Args:
+    root: Directory to write to, it is created if needed
+    sections: Number of content sections
+    pages: Number of HTML pages, spread over the sections
+    page_kb: Size of each page in KB
+    depth: Number of nested directories the pages of a section are in
+    videos: Number of videos in the videos section
+    video_mb: Size of each video in MB
+    divisions: Number of divisions the sections are split into, 0 bundles
+               every section in a single tree
+
+  Returns:
+    Total size of the generated files in bytes
+  """
+  src_dir = join(root, "source")
+  total = 0
+
+  page = make_page(page_kb * 1024).encode("utf-8")
+  for i in range(sections):
+    section = "section%d" % i
+    makedirs(join(src_dir, section))
+    config = {"title": "Section %d" % i, "online_link": "",
+              "metadata": [{"filename": "index.html", "title": "Index"}]}
+    total += write_yaml(join(src_dir, section, "section_config.yaml"), config)
+    for n in range(i, pages, sections):
+      # the first page is the index, the others are spread over depth
+      # nested directories
+      levels = 0 if n < sections else n % (depth + 1)
+      path = join(src_dir, section,
+                  *["level%d" % level for level in range(levels)])
+      try:
+        makedirs(path)
+      except OSError:
+        pass
+      name = "index.html" if n < sections else "page%d.html" % n
+      with open(join(path, name), "wb") as page_file:
+        page_file.write(page)
+      total += len(page)
+
+  video_dir = join(src_dir, "videos", "clips")
+  makedirs(video_dir)
+  block = urandom(BLOCK_SIZE)
+  for n in range(videos):
+    with open(join(video_dir, "clip%d.mp4" % n), "wb") as video_file:
+      for _ in range(video_mb):
+        video_file.write(block)
+    total += video_mb * BLOCK_SIZE
+
+  division = ""
+  if divisions:
+    division = {}
+    for i in range(sections):
+      division.setdefault("div%d" % (i % divisions), []).append(
+          "section%d" % i)
+    for items in division.values():
+      items.append("videos/clips")
+
+  write_yaml(join(root, "config.yaml"), {
+      "project_title": "Benchmark",
+      "project_subtitle": "Synthetic content",
+      "absolute_link_color": "green",
+      "tracking_code": "UA-XXXXXXX-X",
+      "output_folder_name": "goc",
+      "media_placement": "copy",
+      "zip_compression_level": 6,
+      "source": {"main_path": src_dir, "video_source": "videos"},
+      "destination": {"main_path": join(root, "output")},
+      "version": "1.0.0",
+      "division": division
+  })
+  return total
+
+
+def write_yaml(path, data):
+  """Writes data to a YAML file and returns its size."""
+  content = yaml.safe_dump(data, default_flow_style=False).encode("utf-8")
+  with open(path, "wb") as data_file:
+    data_file.write(content)
+  return len(content)
+
+
+def corpus_options(func):
+  """Adds the options describing a corpus to a command."""
+  options = [
+      click.option("--preset", type=click.Choice(sorted(PRESETS)),
+                   default="small", help="Shape of the content"),
+      click.option("--sections", type=int, help="Number of sections"),
+      click.option("--pages", type=int, help="Number of HTML pages"),
+      click.option("--page-kb", type=int, help="Size of a page in KB"),
+      click.option("--depth", type=int, help="Nesting of the pages"),
+      click.option("--videos", type=int, help="Number of videos"),
+      click.option("--video-mb", type=int, help="Size of a video in MB"),
+      click.option("--divisions", type=int, help="Number of divisions"),
+  ]
+  for option in reversed(options):
+    func = option(func)
+  return func
+
+
+def corpus_params(preset, **overrides):
+  """Parameters of make_corpus from a preset and the options given.
+
+  Args:
+    preset: Name of the preset
+    **overrides: Options overriding the preset, None keeps its value
+
+  Returns:
+    Dictionary of the keyword arguments of make_corpus
+  """
+  names = ("sections", "pages", "page_kb", "depth", "videos", "video_mb",
+           "divisions")
+  params = dict(zip(names, PRESETS[preset]))
+  for name in names:
+    if overrides.get(name) is not None:
+      params[name] = overrides[name]
+  return params
+
+
+@click.command()
+@click.argument("root", type=click.Path(file_okay=False))
+@corpus_options
+def main(root, preset, **overrides):
+  """Writes a synthetic corpus to ROOT."""
+  params = corpus_params(preset, **overrides)
+  total = make_corpus(root, **params)
+  click.echo("Wrote %.1f MB to %s" % (total / 1000000.0, root))
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,192 @@
+# Copyright 2015 The Offline Content Packager Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark of the nkata commands on a synthetic corpus.
+
+Generates a corpus (see benchmarks.corpus), then runs bundle, bundle again
+with nothing changed, bundle-videos --force, analyze and convert on it,
+each in its own process and with --profile, and prints the wall time and
+the stages of each step.
+Run from the nkata directory:
+
+  python -m benchmarks.entry_points --preset pages --jobs 4 --output new.json
+
+Pass the report of a previous run as --baseline to fail when a step got
+slower than the tolerance allows.
+"""
+import json
+from os import environ
+from os import getcwd
+from os import makedirs
+from os import symlink
+from os.path import abspath
+from os.path import isfile
+from os.path import join
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import click
+from .corpus import corpus_options
+from .corpus import corpus_params
+from .corpus import make_corpus
+
+# name of a step: command line arguments, whether it writes a profile
+STEPS = [
+    ("bundle", ["bundle"], True),
+    ("bundle_unchanged", ["bundle"], True),
+    ("bundle_videos", ["bundle-videos", "--force"], True),
+    ("analyze", ["analyze"], False),
+    ("convert", ["convert"], True),
+]
+
+
+def run_step(work_dir, name, args, profiled, jobs):
+  """Runs a command in work_dir.
+
+  Args:
+    work_dir: Directory holding config.yaml
+    name: Name of the step
+    args: Command line arguments of nkata
+    profiled: Whether the command takes --profile
+    jobs: Value of --jobs, for the commands taking it
+
+  Returns:
+    Dictionary of the wall time of the process and the profile report
+
+  Raises:
+    ClickException: if the command fails
+  """
+  args = list(args)
+  if args[0] in ("bundle", "bundle-videos", "convert"):
+    args += ["--jobs", str(jobs)]
+  report_path = join(work_dir, "profile-%s.json" % name)
+  if profiled:
+    args += ["--profile", report_path]
+
+  command = [sys.executable, "-W", "ignore", "-c",
+             "from scripts.main import cli; cli()"] + args
+  env = dict(environ)
+  env["PYTHONPATH"] = getcwd()
+  start = time.time()
+  with open(join(work_dir, "%s.log" % name), "w") as log_file:
+    status = subprocess.call(command, cwd=work_dir, env=env, stdout=log_file,
+                             stderr=subprocess.STDOUT)
+  wall = time.time() - start
+  if status:
+    raise click.ClickException("%s failed, see %s" % (
+        name, join(work_dir, "%s.log" % name)))
+
+  report = None
+  if profiled and isfile(report_path):
+    with open(report_path) as report_file:
+      report = json.load(report_file)
+  return {"wall_seconds": wall, "profile": report}
+
+
+def prepare(work_dir, params):
+  """Writes the corpus and links the templates and images of nkata."""
+  makedirs(work_dir)
+  size = make_corpus(work_dir, **params)
+  for name in ("templates", "img"):
+    symlink(join(getcwd(), name), join(work_dir, name))
+  return size
+
+
+def echo_step(name, result):
+  """Prints the wall time and the stages of a step."""
+  click.echo("%-18s %9.3f s" % (name, result["wall_seconds"]))
+  if not result["profile"]:
+    return
+  stages = result["profile"]["stages"]
+  for stage in sorted(stages):
+    total = stages[stage]
+    click.echo("  %-16s %9.3f s %7d files %10.1f files/s %9.2f MB/s" % (
+        stage, total["seconds"], total["files"], total["files_per_second"],
+        total["bytes_per_second"] / 1000000.0))
+
+
+def compare(results, baseline, tolerance):
+  """Lists the steps slower than in baseline.
+
+  Args:
+    results: Results of this run by step
+    baseline: Report of a previous run
+    tolerance: Fraction a step may be slower than in baseline
+
+  Returns:
+    List of messages, empty if no step got slower
+  """
+  slower = []
+  for name, result in sorted(results.items()):
+    previous = baseline["steps"].get(name)
+    if not previous:
+      continue
+    limit = previous["wall_seconds"] * (1 + tolerance)
+    if result["wall_seconds"] > limit:
+      slower.append("%s: %.3f s, was %.3f s" % (
+          name, result["wall_seconds"], previous["wall_seconds"]))
+  return slower
+
+
+@click.command()
+@corpus_options
+@click.option("--jobs", default=1, help="Files processed in parallel")
+@click.option("--output", type=click.Path(dir_okay=False),
+              help="Write the results to this JSON file")
+@click.option("--baseline", type=click.Path(exists=True, dir_okay=False),
+              help="Results of a previous run to compare with")
+@click.option("--tolerance", default=0.25,
+              help="Fraction a step may be slower than in the baseline")
+@click.option("--keep", is_flag=True, help="Keep the corpus and the output")
+def main(preset, jobs, output, baseline, tolerance, keep, **overrides):
+  """Times the commands on a generated corpus."""
+  params = corpus_params(preset, **overrides)
+  tmp_dir = abspath(tempfile.mkdtemp(prefix="nkata-bench"))
+  work_dir = join(tmp_dir, "work")
+  try:
+    size = prepare(work_dir, params)
+    click.echo("%s corpus: %.1f MB in %s" % (preset, size / 1000000.0,
+                                              work_dir))
+    results = {}
+    for name, args, profiled in STEPS:
+      results[name] = run_step(work_dir, name, args, profiled, jobs)
+      echo_step(name, results[name])
+  finally:
+    if not keep:
+      shutil.rmtree(tmp_dir)
+
+  report = {"preset": preset, "corpus": params, "corpus_bytes": size,
+            "jobs": jobs, "steps": results}
+  if output:
+    with open(output, "w") as report_file:
+      json.dump(report, report_file, indent=2, sort_keys=True)
+
+  if baseline:
+    with open(baseline) as baseline_file:
+      previous = json.load(baseline_file)
+    if (previous["corpus"], previous["jobs"]) != (params, jobs):
+      raise click.ClickException("The baseline was run on another corpus or"
+                                 " number of jobs")
+    slower = compare(results, previous, tolerance)
+    if slower:
+      raise click.ClickException("Slower than the baseline:\n  " +
+                                 "\n  ".join(slower))
+    click.echo("No step is slower than the baseline.")
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,143 @@
+# Copyright 2015 The Offline Content Packager Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Micro-benchmark of the HTML transformation.
+
+Compares the streaming engine with the previous engine, which ran one
+regular expression pass over the whole document per step. Run from the
+nkata directory:
+
+  python -m benchmarks.html_transform --pages 20 --size 2
+"""
+from os import close
+from os import unlink
+import re
+import tempfile
+import timeit
+
+import click
+from scripts.transformations import HtmlTransformation
+
+TRACKING_TAG = '<img src="http://www.google-analytics.com/collect?cid=0">'
+
+PARAGRAPH = (
+    "<p>Lorem ipsum <a href='http://example.com/%(i)d' class='ext'>link</a>"
+    " dolor <a href=\"/local/%(i)d.html\">local</a> sit amet, "
+    "<a target=\"_self\" style=\"font-weight: bold\" "
+    "href=\"https://example.com/%(i)d\">styled</a> consectetur "
+    "<span>adipiscing</span> elit.</p>\n")
+
+
+def legacy_transform(transformation, html, tracking_tag):
+  """Previous engine: link, header and tracking passes over the document.
+
+  Args:
+    transformation: HtmlTransformation providing color and header
+    html: html content
+    tracking_tag: Tracking tag to insert
+
+  Returns:
+    Transformed html
+  """
+  flags = re.DOTALL | re.IGNORECASE
+  link_re = re.compile(r'<a([^>]+href=[\'"]https?://.*?)>.*?</a\s*>',
+                       flags=flags)
+  link_target_re = re.compile(r"target\s*=['\"].+?['\"]", flags=flags)
+  link_style_re = re.compile(r"style\s*=['\"](.+?)['\"]", flags=flags)
+  l_color = transformation.link_color or "green"
+
+  def transform_link(value):
+    """Transforms link."""
+    attr_append = ""
+    link, attr = value.group(0), value.group(1)
+    attr_new, count = re.subn(link_target_re, "target='_blank'", attr)
+    if count == 0:
+      attr_append += " target='_blank' "
+    attr_new, count = re.subn(
+        link_style_re, r"style='\1; color: %s'" % l_color, attr_new)
+    if count == 0:
+      attr_append += " style='color: %s' " % l_color
+    return link.replace(attr, attr_new + attr_append)
+
+  html = re.sub(link_re, transform_link, html)
+  html = re.sub(r"(<body[^>]*>)", r"\1%s" % transformation.header_html,
+                html, flags=flags)
+  return re.sub(r"(</body[^>]*>)", r"%s\1" % tracking_tag, html, flags=flags)
+
+
+def make_page(size):
+  """Generates a page of about size bytes.
+
+  Args:
+    size: Approximate size of the page in bytes
+
+  Returns:
+    html content
+  """
+  count = max(1, size // len(PARAGRAPH % {"i": 0}))
+  body = "".join([PARAGRAPH % {"i": i} for i in range(count)])
+  return ("<html><head><title>Benchmark</title></head>\n<body class='page'>\n"
+          + body + "</body></html>\n")
+
+
+def streaming_transform(transformation, src, dst):
+  """Transforms a file with the streaming engine, as bundle does."""
+  transformation.apply(src, dst, None, None, None)
+
+
+@click.command()
+@click.option("--pages", default=20, help="Number of pages")
+@click.option("--size", default=1.0, help="Size of each page in MB")
+@click.option("--repeat", default=3, help="Best of this many runs")
+def main(pages, size, repeat):
+  """Times both engines on generated pages."""
+  transformation = HtmlTransformation(color="green", code="UA-XXXXXXX-X",
+                                      link="http://example.com")
+  html = make_page(int(size * 1024 * 1024))
+
+  # both engines must produce the same page
+  transformation._create_tracking_tag = lambda dst: TRACKING_TAG
+  if transformation.transform(html, "") != legacy_transform(
+      transformation, html, TRACKING_TAG):
+    raise click.ClickException("Engines produce different output")
+
+  handle, src = tempfile.mkstemp(suffix=".html")
+  close(handle)
+  with open(src, "w") as src_file:
+    src_file.write(html)
+  dst = src + ".out"
+
+  def run_legacy():
+    for _ in range(pages):
+      with open(src) as src_file:
+        out = legacy_transform(transformation, src_file.read(), TRACKING_TAG)
+      with open(dst, "w") as out_file:
+        out_file.write(out)
+
+  def run_streaming():
+    for _ in range(pages):
+      streaming_transform(transformation, src, dst)
+
+  total = pages * len(html) / (1024.0 * 1024.0)
+  click.echo("%d pages of %.1f MB" % (pages, len(html) / (1024.0 * 1024.0)))
+  for name, func in (("legacy", run_legacy), ("streaming", run_streaming)):
+    best = min(timeit.repeat(func, number=1, repeat=repeat))
+    click.echo("%-10s %8.3f s %8.1f MB/s" % (name, best, total / best))
+
+  unlink(src)
+  unlink(dst)
+
+
+if __name__ == "__main__":
+  main()
@@ -19,34 +19,61 @@ content in MegaBytes and the suitable storage medium to copy
 content.
 """
 
-import math
-from os import walk
-from os.path import getsize
 from os.path import join
+from os.path import normpath
 import click
+from scripts.utils.cache import CACHE_DIR
+from scripts.utils.index import ContentIndex
+from scripts.utils.index import INDEX_FILE
+from scripts.utils.packing import DUAL_LAYER_DVD
+from scripts.utils.packing import FLASH_16GB
+from scripts.utils.packing import list_content
+from scripts.utils.packing import plan_volumes
+from scripts.utils.packing import SINGLE_LAYER_DVD
 import yaml
 
+# sizes are printed and read in millions of bytes, convert --size counts
+# MB of 1024 * 1024 bytes
+MEGABYTE = 1000 * 1000
 
-def analyze_content(size):
+
+def analyze_content(size, from_index=False):
   """Analyze content for basic size information.
 
   Gives basic information about the total size of
   content in MegaBytes and the suitable storage medium to copy
-  content.
+  content. Media are counted by planning the volumes as convert splits
+  them.
 
   Args:
-    size: Size of intended storage medium in MB
+    size: Size of intended storage medium in MB of a million bytes
+    from_index: Use the index of the sources saved by the last bundle, the
+                sources are scanned if there is none
   """
   with open("./config.yaml") as data_file:
     conf_data = yaml.load(data_file)
 
   src_dir = conf_data["source"]["main_path"]
-  total_size = get_size(src_dir) / 1000000.00
+  index = None
+  if from_index:
+    index = ContentIndex.load(join(conf_data["destination"]["main_path"],
+                                   CACHE_DIR, INDEX_FILE))
+    if index is None or normpath(index.root) != normpath(src_dir):
+      click.echo("No index of " + src_dir + " found, scanning it.")
+      index = None
+  if index is None:
+    index = ContentIndex(src_dir).scan()
+  content = list_content(src_dir, index)
+  total_size = sum([entry[1] for entry in content]) / float(MEGABYTE)
+
+  def count(capacity, fmt):
+    return len(plan_volumes(src_dir, capacity, fmt, content=content,
+                            index=index))
 
   if not size:
-    single_layered_disc = int(math.ceil(total_size / 4700))
-    dual_layered_disc = int(math.ceil(total_size / 8500))
-    flash = int(math.ceil(total_size / 16000))
+    single_layered_disc = count(SINGLE_LAYER_DVD, "iso")
+    dual_layered_disc = count(DUAL_LAYER_DVD, "iso")
+    flash = count(FLASH_16GB, "files")
     click.echo("The total size of content is {0}MB".format(total_size))
     click.echo("You need {0} single-layered DVD disc(s) or {1} dual-layered"
                " DVD disc(s) to copy content".format(single_layered_disc,
@@ -54,24 +81,22 @@ def analyze_content(size):
     click.echo(
         " OR You need {0} (16GB) flash drive(s) to copy content".format(flash))
   else:
-    device_number = int(math.ceil(total_size / int(size)))
+    device_number = count(int(size) * MEGABYTE, "iso")
     click.echo("The total size of content is {0}MB".format(total_size))
     click.echo(
         "You need {0} storage device of this size to copy content".format(device_number))
 
 
-def get_size(start_path="."):
+def get_size(start_path=".", index=None):
   """Gets total size of content.
 
   Args:
     start_path: Directory path to content
+    index: ContentIndex holding start_path, start_path is scanned if None
 
   Returns:
     Total size of content located at start_path
   """
-  total_size = 0
-  for dirpath, _, filenames in walk(start_path):
-    for filename in filenames:
-      filename_path = join(dirpath, filename)
-      total_size += getsize(filename_path)
-  return total_size
+  if index is None:
+    index = ContentIndex(start_path).scan()
+  return index.size(start_path)
@@ -19,6 +19,7 @@ from datetime import datetime
 import logging
 from os import getcwd
 from os import makedirs
+from os import walk
 from os.path import basename
 from os.path import exists
 from os.path import isdir
@@ -33,9 +34,19 @@ import jinja2
 from scripts.transformations import HtmlTransformation
 from scripts.transformations import VideoTransformation
 from scripts.utils import bundle_content_section
+from scripts.utils import BundleCache
+from scripts.utils import ContentIndex
 from scripts.utils import bundle_video_section
+from scripts.utils import create_placer
+from scripts.utils import Engine
+from scripts.utils import Fetcher
 from scripts.utils import get_divisions
 from scripts.utils import get_sections
+from scripts.utils import INDEX_FILE
+from scripts.utils import load_yaml
+from scripts.utils import PROFILER
+from scripts.utils import STORE_DIR
+from scripts.utils import wait_for_section
 from .verifyconfig import readconfig
 from .verifyconfig import verify_section_config
 import yaml
@@ -45,15 +56,15 @@ JINJA_ENVIRONMENT = jinja2.Environment(
     extensions=["jinja2.ext.autoescape"],
     autoescape=True)
 
-#pylint: disable=invalid-name
-main_page_index = list()
-division_process = list()
-division_main_list = list()
-page_index = []
+def compile_sections(force=False, jobs=1):
+  """Bundles each section except the videos directory.
 
+  Files that are unchanged since the previous run are skipped, using the
+  manifest kept in the destination directory.
 
-def compile_sections():
-  """Bundles each section except the videos directory.
+  Args:
+    force: Ignore the manifest and bundle every file again
+    jobs: Number of files processed in parallel
 
   Returns:
     False if one of the paths in the config file does not exist
@@ -69,7 +80,8 @@ def compile_sections():
                       "source.main_path", "source.video_source",
                       "destination.main_path",
                       "absolute_link_color", "tracking_code"]
-    conf_data = readconfig(important_keys)
+    with PROFILER.stage("config_read", 1):
+      conf_data = readconfig(important_keys)
   except:
     click.echo("Error in main config file. That's in config.yaml,"
                "in the root directory of nkata. Fix, then try again."
@@ -92,85 +104,114 @@ def compile_sections():
       "tracking_code": tracking_code,
       "link_color": link_color
   }
+  # one scan of the sources for every section and division
+  index = ContentIndex(src_dir).scan()
+  cache = BundleCache(dst, force, index,
+                      conf_data.get("cache_path") or STORE_DIR)
+  engine = Engine(jobs)
+  placer = create_placer(conf_data.get("media_placement"))
 
-  if conf_data["division"]:
-    division_process.append(True)
-    division_values = list(conf_data["division"].values())
-    division_list = [item for sublist in division_values for item in sublist]
-    division_main_list.extend(list(conf_data["division"].keys()))
-    verify_section_config(src_dir, list(set(division_list)), video_src)
-
-    for div in conf_data["division"]:
-
-      dst_dir = join(dst, folder_name, div)
+  try:
+    if conf_data["division"]:
+      division_values = list(conf_data["division"].values())
+      division_list = [item for sublist in division_values for item in sublist]
+      verify_section_config(src_dir, list(set(division_list)), video_src,
+                            index)
+
+      for div in conf_data["division"]:
+
+        dst_dir = join(dst, folder_name, div)
+        if not isdir(dst_dir):
+          makedirs(dst_dir)
+
+        # get list of sections plus ignoring videos source
+        if not exists(src_dir):
+          message = ("\nError: Source Directory( " + src_dir +
+                     " ) specified doesn't exist\n")
+          click.echo(click.style(message, fg="red"))
+          logging.error("Source Directory( " + src_dir +
+                        " ) specified doesn't exist")
+          return False
+
+        sections = get_divisions(conf_data["division"][div], [video_src])
+        kwargs = (div, None, sections[1])
+        process_sections(src_dir, dst_dir, config, sections[0], kwargs, cache,
+                         engine, placer, index, conf_data)
+
+      # generate homepage with links to each division
+      generate_template(join(dst, folder_name), title, "", tracking_code,
+                        list(conf_data["division"].keys()), True,
+                        cache=cache)
+    else:
+      dst_dir = join(dst, folder_name)
       if not isdir(dst_dir):
         makedirs(dst_dir)
-
       # get list of sections plus ignoring videos source
       if not exists(src_dir):
         message = ("\nError: Source Directory( " + src_dir +
                    " ) specified doesn't exist\n")
         click.echo(click.style(message, fg="red"))
-        logging.error("Source Directory( " + src_dir +
-                      " ) specified doesn't exist")
+        logging.debug("Source Directory( " +
+                      src_dir + " ) specified doesn't exist")
         return False
-
-      sections = get_divisions(conf_data["division"][div], [video_src])
-      kwargs = (page_index, div, None, sections[1])
-      process_sections(src_dir, dst_dir, config, sections[0], kwargs)
-      page_index[:] = list()
-  else:
-    division_process.append(False)
-    dst_dir = join(dst, folder_name)
-    if not isdir(dst_dir):
-      makedirs(dst_dir)
-    # get list of sections plus ignoring videos source
-    if not exists(src_dir):
-      message = ("\nError: Source Directory( " + src_dir +
-                 " ) specified doesn't exist\n")
-      click.echo(click.style(message, fg="red"))
-      logging.debug("Source Directory( " +
-                    src_dir + " ) specified doesn't exist")
-      return False
-    sections = get_sections(src_dir, [join(src_dir, video_src)])
-    path_to = folder_name
-    verify_section_config(src_dir, sections, video_src)
-    kwargs = (main_page_index, path_to, "single", None)
-    process_sections(src_dir, dst_dir, config, sections, kwargs)
+      sections = get_sections(src_dir, [join(src_dir, video_src)], index)
+      path_to = folder_name
+      verify_section_config(src_dir, sections, video_src, index)
+      kwargs = (path_to, "single", None)
+      process_sections(src_dir, dst_dir, config, sections, kwargs, cache,
+                       engine, placer, index, conf_data)
+  finally:
+    engine.close()
+
+  # remove output of sections and files that no longer exist
+  cache.prune(join(dst, folder_name))
+  cache.save()
+  index.save(join(cache.cache_dir, INDEX_FILE))
 
   click.echo(click.style(".......... Finished!", fg="green"))
   logging.info(".............. Finished")
 
 
-def process_sections(src_dir, dst_dir, config, sections, kwargs):
+def process_sections(src_dir, dst_dir, config, sections, kwargs, cache=None,
+                     engine=None, placer=None, index=None, conf_data=None):
   """Process each section and calls generate_template.
 
+  The files of every section are submitted to engine before waiting for
+  the first one, so sections are processed in parallel.
+
   Args:
     src_dir: Source Directory
     dst_dir: Destination Directory
     config: Configuration data from yaml file
     sections: List of sections
     kwargs: List of arguments containing:
-      Page index
       Path
       Type
       Division
+    cache: BundleCache shared between sections
+    engine: Engine running the copies
+    placer: Placer shared between sections
+    index: ContentIndex of the sources
+    conf_data: Main configuration, passed on to compile_videos
 
+  Returns:
+    Page index of the sections, in the order of sections
   """
-  page_index, path_to, typ, division = kwargs
+  path_to, typ, division = kwargs
+  page_index = list()
+  jobs = list()
   for section in sections:
     src_path = join(src_dir, section)
     dst_path = join(dst_dir, section)
 
     config_file_path = join(src_path, "section_config.yaml")
-    if not isfile(src_path):
+    if not (index.isfile(src_path) if index else isfile(src_path)):
       try:
-        with open(config_file_path) as data_file:
-          config_data = yaml.load(data_file)
-          title = config_data["title"]
-          online_link = config_data["online_link"] or ""
-          metadata = config_data["metadata"]
-          page_index.append((section, path_to, title, metadata))
+        config_data = load_yaml(config_file_path, index)
+        title = config_data["title"]
+        online_link = config_data["online_link"] or ""
+        metadata = config_data["metadata"]
+        page_index.append((section, path_to, title, metadata))
       except:
         message = ("Error in " + section +
                    " config file. Check sample and try again")
@@ -180,21 +221,32 @@ def process_sections(src_dir, dst_dir, config, sections, kwargs):
 
     else:
       online_link = None
-    bundle_content_section(src_path, dst_path, section, config, online_link)
+    jobs.append(bundle_content_section(src_path, dst_path, section, config,
+                                       online_link, cache, engine, placer,
+                                       index))
+
+  for job in jobs:
+    wait_for_section(job)
 
   if division:
-    compile_videos(division, dst_dir, path_to)
+    videos = compile_videos(division, dst_dir, path_to, cache, engine=engine,
+                            placer=placer, index=index, conf_data=conf_data)
+    if videos:
+      page_index.extend(videos)
 
   elif division is None:
-    compile_videos()
+    compile_videos(cache=cache, engine=engine, page_index=page_index,
+                   placer=placer, index=index, conf_data=conf_data)
 
   if not typ:
     generate_template(dst_dir, config["title"], config["sub_title"],
-                      config["tracking_code"], page_index, None, True)
+                      config["tracking_code"], page_index, None, True, cache)
+  return page_index
 
 
 def process_video_sections(sections, folder_name, transformations,
-                           video_transformation, kwargs):
+                           video_transformation, kwargs, cache=None,
+                           engine=None, placer=None, index=None):
   """Process video sections.
 
   Args:
@@ -203,24 +255,30 @@ def process_video_sections(sections, folder_name, transformations,
     transformations: Transformations
     video_transformation: Video Transformation object
     kwargs: list of config data
+    cache: BundleCache shared between sections
+    engine: Engine running the copies
+    placer: Placer shared between sections
+    index: ContentIndex of the sources
+
+  Returns:
+    Tuple of the page index entries of the sections and the list of links
+    to the sections, in the order of sections
   """
-  (src_dir, dst_dir, video_src, title, sub_title,
-   tracking_code, dst, path_to) = kwargs
+  src_dir, dst_dir, video_src, path_to = kwargs
+  page_index = list()
   meta = list()
-  division_meta = list()
+  jobs = list()
   for section in sections:
     src_path = join(src_dir, video_src, section)
     dst_path = join(dst_dir, section)
-    if not isfile(join(src_dir, video_src, section)):
+    if not (index.isfile(src_path) if index else isfile(src_path)):
       # read videos conf file
       try:
-        with open(join(src_dir, video_src, section,
-                       "section_config.yaml")) as video_file:
-          config_data = yaml.load(video_file)
-          video_subtitle = config_data["video_subtitle"]
-          video_summary = config_data["video_summary"]
-          metadata = config_data["metadata"]
-          template_path = config_data["template_path"]
+        config_data = load_yaml(join(src_path, "section_config.yaml"), index)
+        video_subtitle = config_data["video_subtitle"]
+        video_summary = config_data["video_summary"]
+        metadata = config_data["metadata"]
+        template_path = config_data["template_path"]
       except:
         click.echo(section + " video configuration file doesn't exist "
                    "or has an error. Using default values.")
@@ -246,52 +304,67 @@ def process_video_sections(sections, folder_name, transformations,
           "title": section
       }
       meta.append(con)
-      division_meta.append(con)
-      page_index.append((path_to, "", section + " videos", division_meta))
-      division_meta = []
+      page_index.append((path_to, "", section + " videos", [con]))
       paths = (src_path, dst_path)
       videos_path = join(src_dir, folder_name, video_src)
-      bundle_video_section(paths, section, metadata,
-                           transformations, videos_path)
-
-      # generate individual pages for each video
-      video_transformation.generate_video_list_html(dst_path, video_subtitle,
-                                                    video_summary, path_to,
-                                                    template_path)
-
-  # generate video homepage with links to individual videos
-  if division_process and division_process[0]:
-    dst_folder = join(dst, folder_name)
-    generate_template(dst_folder, title, "",
-                      tracking_code, division_main_list, True)
-  else:
-    main_page_index.append((video_src, folder_name, video_src, meta))
-    generate_template(join(dst, folder_name), title, sub_title,
-                      tracking_code, main_page_index)
-
-
-def compile_videos(division=None, div_dir=None, path_to=None):
+      job = bundle_video_section(paths, section, metadata, transformations,
+                                 videos_path, cache, engine, placer, index)
+      jobs.append((job, dst_path, video_subtitle, video_summary,
+                   template_path))
+
+  for job, dst_path, video_subtitle, video_summary, template_path in jobs:
+    list_of_videos = video_transformation.list_videos(wait_for_section(job))
+
+    # generate individual pages for each video
+    video_transformation.generate_video_list_html(dst_path, list_of_videos,
+                                                  video_subtitle,
+                                                  video_summary, path_to,
+                                                  template_path)
+
+  return page_index, meta
+
+
+def compile_videos(division=None, div_dir=None, path_to=None, cache=None,
+                   force=False, engine=None, jobs=1, page_index=None,
+                   placer=None, index=None, conf_data=None):
   """Bundles only video content.
 
+  Without a division, the homepage is generated with links to page_index
+  and to the videos.
+
   Args:
     division: Division object
     div_dir: Division directory
     path_to: Path to division directory
+    cache: BundleCache shared with compile_sections, a new one is created
+           and saved when not given
+    force: Ignore the manifest and bundle every file again
+    engine: Engine shared with compile_sections, a new one running jobs
+            files in parallel is created when not given
+    jobs: Number of files processed in parallel
+    page_index: Page index of the content sections for the homepage
+    placer: Placer shared with compile_sections, a new one using the
+            media_placement config value is created when not given
+    index: ContentIndex shared with compile_sections, the sources are
+           scanned when not given
+    conf_data: Main configuration, config.yaml is read when not given
 
   Returns:
-    False if there is an exception
+    Page index entries of the videos or False if there is an exception
   """
   click.echo("Processing videos .....................................")
 
-  try:
-    with open("./config.yaml") as data_file:
-      conf_data = yaml.load(data_file)
-  except:
-    message = ("Oops!  There is no configuration file."
-               "  Check sample and try again...")
-    click.echo(click.style(message, fg="red"))
-    logging.debug("Oops!  There is no configuration file.")
-    return False
+  if conf_data is None:
+    try:
+      with PROFILER.stage("config_read", 1):
+        with open("./config.yaml") as data_file:
+          conf_data = yaml.load(data_file)
+    except:
+      message = ("Oops!  There is no configuration file."
+                 "  Check sample and try again...")
+      click.echo(click.style(message, fg="red"))
+      logging.debug("Oops!  There is no configuration file.")
+      return False
 
   src_dir = conf_data["source"]["main_path"]
   video_src = conf_data["source"]["video_source"] or "videos"
@@ -314,27 +387,60 @@ def compile_videos(division=None, div_dir=None, path_to=None):
                   " ) specified doesn't exist")
     return False
 
+  if index is None:
+    index = ContentIndex(src_dir).scan()
+  own_cache = cache is None
+  if own_cache:
+    cache = BundleCache(dst, force, index,
+                        conf_data.get("cache_path") or STORE_DIR)
+  own_engine = engine is None
+  if own_engine:
+    engine = Engine(jobs)
+  if placer is None:
+    placer = create_placer(conf_data.get("media_placement"))
+  fetcher = Fetcher(join(cache.cache_dir, "http"),
+                    stage="thumbnail_download")
+
   # Initialising a list of transformations
-  video_transformation = VideoTransformation(tracking_code, JINJA_ENVIRONMENT)
+  video_transformation = VideoTransformation(tracking_code, JINJA_ENVIRONMENT,
+                                             cache, placer, fetcher, index)
   transformations = list()
   transformations.append(HtmlTransformation(color=link_color,
-                                            code=tracking_code, link=False))
+                                            code=tracking_code, link=False,
+                                            cache=cache))
   transformations.append(video_transformation)
 
   # copy videos
   sections = get_sections(join(src_dir, video_src),
-                          join(src_dir, video_src, "metadata"))
-
-  if not division:
-    kwargs = (src_dir, dst_dir, video_src,
-              title, sub_title, tracking_code, dst, path_to)
-    process_video_sections(sections, folder_name,
-                           transformations, video_transformation, kwargs)
-  else:
-    kwargs = (src_dir, div_dir, video_src,
-              title, sub_title, tracking_code, dst, path_to)
-    process_video_sections(division, folder_name,
-                           transformations, video_transformation, kwargs)
+                          join(src_dir, video_src, "metadata"), index)
+
+  # download the thumbnails while the videos are copied
+  fetcher.prefetch(thumbnail_urls(join(src_dir, video_src),
+                                  division or sections, index))
+
+  try:
+    if not division:
+      kwargs = (src_dir, dst_dir, video_src, path_to)
+      _, meta = process_video_sections(sections, folder_name,
+                                       transformations, video_transformation,
+                                       kwargs, cache, engine, placer,
+                                       index)
+      videos = [(video_src, folder_name, video_src, meta)]
+
+      # generate video homepage with links to individual videos
+      generate_template(join(dst, folder_name), title, sub_title,
+                        tracking_code, list(page_index or []) + videos,
+                        cache=cache)
+    else:
+      kwargs = (src_dir, div_dir, video_src, path_to)
+      videos, _ = process_video_sections(division, folder_name,
+                                         transformations, video_transformation,
+                                         kwargs, cache, engine, placer,
+                                         index)
+  finally:
+    if own_engine:
+      engine.close()
+    fetcher.close()
 
   # copy video image(jpeg)
   if not isdir(join(dst, folder_name, "img")):
@@ -346,9 +452,51 @@ def compile_videos(division=None, div_dir=None, path_to=None):
     makedirs(join(dst, folder_name, "img"))
   shutil.copy2("img/back-arrow.svg", join(dst, folder_name, "img"))
 
+  if own_cache:
+    cache.save()
+    index.save(join(cache.cache_dir, INDEX_FILE))
+  return videos
+
+
+def thumbnail_urls(videos_dir, sections, index=None):
+  """Lists the thumbnail URLs in the metadata of video sections.
+
+  Args:
+    videos_dir: Video source directory
+    sections: Video sections
+    index: ContentIndex of the sources, videos_dir is walked if None
+
+  Returns:
+    List of URLs
+  """
+  metadata_files = list()
+  for section in sections:
+    for dir_path, _, file_names in (index.walk if index else walk)(
+        join(videos_dir, section)):
+      for file_name in sorted(file_names):
+        path = join(dir_path, file_name)
+        if file_name.endswith("_metadata.yaml"):
+          metadata_files.append(path)
+        elif file_name == "section_config.yaml":
+          try:
+            metadata = load_yaml(path, index)["metadata"]
+            metadata_files.extend(sorted(metadata.values()))
+          except:
+            continue
+
+  urls = list()
+  for path in metadata_files:
+    try:
+      url = load_yaml(path, index)["thumbnail_url"]
+    except:
+      continue
+    if url and url not in urls:
+      urls.append(url)
+  return urls
+
 
 def generate_template(dst_dir, title, sub_title, tracking_code,
-                      page_index, division=None, back=None):
+                      page_index, division=None, back=None, cache=None):
   """Generate homepage templates.
 
   Args:
@@ -359,6 +507,7 @@ def generate_template(dst_dir, title, sub_title, tracking_code,
     page_index: Page index
     division: Division that this page belongs to
     back: Used to determine if navigation back link should be included
+    cache: BundleCache listing the page, so it is removed with its division
   """
   write_file = open(join(dst_dir, "index.html"), "w")
   created_at = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
@@ -371,10 +520,13 @@ def generate_template(dst_dir, title, sub_title, tracking_code,
       "back": back
   }
 
-  if not division:
-    template = JINJA_ENVIRONMENT.get_template("templates/homepage.html")
-  else:
-    template = JINJA_ENVIRONMENT.get_template(
-        "templates/division_homepage.html")
+  with PROFILER.stage("template_render", 1):
+    if not division:
+      template = JINJA_ENVIRONMENT.get_template("templates/homepage.html")
+    else:
+      template = JINJA_ENVIRONMENT.get_template(
+          "templates/division_homepage.html")
 
-  write_file.write(template.render(template_values))
+    write_file.write(template.render(template_values))
+  if cache:
+    cache.record_generated(join(dst_dir, "index.html"))
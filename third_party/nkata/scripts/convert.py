@@ -16,171 +16,289 @@
 """
 
 from os import makedirs
-from os import stat
-from os import walk
+from os.path import basename
 from os.path import isdir
 from os.path import join
+from os.path import normpath
 from shutil import copy2
 from shutil import copytree
 import sys
 
 import click
+from scripts.utils import ContentIndex
+from scripts.utils import Engine
+from scripts.utils import MB
+from scripts.utils import plan_volumes
+from scripts.utils import PROFILER
 from scripts.utils import to_iso
 from scripts.utils import to_zip
+from scripts.utils.packing import list_content
+from scripts.utils.zip64 import DEFAULT_LEVEL
+from scripts.utils.zip64 import STORED_EXTENSIONS
 from .verifyconfig import readconfig
 
 
-def makeiso(size=None):
+def output_index():
+  """Scans the destination directory once for every conversion.
+
+  Returns:
+    ContentIndex of the destination directory, None if config.yaml can't
+    be read
+  """
+  try:
+    with PROFILER.stage("config_read", 1):
+      dst = readconfig(["destination.main_path"], True)
+  except:
+    return None
+  return ContentIndex(dst).scan()
+
+
+def nested_dirs(conf_data):
+  """Gets the top directories of the output holding one section each.
+
+  Args:
+    conf_data: Dictionary read from config.yaml, source.video_source is
+               optional
+
+  Returns:
+    Tuple of directory names
+  """
+  video_src = (conf_data.get("source") or {}).get("video_source")
+  return (basename(normpath(video_src or "videos")),)
+
+
+def run_tasks(engine, tasks):
+  """Starts writing the files planned by iso_maker or zip_maker.
+
+  Args:
+    engine: Engine writing the files
+    tasks: List of (message, function, arguments) tuples
+
+  Returns:
+    List of objects whose get() method waits for a file
+  """
+  pending = []
+  for message, func, args in tasks:
+    click.echo(message)
+    pending.append(engine.run(func, args))
+  return pending
+
+
+def makeiso(size=None, jobs=1, keep_sections=False, index=None):
   """Converts content to ISO format.
 
+  The volumes of every division are planned and printed before the first
+  ISO file is written.
+
   Args:
     size: Size of the content to be converted
+    jobs: Number of ISO files written at the same time
+    keep_sections: Put every section on a single ISO file
+    index: ContentIndex of the destination directory, scanned if None
   """
   try:
     click.echo("\nReading and verifying "
                "configuration file.....................")
-    result = readconfig(["division", "destination.main_path",
-                         "output_folder_name"], True)
-    division = result[0]
-    dst = result[1]
-    folder_name = result[2]
+    with PROFILER.stage("config_read", 1):
+      conf_data = readconfig(["division", "destination.main_path",
+                              "output_folder_name"])
+    division = conf_data["division"]
+    dst = conf_data["destination"]["main_path"]
+    folder_name = conf_data["output_folder_name"]
+    nested = nested_dirs(conf_data)
   except:
     click.echo("Unable to read information from config.yaml. Fix it (or "
                "check it out from github) then try again.")
     return
 
-  if not division:
-    iso_maker(join(dst, folder_name), dst, folder_name, size)
-  else:
-    if not isdir(join(dst, "iso")):
-      copytree(join(dst, folder_name, "img"),
-               join(dst, "iso", "img"), symlinks=True)
-    for div in division:
-      dst_dir = join(dst, "goc", div)
-      iso_maker(dst_dir, join(dst, "iso"), div, size)
+  index = index or ContentIndex(dst).scan()
+  engine = Engine(jobs, processes=False)
+  try:
+    if not division:
+      tasks = iso_maker(join(dst, folder_name), dst, folder_name, size,
+                        keep_sections, nested, index)
+    else:
+      if not isdir(join(dst, "iso")):
+        copytree(join(dst, folder_name, "img"),
+                 join(dst, "iso", "img"), symlinks=True)
+      tasks = []
+      for div in division:
+        dst_dir = join(dst, "goc", div)
+        tasks.extend(iso_maker(dst_dir, join(dst, "iso"), div, size,
+                               keep_sections, nested, index))
 
-    copy2(join(dst, folder_name, "index.html"), join(dst, "iso"))
+      copy2(join(dst, folder_name, "index.html"), join(dst, "iso"))
 
+    for handle in run_tasks(engine, tasks):
+      handle.get()
+  finally:
+    engine.close()
 
-def iso_maker(dst_dir, dst, div, size):
-  """Gets size of content then converts content to ISO format.
+
+def iso_maker(dst_dir, dst, div, size, keep_sections=False, nested=(),
+              index=None):
+  """Gets size of content then plans its conversion to ISO format.
 
   Args:
     dst_dir: Destination directory
     dst: Destination file name
     div: Division object
     size: size of content
+    keep_sections: Put every section on a single ISO file
+    nested: Top directories holding one section per subdirectory
+    index: ContentIndex holding dst_dir, dst_dir is scanned if None
+
+  Returns:
+    List of (message, function, arguments) tuples writing the ISO files,
+    to be passed to run_tasks
   """
   if not isdir(dst_dir):
     click.echo(
         "Error: No output for div %s. Have you run the bundle command?" % div)
-    return
+    return []
 
+  if index is None:
+    index = ContentIndex(dst_dir).scan()
+  content = list_content(dst_dir, index)
+  tasks = []
   if size:
-    max_size = int(size)
-    parts = split(dst_dir, max_size)
+    parts = split(dst_dir, size, "iso", keep_sections, nested, content,
+                  index)
     for i, part in enumerate(parts):
-      click.echo(
-          "Packaging content in a ISO format %d / %d" % (i+1, len(parts)))
-      to_iso(dst_dir, join(dst, "%s%d.iso" % (div, i+1)), filelist=part)
+      tasks.append((
+          "Packaging content in a ISO format %d / %d" % (i+1, len(parts)),
+          to_iso, (dst_dir, join(dst, "%s%d.iso" % (div, i+1)), part,
+                   index)))
   else:
     # convert to ISO file
-    click.echo("Packaging content in a ISO format..................")
-    to_iso(dst_dir, join(dst, "%s.iso" % div))
+    tasks.append(("Packaging content in a ISO format..................",
+                  to_iso, (dst_dir, join(dst, "%s.iso" % div),
+                           [entry[0] for entry in content], index)))
+  return tasks
 
 
-def zip_maker(dst_dir, dst, div, size):
-  """Converts content to ZIP format.
+def zip_maker(dst_dir, dst, div, size, jobs=1, keep_sections=False,
+              nested=(), level=DEFAULT_LEVEL, index=None):
+  """Plans the conversion of content to ZIP format.
 
   Args:
     dst_dir: Destination directory
     dst: Destination file name
     div: Division object
     size: size of content
+    jobs: Number of files compressed at the same time
+    keep_sections: Put every section on a single zip file
+    nested: Top directories holding one section per subdirectory
+    level: Compression level of the files that are deflated
+    index: ContentIndex holding dst_dir, dst_dir is scanned if None
+
+  Returns:
+    List of (message, function, arguments) tuples writing the zip files,
+    to be passed to run_tasks
   """
   if not isdir(dst_dir):
     click.echo(
         "Error: No output for div %s. Have you run the bundle command?" % div)
-    return
+    return []
 
+  content = list_content(dst_dir, index)
+  tasks = []
   if size:
-    max_size = int(size)
-    parts = split(dst_dir, max_size)
+    parts = split(dst_dir, size, "zip", keep_sections, nested, content)
+    # the jobs are shared by the zip files written at the same time
+    part_jobs = max(1, jobs // len(parts)) if parts else 1
     for i, part in enumerate(parts):
-      click.echo(
-          "Packaging content in a zip file %d / %d" % (i+1, len(parts)))
-      to_zip(dst_dir, join(dst, "%s%d.zip" % (div, i+1)), False, filelist=part)
+      tasks.append((
+          "Packaging content in a zip file %d / %d" % (i+1, len(parts)),
+          to_zip, (dst_dir, join(dst, "%s%d.zip" % (div, i+1)), False, part,
+                   level, STORED_EXTENSIONS, part_jobs)))
   else:
     # convert to zip file
-    click.echo("Packaging content in a zip file..................")
-    to_zip(dst_dir, join(dst, "%s.zip" % div), False)
+    tasks.append(("Packaging content in a zip file..................",
+                  to_zip, (dst_dir, join(dst, "%s.zip" % div), False,
+                           [entry[0] for entry in content], level,
+                           STORED_EXTENSIONS, jobs)))
+  return tasks
 
 
-def makezip(size=None):
+def makezip(size=None, jobs=1, keep_sections=False, index=None):
   """Gets size of content then converts content to Zip format.
 
+  The volumes of every division are planned and printed before the first
+  zip file is written.
+
   Args:
     size: Size of the content to be converted
+    jobs: Number of files compressed at the same time
+    keep_sections: Put every section on a single zip file
+    index: ContentIndex of the destination directory, scanned if None
   """
   try:
     click.echo(
         "\nReading and verifying configuration file.....................")
-    result = readconfig(["division", "destination.main_path",
-                         "output_folder_name"], True)
-    division = result[0]
-    dst = result[1]
-    folder_name = result[2]
+    with PROFILER.stage("config_read", 1):
+      conf_data = readconfig(["division", "destination.main_path",
+                              "output_folder_name"])
+    division = conf_data["division"]
+    dst = conf_data["destination"]["main_path"]
+    folder_name = conf_data["output_folder_name"]
+    nested = nested_dirs(conf_data)
+    level = conf_data.get("zip_compression_level")
+    level = DEFAULT_LEVEL if level is None else min(9, max(0, int(level)))
   except:
     click.echo("Unable to read information from config.yaml."
                " Fix, then try again.")
     return
 
-  if not division:
-    # #convert to zip file and ISO
-    zip_maker(join(dst, folder_name), dst, folder_name, size)
-  else:
-    if not isdir(join(dst, "zip")):
-      copytree(join(dst, folder_name, "img"),
-               join(dst, "zip", "img"), symlinks=True)
-    for div in division:
-      dst_dir = join(dst, "goc", div)
-      zip_maker(dst_dir, join(dst, "zip"), div, size)
+  index = index or ContentIndex(dst).scan()
+  engine = Engine(jobs, processes=False)
+  try:
+    if not division:
+      # #convert to zip file and ISO
+      tasks = zip_maker(join(dst, folder_name), dst, folder_name, size,
+                        engine.jobs, keep_sections, nested, level, index)
+    else:
+      if not isdir(join(dst, "zip")):
+        copytree(join(dst, folder_name, "img"),
+                 join(dst, "zip", "img"), symlinks=True)
+      tasks = []
+      for div in division:
+        dst_dir = join(dst, "goc", div)
+        tasks.extend(zip_maker(dst_dir, join(dst, "zip"), div, size,
+                               engine.jobs, keep_sections, nested, level,
+                               index))
 
-    copy2(join(dst, folder_name, "index.html"), join(dst, "zip"))
+      copy2(join(dst, folder_name, "index.html"), join(dst, "zip"))
 
+    for handle in run_tasks(engine, tasks):
+      handle.get()
+  finally:
+    engine.close()
 
-def split(dst_dir, max_size):
-  """Checks the total size of content, then split content.
+
+def split(dst_dir, max_size, fmt, keep_sections=False, nested=(),
+          content=None, index=None):
+  """Plans how content is split into volumes, then prints the plan.
 
   Args:
     dst_dir: Destination directory
-    max_size: Maximum size of a split
+    max_size: Maximum size of a split in MB
+    fmt: Output format, "iso" or "zip"
+    keep_sections: Put every section on a single volume
+    nested: Top directories holding one section per subdirectory
+    content: Output of list_content for dst_dir, dst_dir is scanned if None
+    index: ContentIndex holding dst_dir, dst_dir is scanned if None
 
   Returns:
     List of splits
   """
-  parts = []
-  current_part = []
-  current_free = max_size
-
-  for srcpath, dirnames, filenames in walk(dst_dir):
-
-    for name in filenames:
-      src = join(srcpath, name)
-      info = stat(src)
-      size = 1.0 * info.st_size / 1024 / 1024
-
-      if current_free < size:
-        # create a new part
-        parts.append(current_part)
-        current_part = []
-        current_free = max_size
-
-      current_part.append(src)
-      current_free -= size
-
-    if not dirnames and not filenames:
-      current_part.append(srcpath)
-
-  parts.append(current_part)
-  return parts
+  volumes = plan_volumes(dst_dir, int(max_size) * MB, fmt, keep_sections,
+                         nested, content, index)
+  click.echo("Splitting %s into %d %s file(s):" % (dst_dir, len(volumes), fmt))
+  for i, volume in enumerate(volumes):
+    click.echo("  %d: %d files, %.1f MB" % (i + 1, len(volume.paths),
+                                            1.0 * volume.cost / MB))
+    if keep_sections:
+      click.echo("     " + ", ".join(sorted([item.key
+                                              for item in volume.items])))
+  return [volume.paths for volume in volumes]
@@ -24,9 +24,11 @@ from .bundle import compile_videos
 import click
 from .convert import makeiso
 from .convert import makezip
+from .convert import output_index
 from scripts.utils import check_platform
 from scripts.utils import generate_one_metadata
 from scripts.utils import generate_video_metadata
+from scripts.utils import PROFILER
 
 
 FORMAT = "[%(asctime)s] %(levelname)s: %(message)s"
@@ -42,16 +44,47 @@ def cli():
   pass
 
 
+def start_profile(command, path):
+  """Starts recording the stages of command if a report path is given.
+
+  Args:
+    command: Name of the command
+    path: Path of the JSON report, nothing is recorded if None
+  """
+  if path:
+    PROFILER.start(command)
+
+
+def finish_profile(path):
+  """Writes the JSON report and prints the time of each stage.
+
+  Args:
+    path: Path of the JSON report, nothing is written if None
+  """
+  if path:
+    PROFILER.stop()
+    PROFILER.save(path)
+    PROFILER.echo()
+    click.echo("Profile written to " + path)
+
+
 @click.command(help="Process files to an archive")
 @click.option("--size", "-s", help="Maximum size in (MB)")
 @click.option("--formt", "-f", help="Converts to (zip/iso/zipiso) format")
 @click.option("-v", "--verbose", is_flag=True, help="Enables verbose mode")
-def bundle(verbose, size=None, formt=None):
+@click.option("--force", is_flag=True,
+              help="Bundle every file again, ignoring the previous run")
+@click.option("--jobs", "-j", type=int, default=1,
+              help="Number of files processed in parallel")
+@click.option("--profile", type=click.Path(dir_okay=False),
+              help="Write the time spent in each stage to this JSON file")
+def bundle(verbose, size=None, formt=None, force=False, jobs=1, profile=None):
   """Bundle content.
 
   Bundle content from source directory specified
   in the config, process and save in destination
-  directory specified.
+  directory specified. Files that haven't changed since
+  the previous run are skipped unless force is set.
   """
   if verbose:
     console = logging.StreamHandler()
@@ -60,22 +93,33 @@ def bundle(verbose, size=None, formt=None):
     logging.getLogger("").addHandler(console)
 
   check_platform()
-  compile_sections()
+  start_profile("bundle", profile)
+  try:
+    compile_sections(force, jobs)
 
-  if formt and formt.lower() == "iso":
-    makeiso(size)
-  elif formt and formt.lower() == "zip":
-    makezip(size)
-  elif formt and formt.lower() == "zipiso":
-    makezip(size)
-    makeiso(size)
+    if formt and formt.lower() == "iso":
+      makeiso(size, jobs)
+    elif formt and formt.lower() == "zip":
+      makezip(size, jobs)
+    elif formt and formt.lower() == "zipiso":
+      makezip(size, jobs)
+      makeiso(size, jobs)
+  finally:
+    finish_profile(profile)
 
 
 @click.command(help="Bundle only video file(s)")
 @click.option("--size", "-s", help="Maximum size in (MB)")
 @click.option("--formt", "-f", help="Converts to (iso) format")
 @click.option("-v", "--verbose", is_flag=True, help="Enables verbose mode")
-def bundle_videos(verbose, size=None, formt=None):
+@click.option("--force", is_flag=True,
+              help="Bundle every file again, ignoring the previous run")
+@click.option("--jobs", "-j", type=int, default=1,
+              help="Number of files processed in parallel")
+@click.option("--profile", type=click.Path(dir_okay=False),
+              help="Write the time spent in each stage to this JSON file")
+def bundle_videos(verbose, size=None, formt=None, force=False, jobs=1,
+                  profile=None):
   """Bundle only video content.
 
   Bundle only video content from source directory specified
@@ -86,6 +130,9 @@ def bundle_videos(verbose, size=None, formt=None):
     verbose: Run in verbose mode
     size: size of ISO files to generate
     formt: ZIP or ISO format
+    force: Bundle every file again, ignoring the previous run
+    jobs: Number of files processed in parallel
+    profile: Path of the JSON report of the time spent in each stage
   """
   if verbose:
     console = logging.StreamHandler()
@@ -94,10 +141,14 @@ def bundle_videos(verbose, size=None, formt=None):
     logging.getLogger("").addHandler(console)
 
   check_platform()
-  compile_videos()
+  start_profile("bundle_videos", profile)
+  try:
+    compile_videos(force=force, jobs=jobs)
 
-  if formt and formt.lower() == "iso":
-    makeiso(size)
+    if formt and formt.lower() == "iso":
+      makeiso(size, jobs)
+  finally:
+    finish_profile(profile)
 
 
 @click.command(help="Generate title, author, and thumbnail for YouTube videos")
@@ -138,26 +189,43 @@ def log():
 @click.option("--size", "-s", help="Maximum size of storage medium in (MB)")
 @click.option("--formt", "-f", help=
               "Valid options are 'zip', 'iso', or 'zipiso'.", default="zipiso")
-def convert(formt, size=None):
+@click.option("--jobs", "-j", type=int, default=1,
+              help="Number of files written or compressed in parallel")
+@click.option("--keep-sections", is_flag=True,
+              help="Keep each section on a single file when splitting")
+@click.option("--profile", type=click.Path(dir_okay=False),
+              help="Write the time spent in each stage to this JSON file")
+def convert(formt, size=None, jobs=1, keep_sections=False, profile=None):
   """Convert bundled content to either Zip or ISO.
 
   Args:
     formt: the format of the resulting file can be "zip" or "iso"
     size: Maximum size of resulting file in MB
+    jobs: Number of files written or compressed in parallel
+    keep_sections: Keep each section on a single file when splitting
+    profile: Path of the JSON report of the time spent in each stage
   """
-  if formt.lower() == "iso":
-    makeiso(size)
-  elif formt.lower() == "zip":
-    makezip(size)
-  else:
-    makezip(size)
-    makeiso(size)
+  start_profile("convert", profile)
+  try:
+    if formt.lower() == "iso":
+      makeiso(size, jobs, keep_sections)
+    elif formt.lower() == "zip":
+      makezip(size, jobs, keep_sections)
+    else:
+      # both formats are made from a single scan of the output
+      index = output_index()
+      makezip(size, jobs, keep_sections, index)
+      makeiso(size, jobs, keep_sections, index)
+  finally:
+    finish_profile(profile)
 
 
 @click.command(help="Calculate the number of discs needed to copy"
                " content / memory needed")
 @click.option("--size", "-s", help="Maximum size in (MB)")
-def analyze(size=None):
+@click.option("--index", "from_index", is_flag=True,
+              help="Use the index of the sources saved by the last bundle")
+def analyze(size=None, from_index=False):
   """Analyze content.
 
   Analyze content. Gets information on the
@@ -165,8 +233,10 @@ def analyze(size=None):
 
   Args:
     size: Size of intended storage medium
+    from_index: Read the sources from the index saved by bundle instead of
+                scanning them
   """
-  analyze_content(size)
+  analyze_content(size, from_index)
 
 
 cli.add_command(bundle)
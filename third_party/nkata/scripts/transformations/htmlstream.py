@@ -0,0 +1,290 @@
+# Copyright 2015 The Offline Content Packager Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Streaming engine for HTML transformations.
+"""
+import re
+
+CHUNK_SIZE = 64 * 1024
+# characters searched for the </a> of an external link before the link is
+# left as it is
+MAX_LINK = 1024 * 1024
+
+# yielded in place of the tracking tag, which depends on the destination
+TRACKING = object()
+
+FLAGS = re.DOTALL | re.IGNORECASE
+
+
+def read_chunks(html_file, size=CHUNK_SIZE):
+  """Reads a file in chunks.
+
+  Args:
+    html_file: File object opened in text mode
+    size: Number of characters per chunk
+
+  Returns:
+    Iterator over the chunks
+  """
+  return iter(lambda: html_file.read(size), "")
+
+
+def write_pieces(pieces, out_file, tracking_tag, store=None):
+  """Writes the output of HtmlRewriter.rewrite.
+
+  Args:
+    pieces: Strings and TRACKING placeholders
+    out_file: File object the page is written to
+    tracking_tag: String written in place of TRACKING
+    store: Optional file object receiving the page without tracking tags
+  """
+  for piece in pieces:
+    if piece is TRACKING:
+      out_file.write(tracking_tag)
+      continue
+    out_file.write(piece)
+    if store:
+      store.write(piece)
+
+
+def join_pieces(pieces, tracking_tag):
+  """Joins the output of HtmlRewriter.rewrite into a string.
+
+  Args:
+    pieces: Strings and TRACKING placeholders
+    tracking_tag: String used in place of TRACKING
+
+  Returns:
+    Transformed html
+  """
+  return "".join([tracking_tag if piece is TRACKING else piece
+                  for piece in pieces])
+
+
+class HtmlRewriter(object):
+  """Rewrites external links and inserts the header in one pass.
+
+  The output is the same as rewriting every external link, then inserting
+  the header after every <body> tag, then marking every </body> tag, each
+  with a regular expression over the whole document, except that links
+  whose </a> is more than max_link characters away are left unchanged.
+  Only the current chunk and an external link waiting for its </a> are
+  kept in memory.
+  """
+
+  def __init__(self, link_color, header_html, max_link=MAX_LINK):
+    """Instance variables.
+
+    Args:
+      link_color: Color of external links, green if None
+      header_html: HTML inserted after <body>
+      max_link: Characters searched for the </a> of an external link
+    """
+    self.link_color = link_color or "green"
+    self.style_template = r"style='\1; color: %s'" % self.link_color
+    self.body_template = r"\1%s" % header_html
+    self.header_pieces = {}
+    self.max_link = max_link
+
+    # every alternative starts with "<", which lets the search skip text
+    self.scan_re = re.compile(
+        r"<(?:(?P<link>a(?P<attr>[^>]+href=['\"]https?://[^>]*)>)"
+        r"|(?P<body>body[^>]*>)|(?P<end>/body[^>]*>))", flags=FLAGS)
+    self.close_re = re.compile(r"</a\s*>", flags=FLAGS)
+    self.cut_close_re = re.compile(r"<(?:/(?:a\s*)?)?\Z", flags=FLAGS)
+    self.body_scan_re = re.compile(
+        r"<(?:(?P<body>body[^>]*>)|(?P<end>/body[^>]*>))", flags=FLAGS)
+    self.end_re = re.compile(r"<(?P<end>/body[^>]*>)", flags=FLAGS)
+    self.body_re = re.compile(r"(<body[^>]*>)", flags=FLAGS)
+    self.link_target_re = re.compile(r"target\s*=['\"].+?['\"]", flags=FLAGS)
+    self.link_style_re = re.compile(r"style\s*=['\"](.+?)['\"]", flags=FLAGS)
+
+  def __getstate__(self):
+    """Leaves out the pieces holding TRACKING, which isn't picklable.
+
+    Returns:
+      Dictionary of instance variables
+    """
+    state = dict(self.__dict__)
+    state["header_pieces"] = {}
+    return state
+
+  def rewrite(self, chunks, headers=True):
+    """Transforms html read in chunks.
+
+    Args:
+      chunks: Iterable over the html content
+      headers: Rewrite links and insert the header, only mark </body> tags
+               if False
+
+    Yields:
+      Transformed html, with TRACKING before every </body> tag
+    """
+    scan_re = self.scan_re if headers else self.end_re
+    chunks = iter(chunks)
+    buf = ""
+    pos = 0
+    eof = False
+    out = []
+    # no </a> starts between close_from and close_to in buf, so the search
+    # for the </a> of a link resumes where it stopped on the previous chunk
+    close_from = close_to = 0
+    while True:
+      match = scan_re.search(buf, pos)
+      close = None
+      if match is not None and match.lastgroup == "link":
+        if not close_from <= match.end() <= close_to:
+          close_from = close_to = match.end()
+        close = self.close_re.search(buf, close_to)
+        if close is not None and close.end() - match.start() > self.max_link:
+          close = None
+          close_to = close_from = len(buf)
+        elif close is None:
+          # only a </a> cut off at the end of buf can still start before it
+          last = buf.rfind("<", close_to)
+          if last == -1 or not self.cut_close_re.match(buf, last):
+            last = len(buf)
+          close_to = last
+
+      if match is None or (match.lastgroup == "link" and close is None and
+                           not eof and
+                           len(buf) - match.start() <= self.max_link):
+        if eof:
+          out.append(buf[pos:])
+          yield "".join(out)
+          return
+        # keep a tag or link that may still be cut off
+        cut = buf.find("<", max(pos, buf.rfind(">") + 1))
+        if cut == -1:
+          cut = len(buf)
+        if match is not None:
+          cut = min(cut, match.start())
+        out.append(buf[pos:cut])
+        yield "".join(out)
+        out = []
+        chunk = next(chunks, "")
+        eof = not chunk
+        buf = buf[cut:] + chunk
+        pos = 0
+        close_from = max(close_from - cut, 0)
+        close_to = max(close_to - cut, 0)
+        continue
+
+      start, end = match.span()
+      out.append(buf[pos:start])
+      kind = match.lastgroup
+
+      if kind == "link":
+        if close is None:
+          if eof:
+            # no </a> until the end, so no later link can match either
+            scan_re = self.body_scan_re
+          # too far away, or missing: the tag is left as it is
+          out.append(buf[start])
+          pos = start + 1
+          continue
+        end = close.end()
+        link = self._transform_link(buf[start:end], match.group("attr"))
+        if self.body_scan_re.search(link) is None:
+          out.append(link)
+        else:
+          for piece in self._mark(link, True):
+            if piece is TRACKING:
+              yield "".join(out)
+              out = []
+              yield TRACKING
+            else:
+              out.append(piece)
+
+      elif kind == "body":
+        for piece in self._insert_header(match.group()):
+          if piece is TRACKING:
+            yield "".join(out)
+            out = []
+            yield TRACKING
+          else:
+            out.append(piece)
+
+      else:
+        yield "".join(out)
+        out = [match.group()]
+        yield TRACKING
+      pos = end
+
+  def _transform_link(self, link, attr):
+    """Sets target and color of an external link.
+
+    Args:
+      link: Link from <a to </a>
+      attr: Attributes of the <a> tag
+
+    Returns:
+      Transformed link
+    """
+    attr_append = ""
+    attr_new = attr
+    lower = attr.lower()
+
+    # rewrite target attribute or add a new attribute
+    count = 0
+    if "target" in lower:
+      attr_new, count = self.link_target_re.subn("target='_blank'", attr_new)
+    if count == 0:
+      attr_append += " target='_blank' "
+
+    # append to style attribute or add a new attribute
+    count = 0
+    if "style" in lower:
+      attr_new, count = self.link_style_re.subn(self.style_template, attr_new)
+    if count == 0:
+      attr_append += " style='color: %s' " % self.link_color
+
+    return link.replace(attr, attr_new + attr_append)
+
+  def _insert_header(self, tag):
+    """Inserts the header after a <body> tag.
+
+    Args:
+      tag: <body> tag
+
+    Returns:
+      List of pieces of the tag and header
+    """
+    if tag not in self.header_pieces:
+      html = self.body_re.sub(self.body_template, tag)
+      self.header_pieces[tag] = list(self._mark(html, False))
+    return self.header_pieces[tag]
+
+  def _mark(self, html, headers):
+    """Transforms html that is already in memory.
+
+    Args:
+      html: html content
+      headers: Insert the header after <body> tags
+
+    Yields:
+      Transformed html, with TRACKING before every </body> tag
+    """
+    regex = self.body_scan_re if headers else self.end_re
+    pos = 0
+    for match in regex.finditer(html):
+      yield html[pos:match.start()]
+      if match.lastgroup == "body":
+        for piece in self._insert_header(match.group()):
+          yield piece
+      else:
+        yield TRACKING
+        yield match.group()
+      pos = match.end()
+    yield html[pos:]
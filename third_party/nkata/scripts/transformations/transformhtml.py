@@ -16,7 +16,7 @@
 """
 
 
-import re
+import hashlib
 import uuid
 
 try:
@@ -25,30 +25,45 @@ except ImportError:
   from urllib.parse import urlencode
 
 from bs4 import BeautifulSoup
+from .htmlstream import HtmlRewriter
+from .htmlstream import join_pieces
+from .htmlstream import read_chunks
+from .htmlstream import write_pieces
+
+# version of the transformed output, to be increased whenever a change to
+# the transformation changes its output, so stored pages are not reused
+TRANSFORM_VERSION = 1
 
 
 class HtmlTransformation(object):
   """Copy HTML files and insert information header and a tracking code.
   """
+  # transformation is run on the process pool when bundling in parallel
+  cpu_bound = True
+  # stage of the profile the transformed files count towards
+  stage = "html_transform"
 
   def __init__(self, **kwargs):
     """Instance varaibles.
 
     Args:
       **kwargs: Keyword arguments (color:external link color ,
-              link:online link, code:tracking code)
+              link:online link, code:tracking code,
+              cache:optional BundleCache for transformed content)
     """
     self.link_color = kwargs["color"]
     self.online_link = kwargs["link"]
     self.tracking_code = kwargs["code"]
+    self.cache = kwargs.get("cache")
 
     self.header_html = str(self._create_header())
+    self.rewriter = HtmlRewriter(self.link_color, self.header_html)
 
-    flags = re.DOTALL | re.IGNORECASE
-    self.link_re = re.compile(r'<a([^>]+href=[\'"]https?://.*?)>.*?</a\s*>',
-                              flags=flags)
-    self.link_target_re = re.compile(r"target\s*=['\"].+?['\"]", flags=flags)
-    self.link_style_re = re.compile(r"style\s*=['\"](.+?)['\"]", flags=flags)
+    # parameters shared by the tracking tags of every page
+    self.tracking_params = urlencode([
+        ("v", "1"), ("t", "pageview"), ("ec", "page"), ("ea", "open"),
+        ("cm", "site"), ("cs", "offlinedevsite"), ("cn", "OfflineDevContent"),
+        ("tid", self.tracking_code)])
 
   def _create_tracking_tag(self, dst):
     """Creates tracking tag('<img src="tracking_img_src">').
@@ -62,16 +77,11 @@ class HtmlTransformation(object):
     if not self.tracking_code:
       return None
 
-    img_url_attr = {"v": "1", "t": "pageview", "ec": "page",
-                    "ea": "open", "cm": "site"}
-    img_url_attr["cs"] = "offlinedevsite"
-    img_url_attr["cn"] = "OfflineDevContent"
-    img_url_attr["tid"] = self.tracking_code
-    img_url_attr["dp"] = dst
-    img_url_attr["cid"] = str(int(uuid.uuid1().int>>96)) + "." + str(
+    cid = str(int(uuid.uuid1().int>>96)) + "." + str(
         int(uuid.uuid1().int>>96))
     img_src = ("http://www.google-analytics.com/collect?" +
-               urlencode(img_url_attr))
+               self.tracking_params + "&" +
+               urlencode([("dp", dst), ("cid", cid)]))
 
     tracking_img_tag = '<img src="' + img_src + '">'
     return tracking_img_tag
@@ -103,6 +113,17 @@ class HtmlTransformation(object):
     """
     return src.endswith(".html")
 
+  def cache_key(self):
+    """Parameters that the transformed output depends on.
+
+    Returns:
+      String identifying the transformation version, link color, tracking
+      code, online link and header
+    """
+    header = hashlib.sha1(self.header_html.encode("utf-8")).hexdigest()
+    return "|".join(["v%d" % TRANSFORM_VERSION, str(self.link_color),
+                     str(self.tracking_code), str(self.online_link), header])
+
   def apply(self, src, dst, finaldst, metadata, video):
     """Apply transformation.
 
@@ -114,10 +135,31 @@ class HtmlTransformation(object):
       video: Path to video file
     """
     video_data = finaldst, metadata, video
-    html = open(src, "r").read()
-    html = self.transform(html, dst) or html
+    tracking_tag = str(self._create_tracking_tag(dst))
+    stored = None
+    if self.cache:
+      key = self.cache.key(src, self.cache_key())
+      stored = self.cache.reader(key)
+
     with open(dst, "w") as out_file:
-      out_file.write(html)
+      if stored:
+        # links and header are already done, only add the tracking tag
+        with stored:
+          pieces = self.rewriter.rewrite(read_chunks(stored), headers=False)
+          write_pieces(pieces, out_file, tracking_tag)
+        return
+
+      store = self.cache.writer(key) if self.cache else None
+      try:
+        with open(src, "r") as src_file:
+          pieces = self.rewriter.rewrite(read_chunks(src_file))
+          write_pieces(pieces, out_file, tracking_tag, store)
+      except:
+        if store:
+          store.abort()
+        raise
+      if store:
+        store.commit()
 
   def transform(self, html, dst):
     """Transform method.
@@ -125,46 +167,9 @@ class HtmlTransformation(object):
     Args:
       html: BeautifulSoup html object
       dst: Path to output destination
-    """
-    # change link color and target
-    l_color = self.link_color or "green"
-
-    def transform_link(value):
-      """Transforms link.
-
-      Args:
-        value: value
 
-      Returns:
-        Transformed link
-      """
-      attr_append = ""
-      link, attr = value.group(0), value.group(1)
-
-      attr_new = attr
-
-      # rewrite target attribute or add a new attribute
-      attr_new, count = re.subn(
-          self.link_target_re, "target='_blank'", attr_new)
-      if count == 0:
-        attr_append += " target='_blank' "
-
-      # append to style attribute or add a new attribute
-      attr_new, count = re.subn(
-          self.link_style_re, r"style='\1; color: %s'" % l_color, attr_new)
-      if count == 0:
-        attr_append += " style='color: %s' " % l_color
-
-      return link.replace(attr, attr_new + attr_append)
-
-    # find all external links, process them with transform_link
-    html = re.sub(self.link_re, transform_link, html)
-
-    # add tracking script and header to page top
-    flags = re.DOTALL | re.IGNORECASE
-    html = re.sub(r"(<body[^>]*>)",
-                  r"\1%s" % self.header_html, html, flags=flags)
+    Returns:
+      Transformed html
+    """
     tracking_tag = str(self._create_tracking_tag(dst))
-    html = re.sub(r"(</body[^>]*>)", r"%s\1" % tracking_tag, html, flags=flags)
-
-    return html
+    return join_pieces(self.rewriter.rewrite([html]), tracking_tag)
@@ -14,38 +14,49 @@
 
 """VideoTransformation script.
 """
+import errno
 import logging
 from os import makedirs
 from os.path import basename
 from os.path import dirname
-from os.path import exists
+from os.path import isdir
 from os.path import isfile
 from os.path import join
 from os.path import split
 from os.path import splitext
-import shutil
 
 import click
 from scripts.utils.downloader import download_image
-import yaml
+from scripts.utils.fileutil import copy_file
+from scripts.utils.index import load_yaml
+from scripts.utils.profiler import PROFILER
 
 
 class VideoTransformation(object):
   """Copys video files and transform them.
   """
+  # stage of the profile the videos count towards
+  stage = "media_copy"
 
-  def __init__(self, tracking_code, jinjaenv):
+  def __init__(self, tracking_code, jinjaenv, cache=None, placer=None,
+               fetcher=None, index=None):
     """Instance varaibles.
 
     Args:
       tracking_code: Analtics tracking code
       jinjaenv: Jinja environment variable
+      cache: BundleCache used to skip videos that are already bundled
+      placer: Placer linking or copying the videos
+      fetcher: Fetcher downloading the thumbnails
+      index: ContentIndex remembering the parsed metadata files
 
     """
     self.tracking_code = tracking_code
     self.jinjaenv = jinjaenv
-    self.list_of_videos = list()
-    self.new_list = list()
+    self.cache = cache
+    self.placer = placer
+    self.fetcher = fetcher
+    self.index = index
   EXTENSIONS = [".webm", ".mkv", ".flv" ".vob" ".ogv", ".drc", ".mng", ".avi",
                 ".mov", ".qt", ".wmv", ".yuv", ".rm", ".rmvb", ".mp4", ".m4v",
                 ".asf", ".mpg", ".mpeg", ".m2v", ".svi", ".3gp", ".3g2", ".mxf",
@@ -64,6 +75,17 @@ class VideoTransformation(object):
     _, extension = splitext(src)
     return extension in self.EXTENSIONS
 
+  def cache_key(self):  # pylint: disable=no-self-use
+    """Parameters that the transformed output depends on.
+
+    The video pages and list are generated on every run, so the
+    transformation itself is never skipped; the copy is.
+
+    Returns:
+      None
+    """
+    return None
+
   def apply(self, itemsrc, itemdst, finaldst, metadata, videos_src):
     """Transform each video.
 
@@ -73,6 +95,10 @@ class VideoTransformation(object):
       finaldst: Final file path to write video to
       metadata: Video metadata
       videos_src: Path to Videos folder
+
+    Returns:
+      Tuple of the name of the directory holding the video and its entry in
+      the videos list, to be passed to list_videos
     """
     finaldst_dir, finaldst_name = dirname(finaldst), basename(finaldst)
     video_name, extension = splitext(finaldst_name)
@@ -87,20 +113,21 @@ class VideoTransformation(object):
       back = "../../index.html"
       data_file = join(itemsrc_base, "metadata", video_name + "_metadata.yaml")
       try:
-        with open(data_file) as data_file:
-          conf_data = yaml.load(data_file)
-          title = conf_data["title"]
-          sub_title = conf_data["sub_title"]
-          description = conf_data["description"]
-          thumbnail_url = conf_data["thumbnail_url"]
-          if thumbnail_url:
-            image = download_image(thumbnail_url, finaldst_base, video_name)
-            if image:
-              image_path = join(finaldst_base_path, "images", image)
-            else:
-              image_path = ""
+        conf_data = load_yaml(data_file, self.index)
+        title = conf_data["title"]
+        sub_title = conf_data["sub_title"]
+        description = conf_data["description"]
+        thumbnail_url = conf_data["thumbnail_url"]
+        if thumbnail_url:
+          image = download_image(thumbnail_url, finaldst_base, video_name,
+                                 self.fetcher)
+          if image:
+            self._record(join(finaldst_base, "images", image), itemsrc)
+            image_path = join(finaldst_base_path, "images", image)
           else:
             image_path = ""
+        else:
+          image_path = ""
       except:
         title, sub_title, description, image_path = video_name, "", "", ""
 
@@ -111,8 +138,10 @@ class VideoTransformation(object):
         title, sub_title, description, thumbnail_url = self.process_meta_data(
             video_name, metadata)
         if thumbnail_url:
-          image = download_image(thumbnail_url, finaldst_base, video_name)
+          image = download_image(thumbnail_url, finaldst_base, video_name,
+                                 self.fetcher)
           if image:
+            self._record(join(finaldst_base, "images", image), itemsrc)
             image_path = join(".", "images", image)
           else:
             image_path = ""
@@ -127,22 +156,39 @@ class VideoTransformation(object):
     if len(title) > 50:
       title = title[0:45] + "..."
 
-    if finaldst_base_path in self.new_list:
-      self.list_of_videos.append((video_name, video_source_path, title,
-                                  sub_title, image_path, None))
-    else:
-      self.new_list.append(finaldst_base_path)
-      self.list_of_videos.append(("", "", "", "", "", finaldst_base_path))
-      kwargs = (video_name, video_source_path, title, sub_title, image_path,
-                None)
-      self.list_of_videos.append(kwargs)
-
     # generate html page for video
     video_detail = (video_name, video_source, video_type, video_info)
     self.generate_html(finaldst_dir, html_name, video_detail, back)
+    self._record(join(finaldst_dir, "html_files", html_name), itemsrc)
 
     # copy videos
-    shutil.copy2(itemsrc, itemdst)
+    copy_file(itemsrc, itemdst, self.cache, self.placer)
+
+    return finaldst_base_path, (video_name, video_source_path, title,
+                                sub_title, image_path, None)
+
+  def _record(self, dst, src):
+    """Lists a generated page or thumbnail in the manifest, if any."""
+    if self.cache:
+      self.cache.record_generated(dst, src)
+
+  def list_videos(self, results):  # pylint: disable=no-self-use
+    """Builds the videos list of a section.
+
+    Args:
+      results: Values returned by apply for each video, in walk order
+
+    Returns:
+      List of videos, each directory starts with a heading entry
+    """
+    list_of_videos = list()
+    directories = set()
+    for finaldst_base_path, video in results:
+      if finaldst_base_path not in directories:
+        directories.add(finaldst_base_path)
+        list_of_videos.append(("", "", "", "", "", finaldst_base_path))
+      list_of_videos.append(video)
+    return list_of_videos
 
   def process_meta_data(self, video_name, metadata):  # pylint: disable=no-self-use
     """Process metadata to return values in metadata.
@@ -159,8 +205,7 @@ class VideoTransformation(object):
       data_file = metadata[video_name]
 
       try:
-        with open(data_file) as data_file:
-          conf_data = yaml.load(data_file)
+        conf_data = load_yaml(data_file, self.index)
       except:
         click.echo("\nOops!  There is no metadata for " + video_name +
                    ".  Try again...")
@@ -191,8 +236,11 @@ class VideoTransformation(object):
       back: Indicates whether to show back navigation link
     """
     video_name, video_source, video_type, video_info = video_detail
-    if not exists(join(dst_path, "html_files")):
+    try:
       makedirs(join(dst_path, "html_files"))
+    except OSError as e:
+      if e.errno != errno.EEXIST:
+        raise
 
     write_file = open(join(dst_path, "html_files", html_name), "w")
     template_values = {
@@ -206,43 +254,45 @@ class VideoTransformation(object):
         "back": back
     }
 
-    template = self.jinjaenv.get_template("templates/video.html")
-    write_file.write(template.render(template_values))
+    with PROFILER.stage("template_render", 1):
+      template = self.jinjaenv.get_template("templates/video.html")
+      write_file.write(template.render(template_values))
 
-  def generate_video_list_html(self, dst_dir, video_subtitle,
+  def generate_video_list_html(self, dst_dir, list_of_videos, video_subtitle,
                                video_summary, path_to, template_pth=None):
     """Generate homepage for video sections.
 
     Generates homepage for each video sections, and list all videos
-    in html file.
+    in html file. The page is written even when the section has no videos
+    left, so it doesn't keep listing deleted ones.
 
     Args:
       dst_dir: Directory to write file to
+      list_of_videos: Videos of the section, as returned by list_videos
       video_subtitle: Name of the video
       video_summary: Text describing the video
       path_to: Determines if to display "Back To Home" link
       template_pth: Path to template
 
     """
-    # if no videos, skip this
-    if not self.list_of_videos:
-      return
-
+    if not isdir(dst_dir):
+      makedirs(dst_dir)
     write_file = open(join(dst_dir, "index.html"), "w")
     template_values = {
         "video_summary": video_summary,
         "video_subtitle": video_subtitle,
         "tracking_code": self.tracking_code,
-        "list": self.list_of_videos,
+        "list": list_of_videos,
         "division_back": path_to
     }
-    if template_pth:
-      template = self.jinjaenv.get_template(template_pth)
+    with PROFILER.stage("template_render", 1):
+      if template_pth:
+        template = self.jinjaenv.get_template(template_pth)
+        write_file.write(template.render(template_values))
+      else:
+        template = self.jinjaenv.get_template("templates/videos_list.html")
       write_file.write(template.render(template_values))
-    else:
-      template = self.jinjaenv.get_template("templates/videos_list.html")
-    write_file.write(template.render(template_values))
-    self.list_of_videos[:] = []
+    self._record(join(dst_dir, "index.html"), None)
 
   def splitpath(self, path, maxdepth=20):
     """Splits path.
@@ -15,62 +15,61 @@
 """ISO converter script.
 """
 import logging
-from os import link
-from os import makedirs
-from os import system
+from os import rename
 from os import unlink
-from os.path import dirname
-from os.path import isdir
+from os.path import basename
+from os.path import getsize
 from os.path import isfile
-from os.path import join
-from sys import platform
-from tempfile import mkdtemp
+from os.path import splitext
+import time
 
 import click
+from .iso9660 import write_iso
+from .profiler import PROFILER
 
 
-def to_iso(source, destination, filelist=None):
+def to_iso(source, destination, filelist=None, index=None):
   """ISO converter utility.
 
-  Convert contents to ISO format checking the systems platform where the tool
-  is being run.
+  Writes an ISO 9660 image with Rock Ridge and Joliet names of the content,
+  streaming the files from source into the image.
 
   Args:
     source: path to directory with content to be converted
     destination: path to destination where the ISO file is written
-    filelist: TBD
-  """
-  # overwrite existing ISO file
-  if isfile(destination):
-    unlink(destination)
-
-  if filelist:
-    # create tmp dir
-    tmpdir = mkdtemp()
-    for item in filelist:
-      rel = item[len(source)+1:]
-      dst = join(tmpdir, rel)
-
-      if not isdir(dirname(dst)):
-        makedirs(dirname(dst))
+    filelist: files and empty directories under source to include, all of
+              source if None
+    index: ContentIndex holding source, the files are stated if None
 
-      if not isdir(item):
-        link(item, dst)
-
-    source = tmpdir
+  Returns:
+    True if the image was written
+  """
+  tmp_path = destination + ".part"
+  start = time.time()
+  try:
+    volume_id = splitext(basename(destination))[0]
+    renamed = write_iso(source, tmp_path, filelist, volume_id, index)
+    # overwrite existing ISO file
+    if isfile(destination):
+      unlink(destination)
+    rename(tmp_path, destination)
+    PROFILER.add("iso_build", time.time() - start,
+                 len(filelist) if filelist else 0, getsize(destination))
+  except (IOError, OSError) as e:
+    message = "Unable to write " + destination + ": " + str(e)
+    click.echo(click.style(message, fg="red"))
+    logging.error(message)
+    if isfile(tmp_path):
+      unlink(tmp_path)
+    return False
 
-  if platform.startswith("darwin"):
-    system("hdiutil makehybrid -iso -joliet -o %s %s"%(destination, source))
-    click.echo("Finished!")
-  elif platform.startswith("linux"):
-    system("mkisofs -r -J -o %s %s"%(destination, source))
-    click.echo("Finished!")
-  else:
-    click.echo(platform + (" not supported for converting to ISO files."
-                           "Try to download ISO maker tool from "
-                           "'http://www.magiciso.com/tutorials/"
-                           "miso-iso-creator.htm'"))
-    logging.debug(platform + (" not supported for converting to ISO files."
-                              "Try to download ISO maker tool from "
-                              "'http://www.magiciso.com/tutorials/"
-                              "miso-iso-creator.htm'"))
+  if renamed:
+    message = ("%d names were changed in the Joliet names of " % len(renamed)
+               + destination + ", links to them only work with Rock Ridge:")
+    click.echo(click.style(message, fg="red"))
+    logging.warning(message)
+    for path, name in renamed:
+      click.echo(click.style("  " + path + " -> " + name, fg="red"))
+      logging.warning(path + " is named " + name + " in " + destination)
+  click.echo("Finished!")
+  return True
@@ -12,16 +12,28 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from .cache import BundleCache
+from .cache import STORE_DIR
 from .check_platform import check_platform
 from .content import bundle_content_section
 from .content import bundle_video_section
 from .content import get_divisions
 from .content import get_sections
+from .content import wait_for_section
 from .downloader import download_image
+from .engine import Engine
+from .fetcher import Fetcher
 from .fileutil import copy_files
 from .fileutil import copy_with_transformations
 from .generator import generate_one_metadata
 from .generator import generate_video_metadata
+from .index import ContentIndex
+from .index import INDEX_FILE
+from .index import load_yaml
 from .ISOconverter import to_iso
+from .packing import MB
+from .packing import plan_volumes
+from .placement import create_placer
+from .profiler import PROFILER
 from .progressbar import ProgressBar
 from .zipper import to_zip
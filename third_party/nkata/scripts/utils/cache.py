@@ -0,0 +1,396 @@
+# Copyright 2015 The Offline Content Packager Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Bundle manifest and content-addressed transformation cache.
+"""
+import errno
+import hashlib
+import json
+import logging
+from os import fdopen
+from os import listdir
+from os import makedirs
+from os import rename
+from os import rmdir
+from os import stat
+from os import unlink
+from os.path import dirname
+from os.path import isdir
+from os.path import isfile
+from os.path import islink
+from os.path import join
+from os.path import realpath
+from os.path import relpath
+from os.path import sep
+import shutil
+import tempfile
+
+CACHE_DIR = ".nkata"
+# default directory of the transformed content, next to config.yaml
+STORE_DIR = ".nkata-store"
+MANIFEST_VERSION = 1
+
+
+class BundleCache(object):
+  """Keeps track of bundled files between runs.
+
+  The manifest maps every file written to the destination tree to the
+  source it was built from, the source size and modification time, and the
+  transformation parameters used. Transformed content is stored in a
+  content-addressed store keyed by source content plus parameters, so that
+  a section listed under several divisions is only transformed once. The
+  store is kept outside the destination tree, so it isn't packed or
+  scanned with the output.
+  """
+
+  def __init__(self, dst_dir, force=False, index=None, store_dir=STORE_DIR):
+    """Instance variables.
+
+    Args:
+      dst_dir: Destination directory, the manifest is stored under it
+      force: Rebuild every file checked during this run, without reusing
+             stored content; the entries of the other files are kept
+      index: ContentIndex of the sources, sources are stated if None
+      store_dir: Directory of the transformed content
+    """
+    self.root = dst_dir
+    self.index = index
+    self.force = force
+    self.cache_dir = join(dst_dir, CACHE_DIR)
+    self.manifest_path = join(self.cache_dir, "manifest.json")
+    self.store_dir = store_dir
+    self.entries = self._load()
+    self.seen = set()
+    self.digests = {}
+
+  def __getstate__(self):
+    """Leaves the manifest out when the cache is sent to a worker process.
+
+    Workers only use the content store; the manifest is kept up to date
+    by the process that owns it.
+
+    Returns:
+      Dictionary of instance variables
+    """
+    state = dict(self.__dict__)
+    state["index"] = None
+    state["entries"] = {}
+    state["seen"] = set()
+    state["digests"] = {}
+    return state
+
+  def _load(self):
+    """Reads the manifest from the previous run.
+
+    Returns:
+      Dictionary of manifest entries keyed by destination path
+    """
+    if not isfile(self.manifest_path):
+      return {}
+    try:
+      with open(self.manifest_path) as data_file:
+        manifest = json.load(data_file)
+    except ValueError:
+      logging.warning("Ignoring unreadable manifest " + self.manifest_path)
+      return {}
+    if manifest.get("version") != MANIFEST_VERSION:
+      return {}
+    return manifest["files"]
+
+  def _relpath(self, dst):
+    """Path of dst relative to the destination directory."""
+    return relpath(dst, self.root)
+
+  def _stat(self, src):
+    """Gets the (size, mtime) of a source file, from the index if it can."""
+    info = self.index.stat(src) if self.index else None
+    if info is None:
+      info = stat(src)
+      info = (info.st_size, info.st_mtime)
+    return info
+
+  def digest(self, src):
+    """Gets the content digest of a source file.
+
+    Digests are remembered for the run and reused from the manifest while
+    the source size and modification time do not change.
+
+    Args:
+      src: Path to source file
+
+    Returns:
+      Hex digest of the file content
+    """
+    info = self._stat(src)
+    known = self.digests.get(src)
+    if known and known[:2] == info:
+      return known[2]
+
+    sha = hashlib.sha1()
+    with open(src, "rb") as src_file:
+      for block in iter(lambda: src_file.read(1024 * 1024), b""):
+        sha.update(block)
+
+    self.digests[src] = info + (sha.hexdigest(),)
+    return self.digests[src][2]
+
+  def key(self, src, params):
+    """Cache key for src transformed with params.
+
+    Args:
+      src: Path to source file
+      params: String describing the transformation parameters
+
+    Returns:
+      Hex digest identifying the transformed content
+    """
+    return _make_key(self.digest(src), params)
+
+  def is_current(self, src, dst, params):
+    """Checks whether dst is up to date with src and params.
+
+    Args:
+      src: Path to source file
+      dst: Path to bundled file
+      params: Transformation parameters, None if the output can't be reused
+
+    Returns:
+      True if dst doesn't need to be written again
+    """
+    rel = self._relpath(dst)
+    self.seen.add(rel)
+    entry = self.entries.get(rel)
+    if self.force or params is None or not entry or not isfile(dst):
+      return False
+    if entry["src"] != src or entry["params"] != params:
+      return False
+
+    if (entry["size"], entry["mtime"]) == self._stat(src):
+      return True
+
+    # touched but possibly unchanged, compare content
+    if entry.get("digest") and entry["digest"] == self.digest(src):
+      self.record(src, dst, params, entry["digest"])
+      return True
+    return False
+
+  def record(self, src, dst, params, digest=None):
+    """Adds dst to the manifest.
+
+    Args:
+      src: Path to source file
+      dst: Path to bundled file
+      params: Transformation parameters used to build dst
+      digest: Content digest of src, if known
+    """
+    info = self._stat(src)
+    if digest is None and src in self.digests:
+      size, mtime, value = self.digests[src]
+      if (size, mtime) == info:
+        digest = value
+
+    rel = self._relpath(dst)
+    self.seen.add(rel)
+    self.entries[rel] = {
+        "src": src,
+        "size": info[0],
+        "mtime": info[1],
+        "params": params,
+        "digest": digest
+    }
+
+  def record_generated(self, dst, src=None):
+    """Adds a page or image generated during this run to the manifest.
+
+    Generated files are written on every run, so their entries are never
+    current; they are listed so that prune removes them once they are no
+    longer generated.
+
+    Args:
+      dst: Path to the generated file
+      src: Path to the video or config file it was generated from, if any
+    """
+    rel = self._relpath(dst)
+    self.seen.add(rel)
+    self.entries[rel] = {
+        "src": src,
+        "size": 0,
+        "mtime": 0,
+        "params": None,
+        "digest": None
+    }
+
+  def _store_path(self, key):
+    """Path to the stored content for key."""
+    return join(self.store_dir, key[:2], key)
+
+  def get(self, key):
+    """Gets transformed content from the store.
+
+    Args:
+      key: Cache key
+
+    Returns:
+      Stored content or None if key is not in the store
+    """
+    stored = self.reader(key)
+    if stored is None:
+      return None
+    with stored:
+      return stored.read()
+
+  def put(self, key, data):
+    """Adds transformed content to the store.
+
+    Args:
+      key: Cache key
+      data: Transformed content
+    """
+    store = self.writer(key)
+    store.write(data)
+    store.commit()
+
+  def reader(self, key):
+    """Opens transformed content in the store.
+
+    Args:
+      key: Cache key
+
+    Returns:
+      File object to read the content from, None if key is not in the store
+      or every file is rebuilt
+    """
+    path = self._store_path(key)
+    if self.force or not isfile(path):
+      return None
+    return open(path)
+
+  def writer(self, key):
+    """Starts adding transformed content to the store.
+
+    The content becomes visible once commit() is called on the returned
+    StoreWriter.
+
+    Args:
+      key: Cache key
+
+    Returns:
+      StoreWriter for the content
+    """
+    bucket = join(self.store_dir, key[:2])
+    try:
+      makedirs(bucket)
+    except OSError as e:
+      if e.errno != errno.EEXIST:
+        raise
+    return StoreWriter(bucket, self._store_path(key))
+
+  def prune(self, dst_dir):
+    """Removes bundled files whose source no longer exists.
+
+    Only files under dst_dir that were not written or checked during this
+    run are removed, along with the directories they leave empty.
+
+    Args:
+      dst_dir: Destination directory that was just bundled
+    """
+    prefix = self._relpath(dst_dir)
+    for rel in sorted(self.entries):
+      if rel in self.seen:
+        continue
+      if prefix != "." and rel != prefix and not rel.startswith(prefix + sep):
+        continue
+      path = join(self.root, rel)
+      if isfile(path) or islink(path):
+        logging.info("Removing " + path + ", source no longer exists.")
+        unlink(path)
+        remove_empty_dirs(dirname(path), dst_dir)
+      del self.entries[rel]
+
+  def save(self):
+    """Writes the manifest and drops unreferenced stored content."""
+    if not isdir(self.cache_dir):
+      makedirs(self.cache_dir)
+    manifest = {"version": MANIFEST_VERSION, "files": self.entries}
+    with open(self.manifest_path + ".tmp", "w") as data_file:
+      json.dump(manifest, data_file, indent=1, sort_keys=True)
+    rename(self.manifest_path + ".tmp", self.manifest_path)
+
+    # store of the previous versions, inside the destination tree
+    old_store = join(self.cache_dir, "store")
+    if isdir(old_store) and realpath(old_store) != realpath(self.store_dir):
+      shutil.rmtree(old_store)
+
+    if not isdir(self.store_dir):
+      return
+    live = set()
+    for entry in self.entries.values():
+      if entry["params"] and entry["digest"]:
+        live.add(_make_key(entry["digest"], entry["params"]))
+    for bucket in listdir(self.store_dir):
+      for key in listdir(join(self.store_dir, bucket)):
+        if key not in live:
+          unlink(join(self.store_dir, bucket, key))
+
+
+class StoreWriter(object):
+  """Writes content to a temporary file renamed into the store."""
+
+  def __init__(self, bucket, path):
+    """Instance variables.
+
+    Args:
+      bucket: Store directory the temporary file is created in
+      path: Final path of the content
+    """
+    self.path = path
+    handle, self.tmp_path = tempfile.mkstemp(dir=bucket, prefix=".tmp")
+    self.tmp_file = fdopen(handle, "w")
+
+  def write(self, data):
+    """Writes part of the content."""
+    self.tmp_file.write(data)
+
+  def commit(self):
+    """Adds the written content to the store."""
+    self.tmp_file.close()
+    rename(self.tmp_path, self.path)
+
+  def abort(self):
+    """Drops the written content, leaving the store as it was."""
+    self.tmp_file.close()
+    unlink(self.tmp_path)
+
+
+def remove_empty_dirs(path, top):
+  """Removes path and its parents while they are empty, up to top.
+
+  Args:
+    path: Directory a file was removed from
+    top: Directory that is kept even if it is empty
+  """
+  top = relpath(top)
+  while relpath(path) != top and not relpath(path, top).startswith(".."):
+    try:
+      rmdir(path)
+    except OSError:
+      return
+    path = dirname(path)
+
+
+def _make_key(digest, params):
+  """Combines a content digest and transformation parameters."""
+  sha = hashlib.sha1(digest.encode("ascii"))
+  sha.update(params.encode("utf-8"))
+  return sha.hexdigest()
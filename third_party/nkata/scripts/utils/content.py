@@ -20,13 +20,14 @@ from os.path import join
 
 import click
 from scripts.transformations import HtmlTransformation
-from scripts.utils.fileutil import copy_files
+from scripts.utils.fileutil import submit_files
 
 
-def bundle_content_section(src_path, dst_path, section, config, online_link):
+def bundle_content_section(src_path, dst_path, section, config, online_link,
+                           cache=None, engine=None, placer=None, index=None):
   """Bundles content.
 
-  Calls copy_files method after setting necessary
+  Calls submit_files method after setting necessary
   parameters in HtmlTransformation
 
   Args:
@@ -35,6 +36,13 @@ def bundle_content_section(src_path, dst_path, section, config, online_link):
     section: Section to be bundled
     config: Dictionary containing configuration parameters
     online_link: URL to content online
+    cache: BundleCache shared between sections
+    engine: Engine running the copies
+    placer: Placer used for files that are not transformed
+    index: ContentIndex of the sources
+
+  Returns:
+    CopyJob to pass to wait_for_section
   """
   # Initialising a list of transformations
   logging.info("Start bundling files from " + section + ".")
@@ -45,18 +53,18 @@ def bundle_content_section(src_path, dst_path, section, config, online_link):
   link_color = config["link_color"]
   tracking_code = config["tracking_code"]
   html_transform = HtmlTransformation(color=link_color, code=tracking_code,
-                                      link=online_link)
+                                      link=online_link, cache=cache)
   transformations.append(html_transform)
   paths = (src_path, dst_path)
-  copy_files(paths, section, transformations)
-  click.echo("\n")
-  logging.info("Finish bundling files from " + section + ".")
+  return submit_files(paths, section, transformations, cache=cache,
+                      engine=engine, placer=placer, index=index)
 
 
-def bundle_video_section(paths, vid, metadata, transformations, videos_src):
+def bundle_video_section(paths, vid, metadata, transformations, videos_src,
+                         cache=None, engine=None, placer=None, index=None):
   """Bundles videos.
 
-  Calls copy_files method after setting necessary
+  Calls submit_files method after setting necessary
   parameters in HtmlTransformation for videos only.
 
   Args:
@@ -65,12 +73,33 @@ def bundle_video_section(paths, vid, metadata, transformations, videos_src):
     metadata: Video metadata
     transformations: Transformation object
     videos_src: Path to video source directory
+    cache: BundleCache shared between sections
+    engine: Engine running the copies
+    placer: Placer used for files that are not transformed
+    index: ContentIndex of the sources
+
+  Returns:
+    CopyJob to pass to wait_for_section
   """
 
   logging.info("Start bundling videos from " + vid + ".")
-  copy_files(paths, vid, transformations, metadata, videos_src)
+  return submit_files(paths, vid, transformations, metadata, videos_src,
+                      cache, engine, placer, index)
+
+
+def wait_for_section(job):
+  """Waits until every file of a submitted section is bundled.
+
+  Args:
+    job: CopyJob returned by bundle_content_section or bundle_video_section
+
+  Returns:
+    List of the results returned by the transformations, in walk order
+  """
+  results = job.wait()
   click.echo("\n")
-  logging.info("Finish bundling videos from " + vid + ".")
+  logging.info("Finish bundling files from " + job.section + ".")
+  return results
 
 
 def get_divisions(division, ignored_sections):
@@ -110,12 +139,13 @@ def get_divisions(division, ignored_sections):
            for item in division if not is_content_division(item)])
 
 
-def get_sections(src_dir, ignored_paths):
+def get_sections(src_dir, ignored_paths, index=None):
   """Gets section in a list after removing the ignored_paths.
 
   Args:
     src_dir: Source directory for content
     ignored_paths: Paths to content to be ignored
+    index: ContentIndex of the sources, src_dir is listed if None
 
   Returns:
     List of sections to be processed
@@ -140,4 +170,5 @@ def get_sections(src_dir, ignored_paths):
 
     return True
 
-  return [item for item in listdir(src_dir) if is_content_section(item)]
+  items = index.listdir(src_dir) if index else listdir(src_dir)
+  return [item for item in items if is_content_section(item)]
@@ -14,42 +14,64 @@
 
 """Download Image Script.
 """
+import errno
 from os import makedirs
-from os.path import isdir
+from os.path import isfile
 from os.path import join
 from os.path import splitext
-import sys
 
 import click
+from .fetcher import Fetcher
 
-try:
-  from urllib.request import urlretrieve
-except ImportError:
-  from urllib import urlretrieve
 
-
-def download_image(url, out_folder, video_name):
+def download_image(url, out_folder, video_name, fetcher=None):
   """Downloads from specified url.
 
+  The image file is left untouched when it already has the downloaded
+  content.
+
   Args:
     url: URL to image
     out_folder: folder to write image file to
     video_name: Name with which image will be saved
+    fetcher: Fetcher shared between images, a new one without cache is used
+             if None
 
   Returns:
     File name of saved image or False if image could not be downloaded
   """
   click.echo("\nDownloading image for " + video_name)
-  if not isdir(join(out_folder, "images")):
-    makedirs(join(out_folder, "images"))
+  url_part = url.split("/")[-1]
+  _, url_last_extension = splitext(url_part)
+  out_file = join(out_folder, "images", video_name + url_last_extension)
+
+  own_fetcher = fetcher is None
+  if own_fetcher:
+    fetcher = Fetcher(jobs=1)
   try:
-    url_part = url.split("/")[-1]
-    _, url_last_extension = splitext(url_part)
-    out_file = join(out_folder, "images", video_name + url_last_extension)
-
-    urlretrieve(url, out_file)
-    click.echo("Successfully downloaded " + video_name + " thumbnail")
-    return video_name + url_last_extension
-  except:
+    content = fetcher.fetch(url)
+  finally:
+    if own_fetcher:
+      fetcher.close()
+  if content is None:
     click.echo("\nUnable to download thumbnail for " + video_name)
     return False
+
+  try:
+    makedirs(join(out_folder, "images"))
+  except OSError as e:
+    if e.errno != errno.EEXIST:
+      raise
+
+  try:
+    if isfile(out_file):
+      with open(out_file, "rb") as image_file:
+        if image_file.read() == content:
+          return video_name + url_last_extension
+    with open(out_file, "wb") as image_file:
+      image_file.write(content)
+  except (IOError, OSError):
+    click.echo("\nUnable to save thumbnail for " + video_name)
+    return False
+  click.echo("Successfully downloaded " + video_name + " thumbnail")
+  return video_name + url_last_extension
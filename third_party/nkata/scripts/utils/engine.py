@@ -0,0 +1,95 @@
+# Copyright 2015 The Offline Content Packager Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Worker pools used to process files in parallel.
+"""
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
+
+
+class Engine(object):
+  """Runs tasks on a process pool or a thread pool.
+
+  CPU bound tasks (HTML transformations) go to the process pool, I/O bound
+  tasks (copies) go to the thread pool. With a single job every task is run
+  immediately in the calling thread.
+  """
+
+  def __init__(self, jobs=1, processes=True):
+    """Instance variables.
+
+    Args:
+      jobs: Number of worker processes and threads
+      processes: Start worker processes, all tasks run on the thread pool
+                 if False
+    """
+    self.jobs = max(1, int(jobs or 1))
+    self.processes = None
+    self.threads = None
+    if self.jobs > 1:
+      if processes:
+        self.processes = Pool(self.jobs)
+      self.threads = ThreadPool(self.jobs)
+
+  @property
+  def parallel(self):
+    """True if tasks run on worker pools."""
+    return self.jobs > 1
+
+  def run(self, func, args, cpu_bound=False, callback=None):
+    """Runs func(*args).
+
+    Args:
+      func: Function to run, must be picklable if cpu_bound is set
+      args: Tuple of arguments
+      cpu_bound: Run on the process pool, if any, instead of the thread pool
+      callback: Called with the result in the calling process
+
+    Returns:
+      Object whose get() method returns the result of func
+    """
+    if not self.parallel:
+      result = func(*args)
+      if callback:
+        callback(result)
+      return Done(result)
+
+    pool = self.processes if cpu_bound and self.processes else self.threads
+    return pool.apply_async(func, args, callback=callback)
+
+  def close(self):
+    """Waits for running tasks and stops the workers."""
+    for pool in (self.processes, self.threads):
+      if pool:
+        pool.close()
+        pool.join()
+    self.processes = None
+    self.threads = None
+    self.jobs = 1
+
+
+class Done(object):
+  """Result of a task that has already run."""
+
+  def __init__(self, result=None):
+    """Instance variables.
+
+    Args:
+      result: Result of the task
+    """
+    self.result = result
+
+  def get(self):
+    """Gets the result."""
+    return self.result
@@ -0,0 +1,245 @@
+# Copyright 2015 The Offline Content Packager Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Concurrent HTTP fetching with an on-disk cache.
+
+Responses are cached by URL together with their ETag and Last-Modified
+headers. A cached URL is revalidated with a conditional request, so content
+that hasn't changed isn't downloaded again, and the cached copy is used when
+the server can't be reached or returns an error. Responses without either
+header are reused until they are older than max_age, then requested again.
+"""
+import errno
+import hashlib
+import json
+import logging
+from os import fdopen
+from os import makedirs
+from os import rename
+from os.path import dirname
+from os.path import isfile
+from os.path import join
+import tempfile
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .engine import Engine
+from .profiler import PROFILER
+
+try:
+  from urllib3.util.retry import Retry
+except ImportError:
+  from requests.packages.urllib3.util.retry import Retry
+
+FETCH_JOBS = 4
+TIMEOUT = 10
+RETRIES = 3
+# seconds a response without ETag or Last-Modified is reused
+MAX_AGE = 24 * 60 * 60
+
+
+class Fetcher(object):
+  """Fetches URLs on a pool of threads sharing a session.
+
+  The session keeps connections to a host open between requests; failed
+  requests and server errors are retried with a backoff.
+  """
+
+  def __init__(self, cache_dir=None, jobs=FETCH_JOBS, timeout=TIMEOUT,
+               retries=RETRIES, stage="download", max_age=MAX_AGE):
+    """Instance variables.
+
+    Args:
+      cache_dir: Directory of the cached responses, nothing is cached if
+                 None
+      jobs: Number of requests made at the same time
+      timeout: Seconds to wait for the server to connect or send data
+      retries: Number of times a failed request is retried
+      stage: Stage of the profile the requests count towards
+      max_age: Seconds a cached response without validators is reused, 0
+               to request it on every run
+    """
+    self.cache_dir = cache_dir
+    self.stage = stage
+    self.max_age = max_age
+    self.timeout = timeout
+    self.engine = Engine(jobs, processes=False)
+    self.session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=self.engine.jobs, pool_maxsize=self.engine.jobs,
+        max_retries=Retry(total=retries, backoff_factor=0.5,
+                          status_forcelist=(500, 502, 503, 504)))
+    self.session.mount("http://", adapter)
+    self.session.mount("https://", adapter)
+    self.pending = {}
+    self.lock = threading.Lock()
+
+  def prefetch(self, urls):
+    """Starts fetching urls in the background.
+
+    Args:
+      urls: URLs to fetch
+    """
+    for url in urls:
+      self._submit(url)
+
+  def fetch(self, url):
+    """Gets the content of a URL.
+
+    Waits for the request if the URL is being prefetched. The wait isn't
+    counted in the stage of the caller, the request is counted in the
+    stage of the fetcher.
+
+    Args:
+      url: URL to fetch
+
+    Returns:
+      Content of the response as bytes, None if it couldn't be fetched
+    """
+    with PROFILER.timer():
+      return self._submit(url).get()
+
+  def fetch_json(self, url):
+    """Gets the decoded JSON content of a URL.
+
+    Args:
+      url: URL to fetch
+
+    Returns:
+      Decoded content, None if it couldn't be fetched or decoded
+    """
+    content = self.fetch(url)
+    if content is None:
+      return None
+    try:
+      return json.loads(content.decode("utf-8"))
+    except ValueError:
+      logging.error("Invalid JSON from " + url)
+      return None
+
+  def close(self):
+    """Waits for the requests and releases the connections."""
+    self.engine.close()
+    self.session.close()
+
+  def _submit(self, url):
+    """Runs one request per URL and run; later calls share its result."""
+    with self.lock:
+      handle = self.pending.get(url)
+      if handle is None:
+        handle = self.pending[url] = _Pending()
+        new = True
+      else:
+        new = False
+    if new:
+      handle.handle = self.engine.run(self._profiled_fetch, (url,))
+      handle.ready.set()
+    return handle
+
+  def _profiled_fetch(self, url):
+    """Runs _fetch, recording its time and size on the profile."""
+    start = time.time()
+    content = self._fetch(url)
+    PROFILER.add(self.stage, time.time() - start, 1,
+                 len(content) if content else 0)
+    return content
+
+  def _fetch(self, url):
+    """Fetches a URL, revalidating the cached response if there is one."""
+    cached = self._cached(url)
+    headers = {}
+    if cached:
+      if cached["etag"]:
+        headers["If-None-Match"] = cached["etag"]
+      if cached["last_modified"]:
+        headers["If-Modified-Since"] = cached["last_modified"]
+      if (not headers and
+          time.time() - cached.get("fetched", 0) < self.max_age):
+        return self._read_cached(url)
+
+    try:
+      response = self.session.get(url, headers=headers, timeout=self.timeout)
+    except requests.RequestException as e:
+      logging.error("Unable to fetch " + url + ": " + str(e))
+      return self._read_cached(url) if cached else None
+
+    if response.status_code == 304 and cached:
+      return self._read_cached(url)
+    if response.status_code != 200:
+      logging.error("Unable to fetch %s: HTTP %d" % (url,
+                                                     response.status_code))
+      return self._read_cached(url) if cached else None
+
+    content = response.content
+    if self.cache_dir:
+      self._store(url, content, response.headers.get("ETag"),
+                  response.headers.get("Last-Modified"))
+    return content
+
+  def _path(self, url):
+    """Path of the cached content of a URL."""
+    return join(self.cache_dir, hashlib.sha1(url.encode("utf-8")).hexdigest())
+
+  def _cached(self, url):
+    """Validators of the cached response of a URL, None if not cached."""
+    if not self.cache_dir or not isfile(self._path(url) + ".json"):
+      return None
+    try:
+      with open(self._path(url) + ".json") as data_file:
+        return json.load(data_file)
+    except ValueError:
+      return None
+
+  def _read_cached(self, url):
+    """Cached content of a URL."""
+    with open(self._path(url), "rb") as data_file:
+      return data_file.read()
+
+  def _store(self, url, content, etag, last_modified):
+    """Caches the content and validators of a response."""
+    try:
+      makedirs(self.cache_dir)
+    except OSError as e:
+      if e.errno != errno.EEXIST:
+        raise
+    path = self._path(url)
+    write_file(path, content)
+    write_file(path + ".json", json.dumps(
+        {"url": url, "etag": etag, "last_modified": last_modified,
+         "fetched": time.time()}, sort_keys=True).encode("utf-8"))
+
+
+class _Pending(object):
+  """Result of a request, shared by every fetch of the same URL."""
+
+  def __init__(self):
+    """Instance variables."""
+    self.ready = threading.Event()
+    self.handle = None
+
+  def get(self):
+    """Waits for the request and returns its result."""
+    self.ready.wait()
+    return self.handle.get()
+
+
+def write_file(path, data):
+  """Writes data to a temporary file, then renames it to path."""
+  handle, tmp_path = tempfile.mkstemp(dir=dirname(path), prefix=".tmp")
+  with fdopen(handle, "wb") as tmp_file:
+    tmp_file.write(data)
+  rename(tmp_path, path)
@@ -17,17 +17,21 @@
 from os import makedirs
 from os import walk
 from os.path import exists
-from os.path import isdir
+from os.path import getsize
 from os.path import isfile
 from os.path import join
 import shutil
 import tempfile
+import time
 
+from .engine import Done
+from .engine import Engine
+from .profiler import PROFILER
 from .progressbar import ProgressBar
 
 
 def copy_with_transformations(itemsrc, itemdst, transformations,
-                              metadata, video_src):
+                              metadata, video_src, cache=None, placer=None):
 
   """Copy file while running transformations.
 
@@ -41,12 +45,22 @@ def copy_with_transformations(itemsrc, itemdst, transformations,
     transformations: Transformations to be carried out on file
     metadata: Metadata for transformations to be applied
     video_src: Source path for video content
+    cache: BundleCache used to skip files that are already up to date
+    placer: Placer used for files without transformations
+
+  Returns:
+    Result of the last transformation, if any
   """
 
   # filter only transformations that should apply to itemsrc file path
   valid_transformations = [t for t in transformations if t.applies(itemsrc)]
 
   if valid_transformations:
+    params = cache_params(valid_transformations)
+    if cache and params is not None and cache.is_current(itemsrc, itemdst,
+                                                         params):
+      return None
+
     inpath = itemsrc
 
     # run all but the last of the valid transformations
@@ -57,14 +71,244 @@ def copy_with_transformations(itemsrc, itemdst, transformations,
 
     # run the last transformation, with the final destination
     final_transformation = valid_transformations[-1]
-    final_transformation.apply(inpath, itemdst, itemdst, metadata, video_src)
+    result = final_transformation.apply(inpath, itemdst, itemdst, metadata,
+                                        video_src)
+
+    if cache and params is not None:
+      cache.record(itemsrc, itemdst, params)
+    return result
+
+  copy_file(itemsrc, itemdst, cache, placer)
+  return None
+
+
+def copy_file(itemsrc, itemdst, cache=None, placer=None):
+  """Copy file unless the bundled copy is already up to date.
 
+  Args:
+    itemsrc: Source path for file to be copied
+    itemdst: Destination path for file to be copied
+    cache: BundleCache used to skip files that are already up to date
+    placer: Placer linking or copying the file, copied if None
+  """
+  if cache and cache.is_current(itemsrc, itemdst, ""):
+    return
+
+  if placer:
+    placer.place(itemsrc, itemdst)
   else:
     shutil.copy2(itemsrc, itemdst)
+  if cache:
+    cache.record(itemsrc, itemdst, "")
 
 
-def copy_files(paths, section, transformations, metadata=None, video_src=None):
-  """Walks through source directory and calls copy_with_transformations.
+def cache_params(transformations):
+  """Combines the cache parameters of transformations.
+
+  Args:
+    transformations: Transformations applied to a file
+
+  Returns:
+    String of parameters, or None if the output of one of the
+    transformations can't be reused
+  """
+  keys = [t.cache_key() for t in transformations]
+  if None in keys:
+    return None
+  return "|".join(keys)
+
+
+def transform_file(itemsrc, itemdst, transformations, metadata, video_src):
+  """Runs copy_with_transformations in a worker process.
+
+  Args:
+    itemsrc: Source path for file to be copied
+    itemdst: Destination path for file to be copied
+    transformations: Transformations to be carried out on file
+    metadata: Metadata for transformations to be applied
+    video_src: Source path for video content
+
+  Returns:
+    Tuple of the result of the transformations, the (size, mtime, digest)
+    of itemsrc if a transformation computed it, so the caller can record
+    it, and the time spent
+  """
+  with PROFILER.timer() as timer:
+    result = copy_with_transformations(itemsrc, itemdst, transformations,
+                                       metadata, video_src)
+  seconds = timer.seconds
+  for transformation in transformations:
+    cache = getattr(transformation, "cache", None)
+    if cache and itemsrc in cache.digests:
+      return result, cache.digests[itemsrc], seconds
+  return result, None, seconds
+
+
+def profile_file(section, itemsrc, itemdst, transformations, metadata,
+                 video_src, cache=None, placer=None):
+  """Runs copy_with_transformations, recording its time when profiling.
+
+  Args:
+    section: Name of the section of the file
+    itemsrc: Source path for file to be copied
+    itemdst: Destination path for file to be copied
+    transformations: Transformations to be carried out on file
+    metadata: Metadata for transformations to be applied
+    video_src: Source path for video content
+    cache: BundleCache used to skip files that are already up to date
+    placer: Placer used for files without transformations
+
+  Returns:
+    Result of the last transformation, if any
+  """
+  if not PROFILER.enabled:
+    return copy_with_transformations(itemsrc, itemdst, transformations,
+                                     metadata, video_src, cache, placer)
+  with PROFILER.timer() as timer:
+    result = copy_with_transformations(itemsrc, itemdst, transformations,
+                                       metadata, video_src, cache, placer)
+  record_profile(section, itemsrc,
+                 [t for t in transformations if t.applies(itemsrc)],
+                 timer.seconds)
+  return result
+
+
+def record_profile(section, itemsrc, transformations, seconds):
+  """Records the time spent on a file.
+
+  The file counts towards the stage of its last transformation, or
+  media_copy when it is copied as it is.
+
+  Args:
+    section: Name of the section of the file
+    itemsrc: Source path of the file
+    transformations: Transformations applied to the file
+    seconds: Time spent
+  """
+  if not PROFILER.enabled:
+    return
+  if transformations:
+    stage = getattr(transformations[-1], "stage", "transform")
+    name = "+".join([type(t).__name__ for t in transformations])
+  else:
+    stage = name = "media_copy"
+  try:
+    size = getsize(itemsrc)
+  except OSError:
+    size = 0
+  PROFILER.add(stage, seconds, 1, size, section, name)
+
+
+def submit_file(engine, itemsrc, itemdst, transformations, metadata,
+                video_src, cache, placer=None, section=None):
+  """Submits copy_with_transformations for one file to engine.
+
+  CPU bound transformations run on the process pool. The manifest is only
+  read and updated in this process.
+
+  Args:
+    engine: Engine running the task
+    itemsrc: Source path for file to be copied
+    itemdst: Destination path for file to be copied
+    transformations: Transformations to be carried out on file
+    metadata: Metadata for transformations to be applied
+    video_src: Source path for video content
+    cache: BundleCache used to skip files that are already up to date
+    placer: Placer used for files without transformations
+    section: Name of the section of the file, for the profile
+
+  Returns:
+    Object whose get() method returns the result of the transformations
+  """
+  valid_transformations = [t for t in transformations if t.applies(itemsrc)]
+  cpu_bound = [t for t in valid_transformations
+               if getattr(t, "cpu_bound", False)]
+  if not engine.parallel or not cpu_bound:
+    return engine.run(profile_file,
+                      (section, itemsrc, itemdst, transformations, metadata,
+                       video_src, cache, placer))
+
+  start = time.time()
+  params = cache_params(valid_transformations)
+  if cache and params is not None and cache.is_current(itemsrc, itemdst,
+                                                       params):
+    record_profile(section, itemsrc, valid_transformations,
+                   time.time() - start)
+    return Done()
+
+  def record(value):
+    """Records the transformed file in the manifest and the profile."""
+    if cache and params is not None:
+      if value[1]:
+        cache.digests[itemsrc] = value[1]
+      cache.record(itemsrc, itemdst, params)
+    record_profile(section, itemsrc, valid_transformations, value[2])
+
+  handle = engine.run(transform_file,
+                      (itemsrc, itemdst, valid_transformations, metadata,
+                       video_src),
+                      cpu_bound=True, callback=record)
+  return _Result(handle)
+
+
+class _Result(object):
+  """Result of transform_file without the digest and the time."""
+
+  def __init__(self, handle):
+    """Instance variables.
+
+    Args:
+      handle: Result of the transform_file task
+    """
+    self.handle = handle
+
+  def get(self):
+    """Gets the result of the transformations."""
+    return self.handle.get()[0]
+
+
+class CopyJob(object):
+  """Files of a section submitted for copying.
+  """
+
+  def __init__(self, section, dst_dir, pending, cache=None):
+    """Instance variables.
+
+    Args:
+      section: Name of the section
+      dst_dir: Destination directory of the section
+      pending: Results of the submitted files, in walk order
+      cache: BundleCache used to remove deleted files
+    """
+    self.section = section
+    self.dst_dir = dst_dir
+    self.pending = pending
+    self.cache = cache
+
+  def wait(self):
+    """Waits for every file of the section and reports progress.
+
+    Returns:
+      List of the results returned by the transformations, in walk order
+    """
+    progress = ProgressBar("Copying files from " + self.section + "...")
+    results = []
+    total = len(self.pending)
+    for num_copied, handle in enumerate(self.pending, 1):
+      result = handle.get()
+      if result is not None:
+        results.append(result)
+      progress.calculate_update(num_copied, total)
+
+    if self.cache:
+      self.cache.prune(self.dst_dir)
+    return results
+
+
+def submit_files(paths, section, transformations, metadata=None,
+                 video_src=None, cache=None, engine=None, placer=None,
+                 index=None):
+  """Walks through source directory and submits every file to engine.
 
   Args:
     paths: tuple containing src_dir and dst_dir
@@ -72,54 +316,76 @@ def copy_files(paths, section, transformations, metadata=None, video_src=None):
     transformations: List of Transformations to be applied to section
     metadata: Metadata to be used for transformations
     video_src: Source path for video content
+    cache: BundleCache used to skip unchanged files and remove deleted ones
+    engine: Engine running the copies, files are copied one by one if None
+    placer: Placer used for files without transformations
+    index: ContentIndex of the sources, src_dir is walked if None
+
+  Returns:
+    CopyJob to wait for
   """
   src_dir, dst_dir = paths
-  num_files = count_files(src_dir)
-  print
-  progress = ProgressBar("Copying files from " + section + "...")
-
-  num_copied = 0
-  if isfile(src_dir) and not src_dir.endswith(".yaml"):
-    copy_with_transformations(src_dir, dst_dir, transformations, metadata,
-                              video_src)
+  engine = engine or Engine()
+  pending = []
+
+  is_file = index.isfile(src_dir) if index else isfile(src_dir)
+  if is_file and not src_dir.endswith(".yaml"):
+    pending.append(submit_file(engine, src_dir, dst_dir, transformations,
+                               metadata, video_src, cache, placer, section))
   else:
-    for srcpath, _, filenames in walk(src_dir):
+    for itemsrc, itemdst in list_files(src_dir, dst_dir, index):
+      pending.append(submit_file(engine, itemsrc, itemdst, transformations,
+                                 metadata, video_src, cache, placer,
+                                 section))
 
-      if srcpath.endswith("metadata"):
-        continue
-      relpath = srcpath[len(src_dir)+1:]
-      dstpath = join(dst_dir, relpath)
+  return CopyJob(section, dst_dir, pending, cache)
+
+
+def copy_files(paths, section, transformations, metadata=None, video_src=None,
+               cache=None, engine=None, placer=None):
+  """Walks through source directory and calls copy_with_transformations.
+
+  Args:
+    paths: tuple containing src_dir and dst_dir
+    section: Object representing section being processed
+    transformations: List of Transformations to be applied to section
+    metadata: Metadata to be used for transformations
+    video_src: Source path for video content
+    cache: BundleCache used to skip unchanged files and remove deleted ones
+    engine: Engine running the copies, files are copied one by one if None
+    placer: Placer used for files without transformations
 
-      if not exists(dstpath):
-        makedirs(dstpath)
-      for name in filenames:
-        if name.endswith(".yaml") or name.startswith("."):
-          continue
-        itemsrc = join(srcpath, name)
-        itemdst = join(dstpath, name)
-        copy_with_transformations(itemsrc, itemdst, transformations, metadata,
-                                  video_src)
-        num_copied += 1
-        progress.calculate_update(num_copied, num_files)
+  Returns:
+    List of the results returned by the transformations, in walk order
+  """
+  return submit_files(paths, section, transformations, metadata, video_src,
+                      cache, engine, placer).wait()
 
 
-def count_files(directory):
-  """Counts total number of files in a particular directory.
+def list_files(src_dir, dst_dir, index=None):
+  """Lists the files of a section and creates the destination directories.
 
   Args:
-    directory: Directory containing files to be counted
+    src_dir: Source directory of the section
+    dst_dir: Destination directory of the section
+    index: ContentIndex of the sources, src_dir is walked if None
 
   Returns:
-    Number of files in directory
+    List of (source path, destination path) tuples, in walk order
   """
   files = []
-  if isdir(directory):
-    for path, _, filenames in walk(directory):
-      if path.endswith("metadata"):
+  for srcpath, _, filenames in (index.walk if index else walk)(src_dir):
+
+    if srcpath.endswith("metadata"):
+      continue
+    relpath = srcpath[len(src_dir)+1:]
+    dstpath = join(dst_dir, relpath)
+
+    if not exists(dstpath):
+      makedirs(dstpath)
+    for name in filenames:
+      if name.endswith(".yaml") or name.startswith("."):
         continue
-      for name in filenames:
-        if name.endswith(".yaml") or name.startswith("."):
-          continue
-        files.append(name)
+      files.append((join(srcpath, name), join(dstpath, name)))
 
-  return len(files)
+  return files
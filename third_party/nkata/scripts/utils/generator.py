@@ -17,13 +17,14 @@
 import logging
 from os import getcwd
 from os import makedirs
-from os import walk
 from os.path import exists
 from os.path import isdir
 from os.path import join
 
 import click
-import requests
+from .cache import CACHE_DIR
+from .fetcher import Fetcher
+from .index import ContentIndex
 import yaml
 
 
@@ -79,49 +80,81 @@ def generate_video_metadata():
 
   src_dir = conf_data["source"]["main_path"]
   video_src = conf_data["source"]["video_source"] or "videos"
+  dst = conf_data["destination"]["main_path"]
 
-  for section, _, _ in walk(join(src_dir, video_src)):
-    src_path = join(section, "videos_url.yaml")
-
+  sections = list()
+  videos_dir = join(src_dir, video_src)
+  for section, _, file_names in ContentIndex(videos_dir).scan().walk(
+      videos_dir):
+    if "videos_url.yaml" not in file_names:
+      continue
     try:
-      with open(src_path) as data_file:
-        conf_data = yaml.load(data_file)
-        metadata_path = join(section, "metadata")
-
-        for url_obj in conf_data["urls"]:
-          video_name = url_obj["video_name"]
-          click.echo("Generating metadata for " + video_name + " video file...")
-          url = url_obj["url"]
-          template = metadata_content_generator(url)
-          if template:
-            if not isdir(metadata_path):
-              makedirs(metadata_path)
-            write_file = open(join(metadata_path, video_name +
-                                   "_metadata.yaml"), "w")
-            write_file.write(template)
-
-          else:
-            click.echo("Error: Can't get metadata for " + video_name + ".")
-            logging.error("Error: Can't get metadata for " + video_name + ".")
+      with open(join(section, "videos_url.yaml")) as data_file:
+        sections.append((section, yaml.load(data_file)["urls"]))
     except:
       continue
+
+  # request every video at once, metadata is written in order; the
+  # metadata is requested again on every run so it can be refreshed
+  fetcher = Fetcher(join(dst, CACHE_DIR, "http"), max_age=0)
+  fetcher.prefetch([oembed_url(url_obj["url"])
+                    for _, url_objs in sections for url_obj in url_objs])
+  try:
+    for section, url_objs in sections:
+      metadata_path = join(section, "metadata")
+      for url_obj in url_objs:
+        video_name = url_obj["video_name"]
+        click.echo("Generating metadata for " + video_name + " video file...")
+        url = url_obj["url"]
+        template = metadata_content_generator(url, fetcher)
+        if template:
+          if not isdir(metadata_path):
+            makedirs(metadata_path)
+          write_file = open(join(metadata_path, video_name +
+                                 "_metadata.yaml"), "w")
+          write_file.write(template)
+
+        else:
+          click.echo("Error: Can't get metadata for " + video_name + ".")
+          logging.error("Error: Can't get metadata for " + video_name + ".")
+  finally:
+    fetcher.close()
   click.echo("Done.")
 
 
-def metadata_content_generator(url):
+def oembed_url(url):
+  """Gets the oEmbed URL of a YouTube video.
+
+  Args:
+    url: YouTube URL
+
+  Returns:
+    URL of the video metadata in JSON
+  """
+  return "http://www.youtube.com/oembed?url=" + url + "&format=json"
+
+
+def metadata_content_generator(url, fetcher=None):
   """Metadata generator helper for videos.
 
   Args:
     url: YouTube URL from which metadata will be pulled
+    fetcher: Fetcher shared between videos, a new one without cache is used
+             if None
 
   Returns:
     String containing Title, Author name, description and Thumbnail URL
   """
-  link = "http://www.youtube.com/oembed?url=" + url + "&format=json"
-  res = requests.get(link)
-  if res.status_code is not 200:
+  own_fetcher = fetcher is None
+  if own_fetcher:
+    fetcher = Fetcher(jobs=1)
+  try:
+    metadata = fetcher.fetch_json(oembed_url(url))
+  finally:
+    if own_fetcher:
+      fetcher.close()
+  if not metadata:
     return False
-  metadata = res.json()
   title = metadata["title"]
   author_name = metadata["author_name"]
   author_url = metadata["author_url"]
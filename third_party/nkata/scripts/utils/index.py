@@ -0,0 +1,313 @@
+# Copyright 2015 The Offline Content Packager Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""In-memory index of a content tree.
+
+The tree is scanned once, with a single stat per file, and the commands
+read directory listings, sizes, modification times and parsed YAML files
+from the index instead of walking and stating the tree again.
+"""
+import json
+from os import listdir
+from os import lstat
+from os import rename
+from os import stat
+from os.path import isfile
+from os.path import islink
+from os.path import join
+from os.path import normpath
+from stat import S_ISDIR
+import time
+
+import yaml
+
+from .profiler import PROFILER
+
+try:
+  from os import scandir
+except ImportError:
+  scandir = None
+
+INDEX_VERSION = 1
+# name of the saved index, under the cache directory of the destination
+INDEX_FILE = "index.json"
+
+DIR = "dir"
+FILE = "file"
+# symbolic link to a directory
+LINK = "link"
+
+
+class ContentIndex(object):
+  """Listing of every directory under a root, in directory order.
+
+  Directories are listed in the order the file system returns them, like
+  os.walk and os.listdir, and symbolic links to directories are listed
+  but not followed.
+  """
+
+  def __init__(self, root):
+    """Instance variables.
+
+    Args:
+      root: Directory to index
+    """
+    self.root = root
+    # normalized directory path: list of (name, kind, size, mtime)
+    self.dirs = {}
+    # normalized file path: (st_dev, st_ino)
+    self.inodes = {}
+    self.parsed = {}
+    self.by_path = None
+
+  def scan(self):
+    """Scans the tree under root.
+
+    Returns:
+      The index itself
+    """
+    self.dirs = {}
+    self.inodes = {}
+    self.parsed = {}
+    self.by_path = None
+    start = time.time()
+    files = 0
+    pending = [normpath(self.root)]
+    while pending:
+      path = pending.pop()
+      try:
+        entries = list(scan_dir(path))
+      except OSError:
+        continue
+      self.dirs[path] = [entry[:4] for entry in entries]
+      for name, kind, _, _, inode in reversed(entries):
+        if kind == DIR:
+          pending.append(join(path, name))
+        elif kind == FILE:
+          files += 1
+          self.inodes[join(path, name)] = inode
+    PROFILER.add("scan", time.time() - start, files)
+    return self
+
+  def walk(self, top):
+    """Walks a directory of the index like os.walk.
+
+    Args:
+      top: Directory under root
+
+    Yields:
+      (directory path, directory names, file names) tuples
+    """
+    entries = self.dirs.get(normpath(top))
+    if entries is None:
+      return
+    dir_names = [name for name, kind, _, _ in entries if kind != FILE]
+    file_names = [name for name, kind, _, _ in entries if kind == FILE]
+    yield top, dir_names, file_names
+    for name in dir_names:
+      for result in self.walk(join(top, name)):
+        yield result
+
+  def listdir(self, path):
+    """Names in a directory, like os.listdir.
+
+    Raises:
+      OSError: if path isn't an indexed directory
+    """
+    entries = self.dirs.get(normpath(path))
+    if entries is None:
+      raise OSError("Not an indexed directory: " + path)
+    return [name for name, _, _, _ in entries]
+
+  def entry(self, path):
+    """Gets the (name, kind, size, mtime) entry of a path, None if unknown."""
+    if self.by_path is None:
+      by_path = {}
+      for parent, entries in self.dirs.items():
+        for entry in entries:
+          by_path[join(parent, entry[0])] = entry
+      self.by_path = by_path
+    return self.by_path.get(normpath(path))
+
+  def isfile(self, path):
+    """Checks whether path is an indexed file."""
+    entry = self.entry(path)
+    return entry is not None and entry[1] == FILE
+
+  def isdir(self, path):
+    """Checks whether path is an indexed directory."""
+    entry = self.entry(path)
+    return normpath(path) in self.dirs or (entry is not None and
+                                            entry[1] != FILE)
+
+  def exists(self, path):
+    """Checks whether path is indexed."""
+    return normpath(path) in self.dirs or self.entry(path) is not None
+
+  def stat(self, path):
+    """Gets the (size, mtime) of a file, None if it isn't indexed."""
+    entry = self.entry(path)
+    if entry is None or entry[1] != FILE:
+      return None
+    return entry[2], entry[3]
+
+  def inode(self, path):
+    """Gets the (st_dev, st_ino) of a scanned file, None if it isn't known.
+    """
+    return self.inodes.get(normpath(path))
+
+  def files(self, top):
+    """Lists the files and empty directories under top.
+
+    Args:
+      top: Directory under root
+
+    Returns:
+      List of (path, size, is_dir) tuples, in walk order
+    """
+    content = []
+    for dir_path, dir_names, file_names in self.walk(top):
+      sizes = dict([(name, size) for name, _, size, _
+                    in self.dirs[normpath(dir_path)]])
+      for name in file_names:
+        content.append((join(dir_path, name), sizes[name], False))
+      if not dir_names and not file_names:
+        content.append((dir_path, 0, True))
+    return content
+
+  def size(self, top):
+    """Total size of the files under top."""
+    return sum([size for _, size, _ in self.files(top)])
+
+  def load_yaml(self, path):
+    """Parses a YAML file once for the whole run.
+
+    Args:
+      path: Path to the YAML file
+
+    Returns:
+      Parsed content
+
+    Raises:
+      IOError: if the file can't be read
+    """
+    key = normpath(path)
+    if key not in self.parsed:
+      with open(path) as data_file:
+        self.parsed[key] = yaml.load(data_file)
+    return self.parsed[key]
+
+  def save(self, path):
+    """Writes the directory listings to a JSON file.
+
+    Args:
+      path: Path to the index file
+    """
+    with open(path + ".tmp", "w") as index_file:
+      json.dump({"version": INDEX_VERSION, "root": self.root,
+                 "dirs": self.dirs, "inodes": self.inodes}, index_file,
+                sort_keys=True)
+    rename(path + ".tmp", path)
+
+  @classmethod
+  def load(cls, path):
+    """Reads an index written by save.
+
+    Args:
+      path: Path to the index file
+
+    Returns:
+      ContentIndex, None if the file is missing or invalid
+    """
+    if not isfile(path):
+      return None
+    try:
+      with open(path) as index_file:
+        data = json.load(index_file)
+    except ValueError:
+      return None
+    if data.get("version") != INDEX_VERSION:
+      return None
+    index = cls(data["root"])
+    index.dirs = dict([(key, [tuple(entry) for entry in entries])
+                       for key, entries in data["dirs"].items()])
+    index.inodes = dict([(key, tuple(inode)) for key, inode
+                         in data.get("inodes", {}).items() if inode])
+    return index
+
+
+def scan_dir(path):
+  """Lists a directory with the size and modification time of its files.
+
+  Uses os.scandir when available, so a directory costs one listing plus one
+  stat per file.
+
+  Args:
+    path: Directory to list
+
+  Yields:
+    (name, kind, size, mtime, inode) tuples, in directory order, inode
+    being the (st_dev, st_ino) of files, None for directories
+  """
+  if scandir:
+    for entry in scandir(path):
+      try:
+        is_dir = entry.is_dir()
+      except OSError:
+        is_dir = False
+      if is_dir:
+        yield entry.name, LINK if entry.is_symlink() else DIR, 0, 0, None
+        continue
+      try:
+        info = entry.stat()
+      except OSError:
+        info = entry.stat(follow_symlinks=False)
+      yield entry.name, FILE, info.st_size, info.st_mtime, inode_of(info)
+  else:
+    for name in listdir(path):
+      entry_path = join(path, name)
+      try:
+        info = stat(entry_path)
+      except OSError:
+        info = lstat(entry_path)
+      if S_ISDIR(info.st_mode):
+        yield name, LINK if islink(entry_path) else DIR, 0, 0, None
+      else:
+        yield name, FILE, info.st_size, info.st_mtime, inode_of(info)
+
+
+def inode_of(info):
+  """Gets (st_dev, st_ino) from a stat result, None if it has no inode.
+
+  The stat results of os.scandir on Windows have no inode numbers.
+  """
+  if not info.st_ino:
+    return None
+  return info.st_dev, info.st_ino
+
+
+def load_yaml(path, index=None):
+  """Parses a YAML file, once per run when an index is given.
+
+  Args:
+    path: Path to the YAML file
+    index: ContentIndex remembering parsed files
+
+  Returns:
+    Parsed content
+  """
+  if index is not None:
+    return index.load_yaml(path)
+  with open(path) as data_file:
+    return yaml.load(data_file)
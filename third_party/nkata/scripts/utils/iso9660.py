@@ -0,0 +1,699 @@
+# Copyright 2015 The Offline Content Packager Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""ISO 9660 image writer with Rock Ridge and Joliet extensions.
+
+The layout of the image (descriptors, path tables, directory records and
+file extents) is computed from the list of files before anything is
+written, then file data is streamed from the source tree into the image.
+Like mkisofs -r -J, the primary tree carries Rock Ridge names and
+permissions, so the original names are kept on systems reading Rock Ridge,
+and the Joliet tree has names of at most 64 characters for Windows.
+Images only depend on the files, their names and modification times, so
+writing the same tree twice gives the same image.
+"""
+import errno
+import logging
+from os import stat
+from os.path import isdir
+from os.path import join
+from os.path import relpath
+from os.path import sep
+from os.path import splitext
+import re
+import struct
+import time
+
+from .index import ContentIndex
+
+try:
+  from os import sendfile
+except ImportError:
+  sendfile = None
+
+SECTOR = 2048
+BUFFER_SIZE = 1024 * 1024
+
+# largest extent that fits in a 32 bit size, bigger files use several
+MAX_EXTENT = 0xFFFFF800
+
+JOLIET_NAME_MAX = 64
+# UCS-2 level 3
+JOLIET_ESCAPE = b"%/E"
+
+FLAG_DIRECTORY = 0x02
+FLAG_MULTI_EXTENT = 0x80
+
+# largest directory record
+MAX_RECORD = 255
+# Rock Ridge (RRIP 1.09) extension and entries
+RRIP_ID = b"RRIP_1991A"
+RRIP_DESCRIPTOR = (b"THE ROCK RIDGE INTERCHANGE PROTOCOL PROVIDES SUPPORT FOR"
+                   b" POSIX FILE SYSTEM SEMANTICS")
+RRIP_SOURCE = (b"PLEASE CONTACT DISC PUBLISHER FOR SPECIFICATION SOURCE.  SEE"
+               b" PUBLISHER IDENTIFIER IN PRIMARY VOLUME DESCRIPTOR FOR"
+               b" CONTACT INFORMATION.")
+RR_PX = 0x01
+RR_NM = 0x08
+NM_CONTINUE = 0x01
+# longest name part in an NM entry
+NM_MAX = 250
+# read only, like mkisofs -r
+MODE_DIR = 0o40555
+MODE_FILE = 0o100444
+# length of a CE entry
+CE_LENGTH = 28
+
+# first sector after the system area
+DESCRIPTORS = 16
+
+D_CHARS_RE = re.compile(r"[^A-Z0-9_]")
+JOLIET_RE = re.compile(r"[*/:;?\\]")
+
+
+def both16(value):
+  """Encodes a 16 bit number in both byte orders."""
+  return struct.pack("<H", value) + struct.pack(">H", value)
+
+
+def both32(value):
+  """Encodes a 32 bit number in both byte orders."""
+  return struct.pack("<I", value) + struct.pack(">I", value)
+
+
+def sectors(size):
+  """Number of sectors needed for size bytes."""
+  return (size + SECTOR - 1) // SECTOR
+
+
+def record_date(timestamp):
+  """Encodes a time as a directory record date (UTC)."""
+  t = time.gmtime(timestamp)
+  return struct.pack("7B", min(max(t.tm_year - 1900, 0), 255), t.tm_mon,
+                     t.tm_mday, t.tm_hour, t.tm_min, t.tm_sec, 0)
+
+
+def volume_date(timestamp):
+  """Encodes a time as a volume descriptor date (UTC)."""
+  if timestamp is None:
+    return b"0" * 16 + b"\x00"
+  stamp = time.strftime("%Y%m%d%H%M%S", time.gmtime(timestamp))
+  return stamp.encode("ascii") + b"00\x00"
+
+
+def record_size(ident_length, system_use_length=0):
+  """Length of a directory record, padded to an even number of bytes."""
+  size = 33 + ident_length + (1 - ident_length % 2) + system_use_length
+  return size + size % 2
+
+
+def susp_entry(signature, data):
+  """Encodes a System Use Sharing Protocol entry."""
+  return signature + struct.pack("2B", len(data) + 4, 1) + data
+
+
+def rock_ridge_entries(is_dir, name=None):
+  """Encodes the RR, PX and NM entries of a file or directory.
+
+  Args:
+    is_dir: True for directories
+    name: Name of the file or directory, None for the . and .. records
+
+  Returns:
+    Tuple of the RR and PX entries and of the NM entries
+  """
+  flags = RR_PX
+  names = b""
+  if name is not None:
+    flags |= RR_NM
+    data = name.encode("utf-8")
+    while True:
+      part, data = data[:NM_MAX], data[NM_MAX:]
+      names += susp_entry(b"NM", struct.pack("B", NM_CONTINUE if data else 0)
+                          + part)
+      if not data:
+        break
+  mode = MODE_DIR if is_dir else MODE_FILE
+  attributes = (susp_entry(b"RR", struct.pack("B", flags)) +
+                susp_entry(b"PX", both32(mode) + both32(2 if is_dir else 1) +
+                           both32(0) + both32(0)))
+  return attributes, names
+
+
+def iso_name(name, is_dir, used):
+  """Gets a unique ISO 9660 level 1 identifier (8.3 d-characters).
+
+  Args:
+    name: Name of the file or directory
+    is_dir: True for directories, which have no extension or version
+    used: Identifiers already given in the same directory
+
+  Returns:
+    Identifier as bytes
+  """
+  if is_dir:
+    base, ext = name, ""
+  else:
+    base, ext = splitext(name)
+    ext = ext[1:]
+  base = D_CHARS_RE.sub("_", base.upper())[:8] or "_"
+  ext = D_CHARS_RE.sub("_", ext.upper())[:3]
+
+  count = 0
+  stem = base
+  while True:
+    ident = stem if is_dir else stem + "." + ext + ";1"
+    if ident not in used:
+      used.add(ident)
+      return ident.encode("ascii")
+    count += 1
+    suffix = str(count)
+    stem = base[:8 - len(suffix)] + suffix
+
+
+def joliet_name(name, used):
+  """Gets a unique Joliet identifier.
+
+  Names longer than JOLIET_NAME_MAX UCS-2 characters are shortened, keeping
+  their extension, and a ~N suffix is added to names that would collide
+  with an identifier already given in the same directory.
+
+  Args:
+    name: Name of the file or directory
+    used: Identifiers already given in the same directory
+
+  Returns:
+    Identifier as UCS-2 big endian bytes
+  """
+  name = JOLIET_RE.sub("_", name)
+  base, ext = splitext(name)
+  if ucs2_length(ext) > JOLIET_NAME_MAX // 2:
+    base, ext = name, ""
+
+  count = 0
+  ident = name
+  if ucs2_length(name) > JOLIET_NAME_MAX:
+    ident = ucs2_truncate(base, JOLIET_NAME_MAX - ucs2_length(ext)) + ext
+  while ident in used:
+    count += 1
+    suffix = "~%d" % count
+    ident = ucs2_truncate(base, JOLIET_NAME_MAX - ucs2_length(ext) -
+                          len(suffix)) + suffix + ext
+  used.add(ident)
+  return ident.encode("utf-16-be")
+
+
+def ucs2_length(text):
+  """Number of UCS-2 characters of text, two for characters outside the BMP.
+  """
+  return len(text.encode("utf-16-be")) // 2
+
+
+def ucs2_truncate(text, length):
+  """Shortens text to length UCS-2 characters without splitting a pair."""
+  return text.encode("utf-16-be")[:2 * length].decode("utf-16-be", "ignore")
+
+
+class Node(object):
+  """File or directory in the image."""
+
+  def __init__(self, name, path, is_dir, parent=None):
+    """Instance variables.
+
+    Args:
+      name: Name in the source tree
+      path: Path to the source
+      is_dir: True for directories
+      parent: Parent directory node, None for the root
+    """
+    self.name = name
+    self.path = path
+    self.is_dir = is_dir
+    self.parent = parent or self
+    self.children = {}
+    self.size = 0
+    self.mtime = 0
+    self.inode = None
+    self.location = 0
+    # per tree (0: ISO 9660, 1: Joliet): identifier, directory number,
+    # directory extent location and size
+    self.ident = [None, None]
+    self.number = [0, 0]
+    self.dir_location = [0, 0]
+    self.dir_size = [0, 0]
+
+  def sorted_children(self, tree):
+    """Children in the order of their identifiers in tree."""
+    return sorted(self.children.values(),
+                  key=lambda child: child.ident[tree])
+
+
+class IsoImage(object):
+  """Layout of an ISO 9660 image with a Joliet directory tree."""
+
+  def __init__(self, source, filelist=None, volume_id="", index=None):
+    """Builds the directory tree and computes the layout.
+
+    Args:
+      source: Directory the image is made from
+      filelist: Files and empty directories under source to include, the
+                whole directory if None
+      volume_id: Volume name
+      index: ContentIndex holding source, giving the kind, size,
+             modification time and inode of the files without stating
+             them; files it doesn't know are stated
+    """
+    self.volume_id = volume_id
+    self.root = Node("", source, True)
+    # (path, Joliet name) of the files and directories whose name changed
+    self.renamed = []
+    if filelist is None:
+      index = index or ContentIndex(source).scan()
+      filelist = [path for path, _, _ in index.files(source)]
+    for path in filelist:
+      self._add(source, path, index)
+
+    self.dirs = [[], []]
+    self.files = []
+    # Rock Ridge entries by (node, is . record): entries in the record,
+    # entries in its continuation area and the location of that area
+    self.rock_ridge = {}
+    # records with a continuation area, by directory holding the record
+    self.continuations = {}
+    self.date = None
+    self._name(self.root)
+    for node in self._walk(self.root):
+      if not node.is_dir:
+        self.date = max(self.date, node.mtime) if self.date else node.mtime
+    self._layout()
+
+  def _add(self, source, path, index=None):
+    """Adds a file or directory and its parents to the tree."""
+    known = index is not None and index.exists(path)
+    leaf_is_dir = index.isdir(path) if known else isdir(path)
+    parts = relpath(path, source).split(sep)
+    node = self.root
+    for i, part in enumerate(parts):
+      if part in (".", ""):
+        continue
+      is_dir = i < len(parts) - 1 or leaf_is_dir
+      child = node.children.get(part)
+      if child is None:
+        child = Node(part, join(node.path, part), is_dir, node)
+        node.children[part] = child
+      node = child
+
+    if node.is_dir:
+      return
+    inode = index.inode(path) if known else None
+    if inode is not None:
+      node.size, mtime = index.stat(path)
+    else:
+      info = stat(path)
+      node.size, mtime = info.st_size, info.st_mtime
+      inode = (info.st_dev, info.st_ino)
+    node.mtime = int(mtime)
+    node.inode = inode
+
+  def _walk(self, node):
+    """Iterates over node and its descendants in source name order."""
+    yield node
+    for name in sorted(node.children):
+      for child in self._walk(node.children[name]):
+        yield child
+
+  def _name(self, node):
+    """Gives identifiers to the descendants of node."""
+    used = [set(), set()]
+    for name in sorted(node.children):
+      child = node.children[name]
+      child.ident[0] = iso_name(name, child.is_dir, used[0])
+      child.ident[1] = joliet_name(name, used[1])
+      joliet = child.ident[1].decode("utf-16-be")
+      if joliet != name:
+        self.renamed.append((child.path, joliet))
+      if child.is_dir:
+        self._name(child)
+
+  def _path_table_order(self, tree):
+    """Directories in path table order: by level, parent, identifier."""
+    self.root.number[tree] = 1
+    ordered = [self.root]
+    level = [self.root]
+    while level:
+      next_level = []
+      for parent in level:
+        for child in parent.sorted_children(tree):
+          if child.is_dir:
+            next_level.append(child)
+      for node in next_level:
+        ordered.append(node)
+        node.number[tree] = len(ordered)
+      level = next_level
+    return ordered
+
+  def _records(self, node, tree):
+    """Sizes of the directory records of node, including . and .."""
+    sizes = [record_size(1, len(self._system_use(node, True, tree))),
+             record_size(1, len(self._system_use(node.parent, None, tree)))]
+    for child in node.sorted_children(tree):
+      size = record_size(len(child.ident[tree]),
+                         len(self._system_use(child, False, tree)))
+      sizes.extend([size] * extent_count(child))
+    return sizes
+
+  def _add_rock_ridge(self, node, dot):
+    """Splits the Rock Ridge entries of a record of the primary tree.
+
+    Entries that don't fit in the record go to a continuation area. The
+    . record of the root also starts the System Use Sharing Protocol and
+    identifies the extension.
+
+    Args:
+      node: Node the record describes
+      dot: True for the . record of node
+    """
+    if dot:
+      attributes, names = rock_ridge_entries(True)
+      ident = b"\x00"
+    else:
+      attributes, names = rock_ridge_entries(node.is_dir, node.name)
+      ident = node.ident[0]
+    continuation = b""
+    if dot and node is self.root:
+      attributes = b"SP\x07\x01\xbe\xef\x00" + attributes
+      continuation = susp_entry(b"ER", struct.pack(
+          "4B", len(RRIP_ID), len(RRIP_DESCRIPTOR), len(RRIP_SOURCE), 1) +
+                                RRIP_ID + RRIP_DESCRIPTOR + RRIP_SOURCE)
+    elif record_size(len(ident), len(attributes + names)) > MAX_RECORD:
+      continuation = names
+    else:
+      attributes += names
+    self.rock_ridge[(node, dot)] = [attributes, continuation, None]
+    if continuation:
+      directory = node if dot else node.parent
+      self.continuations.setdefault(directory, []).append((node, dot))
+
+  def _system_use(self, node, dot, tree):
+    """Encodes the system use field of a record.
+
+    Args:
+      node: Node the record describes
+      dot: True for the . record of node, False for its record in its
+           parent, None for the .. record of its children
+      tree: 0 for the primary tree, which has Rock Ridge entries
+
+    Returns:
+      Bytes of the field
+    """
+    if tree != 0:
+      return b""
+    if dot is None:
+      return b"".join(rock_ridge_entries(True))
+    attributes, continuation, location = self.rock_ridge[(node, dot)]
+    if not continuation:
+      return attributes
+    location, offset = location or (0, 0)
+    return attributes + susp_entry(b"CE", both32(location) + both32(offset) +
+                                   both32(len(continuation)))
+
+  def _layout(self):
+    """Places descriptors, path tables, directories and files."""
+    location = DESCRIPTORS + 3
+    self.path_tables = []
+    for tree in (0, 1):
+      self.dirs[tree] = self._path_table_order(tree)
+      size = sum([8 + len(self._dir_ident(node, tree)) +
+                  len(self._dir_ident(node, tree)) % 2
+                  for node in self.dirs[tree]])
+      # L and M tables
+      self.path_tables.append((size, location, location + sectors(size)))
+      location += 2 * sectors(size)
+
+    for node in self.dirs[0]:
+      self._add_rock_ridge(node, True)
+      for child in node.sorted_children(0):
+        self._add_rock_ridge(child, False)
+
+    for tree in (0, 1):
+      for node in self.dirs[tree]:
+        used = 0
+        for size in self._records(node, tree):
+          if used % SECTOR + size > SECTOR:
+            used += SECTOR - used % SECTOR
+          used += size
+        node.dir_location[tree] = location
+        node.dir_size[tree] = sectors(used) * SECTOR
+        location += sectors(used)
+
+        # continuation areas follow the directory, where readers going
+        # through the image in order find them
+        used = 0
+        for key in self.continuations.get(node, []) if tree == 0 else []:
+          size = len(self.rock_ridge[key][1])
+          if used % SECTOR + size > SECTOR:
+            used += SECTOR - used % SECTOR
+          self.rock_ridge[key][2] = (location + used // SECTOR, used % SECTOR)
+          used += size
+        location += sectors(used)
+
+    # identical files, e.g. hard links, share their data
+    placed = {}
+    for node in self._walk(self.root):
+      if node.is_dir or not node.size:
+        continue
+      if node.inode in placed:
+        node.location = placed[node.inode].location
+        continue
+      placed[node.inode] = node
+      node.location = location
+      location += sectors(node.size)
+      self.files.append(node)
+    self.volume_size = location
+
+  def _dir_ident(self, node, tree):
+    """Path table identifier of a directory."""
+    return node.ident[tree] if node is not self.root else b"\x00"
+
+  def _record(self, node, ident, tree, location=None, size=None, flags=0,
+              system_use=b""):
+    """Encodes a directory record."""
+    if node.is_dir:
+      location = node.dir_location[tree]
+      size = node.dir_size[tree]
+      flags |= FLAG_DIRECTORY
+      date = self.date or 0
+    else:
+      date = node.mtime
+    record = (both32(location) + both32(size) + record_date(date) +
+              struct.pack("3B", flags, 0, 0) + both16(1) +
+              struct.pack("B", len(ident)) + ident)
+    if len(ident) % 2 == 0:
+      record += b"\x00"
+    record += system_use
+    if len(record) % 2:
+      record += b"\x00"
+    return struct.pack("2B", len(record) + 2, 0) + record
+
+  def _directory(self, node, tree):
+    """Encodes the directory records of node."""
+    records = [self._record(node, b"\x00", tree,
+                            system_use=self._system_use(node, True, tree)),
+               self._record(node.parent, b"\x01", tree,
+                            system_use=self._system_use(node, None, tree))]
+    for child in node.sorted_children(tree):
+      system_use = self._system_use(child, False, tree)
+      if child.is_dir:
+        records.append(self._record(child, child.ident[tree], tree,
+                                    system_use=system_use))
+        continue
+      remaining = child.size
+      location = child.location
+      while True:
+        size = min(remaining, MAX_EXTENT)
+        remaining -= size
+        flags = FLAG_MULTI_EXTENT if remaining else 0
+        records.append(self._record(child, child.ident[tree], tree, location,
+                                    size, flags, system_use))
+        location += sectors(size)
+        if not remaining:
+          break
+
+    data = b""
+    for record in records:
+      if len(data) % SECTOR + len(record) > SECTOR:
+        data += b"\x00" * (SECTOR - len(data) % SECTOR)
+      data += record
+    return data + b"\x00" * (node.dir_size[tree] - len(data))
+
+  def _path_table(self, tree, big_endian):
+    """Encodes the path table of tree."""
+    order = ">" if big_endian else "<"
+    data = b""
+    for node in self.dirs[tree]:
+      ident = self._dir_ident(node, tree)
+      data += struct.pack(order + "BBIH", len(ident), 0,
+                          node.dir_location[tree],
+                          node.parent.number[tree]) + ident
+      if len(ident) % 2:
+        data += b"\x00"
+    return data
+
+  def _descriptor(self, tree):
+    """Encodes the primary (tree 0) or Joliet (tree 1) volume descriptor."""
+    joliet = tree == 1
+    volume_id = self.volume_id
+    if not joliet:
+      volume_id = D_CHARS_RE.sub("_", volume_id.upper())
+    size, l_table, m_table = self.path_tables[tree]
+    date = volume_date(self.date or 0)
+
+    data = (struct.pack("B", tree + 1) + b"CD001\x01\x00" +
+            pad_text("", 32, joliet) + pad_text(volume_id, 32, joliet) +
+            b"\x00" * 8 + both32(self.volume_size) +
+            (JOLIET_ESCAPE if joliet else b"").ljust(32, b"\x00") +
+            both16(1) + both16(1) + both16(SECTOR) + both32(size) +
+            struct.pack("<II", l_table, 0) + struct.pack(">II", m_table, 0) +
+            self._record(self.root, b"\x00", tree) +
+            pad_text("", 128, joliet) * 4 + pad_text("", 37, joliet) * 3 +
+            date + date + volume_date(None) + date + b"\x01\x00")
+    return data.ljust(SECTOR, b"\x00")
+
+  def metadata(self):
+    """Encodes everything written before the first file extent.
+
+    Returns:
+      Bytes of the system area, descriptors, path tables and directories
+    """
+    terminator = (b"\xffCD001\x01").ljust(SECTOR, b"\x00")
+    parts = [b"\x00" * (DESCRIPTORS * SECTOR), self._descriptor(0),
+             self._descriptor(1), terminator]
+    for tree in (0, 1):
+      size = sectors(self.path_tables[tree][0]) * SECTOR
+      parts.append(self._path_table(tree, False).ljust(size, b"\x00"))
+      parts.append(self._path_table(tree, True).ljust(size, b"\x00"))
+    for tree in (0, 1):
+      for node in self.dirs[tree]:
+        parts.append(self._directory(node, tree))
+        if tree == 0:
+          parts.append(self._continuation_areas(node))
+    return b"".join(parts)
+
+  def _continuation_areas(self, node):
+    """Encodes the continuation areas of the records of a directory."""
+    start = node.dir_location[0] + node.dir_size[0] // SECTOR
+    data = b""
+    for key in self.continuations.get(node, []):
+      location, offset = self.rock_ridge[key][2]
+      data += b"\x00" * ((location - start) * SECTOR + offset - len(data))
+      data += self.rock_ridge[key][1]
+    return data.ljust(sectors(len(data)) * SECTOR, b"\x00")
+
+  def write(self, destination):
+    """Writes the image.
+
+    Args:
+      destination: Path to the image file
+    """
+    out_file = open(destination, "wb", 0)
+    try:
+      out_file.write(self.metadata())
+      for node in self.files:
+        copy_data(out_file, node.path, node.size)
+    finally:
+      out_file.close()
+
+
+def pad_text(text, length, joliet):
+  """Encodes a descriptor text field padded with spaces.
+
+  Args:
+    text: Text of the field
+    length: Length of the field in bytes
+    joliet: Encode in UCS-2 for the Joliet descriptor
+
+  Returns:
+    Bytes of the field
+  """
+  if not joliet:
+    return text.encode("ascii")[:length].ljust(length, b" ")
+  data = text.encode("utf-16-be")[:length - length % 2]
+  data += " ".encode("utf-16-be") * ((length - len(data)) // 2)
+  return data.ljust(length, b"\x00")
+
+
+def extent_count(node):
+  """Number of extents, hence directory records, of a node."""
+  if node.is_dir or not node.size:
+    return 1
+  return (node.size + MAX_EXTENT - 1) // MAX_EXTENT
+
+
+def copy_data(out_file, path, size):
+  """Copies a file into the image and pads it to a whole sector.
+
+  Uses sendfile when the system supports it for regular files, buffered
+  writes otherwise.
+
+  Args:
+    out_file: Unbuffered image file
+    path: Path to the file
+    size: Size of the file when the layout was computed
+  """
+  copied = 0
+  with open(path, "rb") as src_file:
+    if sendfile:
+      try:
+        while copied < size:
+          sent = sendfile(out_file.fileno(), src_file.fileno(), copied,
+                          min(size - copied, MAX_EXTENT))
+          if not sent:
+            break
+          copied += sent
+      except OSError as e:
+        if e.errno not in (errno.EINVAL, errno.ENOSYS, errno.ENOTSOCK,
+                           errno.EOPNOTSUPP):
+          raise
+        src_file.seek(copied)
+
+    while copied < size:
+      block = src_file.read(min(size - copied, BUFFER_SIZE))
+      if not block:
+        break
+      out_file.write(block)
+      copied += len(block)
+
+  if copied < size:
+    logging.warning(path + " shrank while writing the image, padding it.")
+  out_file.write(b"\x00" * (size - copied + (-size) % SECTOR))
+
+
+def write_iso(source, destination, filelist=None, volume_id="", index=None):
+  """Writes an ISO image of a directory.
+
+  Args:
+    source: Directory the image is made from
+    destination: Path to the image file
+    filelist: Files and empty directories under source to include, the
+              whole directory if None
+    volume_id: Volume name
+    index: ContentIndex holding source, source is stated if None
+
+  Returns:
+    List of (path, Joliet name) of the files and directories whose name
+    was shortened or changed in the image
+  """
+  image = IsoImage(source, filelist, volume_id, index)
+  image.write(destination)
+  return image.renamed
@@ -0,0 +1,343 @@
+# Copyright 2015 The Offline Content Packager Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Planning of split volumes.
+
+Files are packed into volumes with first-fit decreasing, counting what each
+file and directory costs in the output format: ISO 9660 sectors and
+directory records, or zip headers.
+"""
+import logging
+from os.path import basename
+from os.path import dirname
+from os.path import join
+from os.path import relpath
+from os.path import sep
+
+from .index import ContentIndex
+from .iso9660 import CE_LENGTH
+from .iso9660 import IsoImage
+from .iso9660 import JOLIET_NAME_MAX
+from .iso9660 import MAX_RECORD
+from .iso9660 import record_size
+from .iso9660 import rock_ridge_entries
+from .iso9660 import SECTOR
+from .iso9660 import sectors
+from .iso9660 import ucs2_length
+from .zip64 import ZIP64_LIMIT
+
+MB = 1024 * 1024
+
+# capacity of storage media in bytes
+SINGLE_LAYER_DVD = 2295104 * SECTOR
+DUAL_LAYER_DVD = 4171712 * SECTOR
+FLASH_16GB = 16 * 1000 * 1000 * 1000
+
+
+class IsoModel(object):
+  """Size of content in an ISO 9660 image with Rock Ridge and Joliet names.
+
+  Costs are upper bounds: every directory is charged a sector per tree on
+  top of the records it holds, and names moved to a continuation area are
+  charged in full.
+  """
+
+  # system area, descriptors, 4 path tables, the root directories and the
+  # continuation area identifying Rock Ridge
+  fixed = (16 + 3 + 4 + 2 + 1) * SECTOR
+
+  def file_cost(self, name, size):
+    """Bytes used by a file: data sectors and a record in each tree."""
+    return sectors(size) * SECTOR + self._records(basename(name))
+
+  def dir_cost(self, name):
+    """Bytes used by a directory: its extents, records and path tables."""
+    name = basename(name)
+    return 2 * SECTOR + self._records(name) + 4 * (9 + 2 * len(name))
+
+  def empty_dir_cost(self, name):  # pylint: disable=unused-argument
+    """Bytes used by an empty directory, besides dir_cost."""
+    return 0
+
+  def _records(self, name):  # pylint: disable=no-self-use
+    """Bytes of the directory records of name in both trees."""
+    attributes, names = rock_ridge_entries(False, name)
+    primary = record_size(14, len(attributes + names))
+    if primary > MAX_RECORD:
+      primary = record_size(14, len(attributes) + CE_LENGTH) + len(names)
+    return primary + record_size(2 * min(ucs2_length(name), JOLIET_NAME_MAX))
+
+
+class ZipModel(object):
+  """Size of content in a zip file.
+
+  Files that deflate doesn't make smaller are stored, so no file takes more
+  than its size.
+  """
+
+  # end of central directory records, zip64 included
+  fixed = 22 + 56 + 20
+
+  def file_cost(self, name, size):  # pylint: disable=no-self-use
+    """Bytes used by a file: headers and data."""
+    length = len(name.encode("utf-8"))
+    zip64 = 20 + 28 if size > ZIP64_LIMIT else 28
+    return 30 + 46 + 2 * length + size + zip64
+
+  def dir_cost(self, name):  # pylint: disable=unused-argument
+    """Directories are not stored unless they are empty."""
+    return 0
+
+  def empty_dir_cost(self, name):  # pylint: disable=no-self-use
+    """Bytes used by the entry of an empty directory."""
+    return 30 + 46 + 2 * (len(name.encode("utf-8")) + 1) + 28
+
+
+class FilesModel(object):
+  """Size of content copied as plain files."""
+
+  fixed = 0
+
+  def file_cost(self, name, size):  # pylint: disable=unused-argument
+    """Bytes used by a file."""
+    return size
+
+  def dir_cost(self, name):  # pylint: disable=unused-argument
+    """Directories are not counted."""
+    return 0
+
+  def empty_dir_cost(self, name):  # pylint: disable=unused-argument
+    """Empty directories are not counted."""
+    return 0
+
+
+MODELS = {"iso": IsoModel, "zip": ZipModel, "files": FilesModel}
+
+
+class Item(object):
+  """Files that go on the same volume: one file or a whole section."""
+
+  def __init__(self, key):
+    """Instance variables.
+
+    Args:
+      key: Path of the file or section relative to the packed directory
+    """
+    self.key = key
+    self.paths = []
+    self.dirs = set()
+    self.cost = 0
+    self.size = 0
+
+
+class Volume(object):
+  """Content planned for one output file."""
+
+  def __init__(self):
+    """Instance variables."""
+    self.items = []
+    self.dirs = set()
+    self.cost = 0
+
+  @property
+  def paths(self):
+    """Files and empty directories of the volume, in path order."""
+    return sorted([path for item in self.items for path in item.paths])
+
+  @property
+  def size(self):
+    """Total size of the files of the volume."""
+    return sum([item.size for item in self.items])
+
+
+def list_content(src_dir, index=None):
+  """Lists the files and empty directories to pack.
+
+  Args:
+    src_dir: Directory to pack
+    index: ContentIndex holding src_dir, src_dir is scanned if None
+
+  Returns:
+    List of (path, size, is_dir) tuples, in walk order
+  """
+  if index is None:
+    index = ContentIndex(src_dir).scan()
+  content = []
+  for dir_path, dir_names, file_names in index.walk(src_dir):
+    dir_names.sort()
+    for name in sorted(file_names):
+      path = join(dir_path, name)
+      content.append((path, index.stat(path)[0], False))
+    if not dir_names and not file_names:
+      content.append((dir_path, 0, True))
+  return content
+
+
+def section_of(rel, nested):
+  """Gets the section a path belongs to.
+
+  Sections are the top directories, except in the nested directories,
+  such as the videos directory, whose subdirectories are the sections.
+
+  Args:
+    rel: Path relative to the packed directory
+    nested: Top directories holding one section per subdirectory
+
+  Returns:
+    Relative path of the section directory, or rel itself for files at the
+    top level and directly in a nested directory
+  """
+  parts = rel.split(sep)
+  if parts[0] in nested and len(parts) > 2:
+    return join(parts[0], parts[1])
+  return parts[0] if len(parts) > 1 else rel
+
+
+def make_items(src_dir, content, model, keep_sections, nested=()):
+  """Groups content into items to pack.
+
+  Args:
+    src_dir: Directory to pack
+    content: List of (path, size, is_dir) tuples
+    model: Size model of the output format
+    keep_sections: Put every section on a single volume
+    nested: Top directories holding one section per subdirectory
+
+  Returns:
+    List of Item
+  """
+  items = {}
+  for path, size, is_dir in content:
+    rel = relpath(path, src_dir)
+    key = section_of(rel, nested) if keep_sections else rel
+    item = items.get(key)
+    if item is None:
+      item = items[key] = Item(key)
+    item.paths.append(path)
+    item.size += size
+
+    if is_dir:
+      item.cost += model.empty_dir_cost(rel)
+      parent = rel
+    else:
+      item.cost += model.file_cost(rel, size)
+      parent = dirname(rel)
+    while parent:
+      item.dirs.add(parent)
+      parent = dirname(parent)
+  return list(items.values())
+
+
+def plan_volumes(src_dir, capacity, fmt="iso", keep_sections=False,
+                 nested=(), content=None, index=None):
+  """Packs the content of a directory into as few volumes as possible.
+
+  Args:
+    src_dir: Directory to pack
+    capacity: Maximum size of a volume in bytes
+    fmt: Output format, "iso", "zip" or "files"
+    keep_sections: Put every section (and its index.html and html_files)
+                   on a single volume when it fits
+    nested: Top directories holding one section per subdirectory
+    content: List of (path, size, is_dir) tuples, src_dir is listed if None
+    index: ContentIndex holding src_dir, src_dir is scanned if None
+
+  Returns:
+    List of Volume
+  """
+  model = MODELS[fmt]()
+  if index is None and (content is None or fmt == "iso"):
+    index = ContentIndex(src_dir).scan()
+  if content is None:
+    content = list_content(src_dir, index)
+  items = make_items(src_dir, content, model, keep_sections, nested)
+
+  # sections that can't fit on a volume are split into files
+  if keep_sections:
+    for item in list(items):
+      if model.fixed + cost_in(model, item, set()) > capacity:
+        logging.warning("Section " + item.key + " doesn't fit on a volume, "
+                        "splitting it.")
+        items.remove(item)
+        paths = set(item.paths)
+        items.extend(make_items(src_dir, [entry for entry in content
+                                          if entry[0] in paths],
+                                model, False))
+
+  volumes = []
+  items.sort(key=lambda item: (-cost_in(model, item, set()), item.key))
+  for item in items:
+    place(model, volumes, item, capacity)
+
+  if fmt == "iso":
+    check_iso_volumes(src_dir, model, volumes, capacity, index)
+  return volumes
+
+
+def cost_in(model, item, dirs):
+  """Bytes an item adds to a volume holding dirs."""
+  return item.cost + sum([model.dir_cost(name) for name in item.dirs - dirs])
+
+
+def place(model, volumes, item, capacity):
+  """Adds an item to the first volume it fits in, or to a new volume.
+
+  Args:
+    model: Size model of the output format
+    volumes: List of Volume
+    item: Item to place
+    capacity: Maximum size of a volume in bytes
+  """
+  for volume in volumes:
+    cost = cost_in(model, item, volume.dirs)
+    if volume.cost + cost <= capacity:
+      break
+  else:
+    volume = Volume()
+    volume.cost = model.fixed
+    volumes.append(volume)
+    cost = cost_in(model, item, volume.dirs)
+    if volume.cost + cost > capacity:
+      logging.warning(item.key + " is bigger than a volume.")
+  volume.items.append(item)
+  volume.dirs.update(item.dirs)
+  volume.cost += cost
+
+
+def check_iso_volumes(src_dir, model, volumes, capacity, index=None):
+  """Moves items out of ISO volumes whose exact layout doesn't fit.
+
+  Args:
+    src_dir: Directory to pack
+    model: Size model of the output format
+    volumes: List of Volume, updated with the exact image sizes
+    capacity: Maximum size of a volume in bytes
+    index: ContentIndex holding src_dir, the files are stated if None
+  """
+  i = 0
+  while i < len(volumes):
+    volume = volumes[i]
+    volume.cost = IsoImage(src_dir, volume.paths,
+                           index=index).volume_size * SECTOR
+    if volume.cost > capacity and len(volume.items) > 1:
+      item = min(volume.items, key=lambda item: (item.cost, item.key))
+      volume.items.remove(item)
+      volume.dirs = set()
+      for other in volume.items:
+        volume.dirs.update(other.dirs)
+      others = volumes[i + 1:]
+      place(model, others, item, capacity)
+      volumes[i + 1:] = others
+      continue
+    i += 1
@@ -0,0 +1,282 @@
+# Copyright 2015 The Offline Content Packager Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Placement of media files in the bundle output.
+
+Files can be copied, hard linked, reflinked (copy-on-write clones) or
+symlinked to the source. When a strategy is not possible, e.g. source and
+destination are on different filesystems, the file is copied instead.
+Files with the same content are stored once in the output.
+
+Symlinks point to the source with a relative path: the output can be moved
+along with the source tree, but not on its own.
+"""
+import errno
+import hashlib
+import logging
+from os import link
+from os import lstat
+from os import stat
+from os import unlink
+from os.path import dirname
+from os.path import isfile
+from os.path import islink
+from os.path import realpath
+from os.path import relpath
+import shutil
+import threading
+
+import click
+
+try:
+  from os import symlink
+except ImportError:
+  symlink = None
+try:
+  from os import copy_file_range
+except ImportError:
+  copy_file_range = None
+try:
+  import fcntl
+except ImportError:
+  fcntl = None
+
+STRATEGIES = ["copy", "hardlink", "reflink", "symlink"]
+
+# ioctl request cloning a whole file on Linux (btrfs, xfs, ...)
+FICLONE = 0x40049409
+
+
+def place_file(src, dst, strategy="copy"):
+  """Places src at dst.
+
+  Args:
+    src: Path to source file
+    dst: Path to destination file, must not exist
+    strategy: One of STRATEGIES
+
+  Returns:
+    Strategy actually used, "copy" if strategy was not possible
+  """
+  if strategy == "hardlink":
+    try:
+      link(src, dst)
+      return "hardlink"
+    except OSError as e:
+      logging.debug("Can't hard link " + src + ": " + str(e))
+
+  elif strategy == "symlink" and symlink:
+    try:
+      relative_symlink(src, dst)
+      return "symlink"
+    except (OSError, NotImplementedError) as e:
+      logging.debug("Can't symlink " + src + ": " + str(e))
+
+  elif strategy == "reflink":
+    if reflink(src, dst):
+      shutil.copystat(src, dst)
+      return "reflink"
+
+  shutil.copy2(src, dst)
+  return "copy"
+
+
+def relative_symlink(target, dst):
+  """Creates a symlink at dst pointing to target with a relative path.
+
+  Args:
+    target: Path to the file linked to
+    dst: Path to the symlink, must not exist
+  """
+  symlink(relpath(realpath(target), realpath(dirname(dst) or ".")), dst)
+
+
+def reflink(src, dst):
+  """Clones src to dst without copying data, if the filesystem allows it.
+
+  Uses the FICLONE ioctl, then copy_file_range which lets the kernel share
+  or offload the copy.
+
+  Args:
+    src: Path to source file
+    dst: Path to destination file
+
+  Returns:
+    True if dst was created
+  """
+  if not fcntl and not copy_file_range:
+    return False
+
+  with open(src, "rb") as src_file:
+    with open(dst, "wb") as dst_file:
+      if fcntl:
+        try:
+          fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+          return True
+        except (IOError, OSError) as e:
+          logging.debug("Can't clone " + src + ": " + str(e))
+
+      if copy_file_range:
+        try:
+          while copy_file_range(src_file.fileno(), dst_file.fileno(),
+                                1 << 30):
+            pass
+          return True
+        except OSError as e:
+          logging.debug("Can't copy_file_range " + src + ": " + str(e))
+
+  unlink(dst)
+  return False
+
+
+def file_digest(path):
+  """Gets the SHA-1 digest of a file.
+
+  Args:
+    path: Path to file
+
+  Returns:
+    Hex digest of the file content
+  """
+  sha = hashlib.sha1()
+  with open(path, "rb") as data_file:
+    for block in iter(lambda: data_file.read(1024 * 1024), b""):
+      sha.update(block)
+  return sha.hexdigest()
+
+
+class Placer(object):
+  """Places files in the bundle output, storing identical files once.
+
+  The first copy of a content is placed with the configured strategy;
+  later files with the same content are hard linked to it, or symlinked to
+  the same source when it is a symlink. Candidates are
+  found by source inode, then by size, so only files whose size matches
+  an already placed file are hashed. Files of the same size are placed one
+  at a time, so that two identical files placed by different threads are
+  still stored once.
+  """
+
+  def __init__(self, strategy="copy"):
+    """Instance variables.
+
+    Args:
+      strategy: One of STRATEGIES
+
+    Raises:
+      ValueError: if strategy is unknown
+    """
+    if strategy not in STRATEGIES:
+      raise ValueError("Unknown media placement '%s', use one of %s" %
+                       (strategy, ", ".join(STRATEGIES)))
+    self.strategy = strategy
+    self.lock = threading.Lock()
+    self.size_locks = {}
+    self.by_inode = {}
+    self.by_size = {}
+    self.digests = {}
+
+  def place(self, src, dst):
+    """Places src at dst, replacing dst if it exists.
+
+    Args:
+      src: Path to source file
+      dst: Path to destination file
+
+    Returns:
+      Strategy used, or "dedupe" if dst was linked to an identical file
+    """
+    # never write through an existing link to the source
+    try:
+      lstat(dst)
+      unlink(dst)
+    except OSError as e:
+      if e.errno != errno.ENOENT:
+        raise
+
+    info = stat(src)
+    with self.lock:
+      size_lock = self.size_locks.setdefault(info.st_size, threading.Lock())
+    # held until the placed file is registered, so that a file placed at
+    # the same time with the same content finds it
+    with size_lock:
+      duplicate = self._find_duplicate(src, info)
+      if duplicate:
+        try:
+          if islink(duplicate):
+            relative_symlink(duplicate, dst)
+          else:
+            link(duplicate, dst)
+          return "dedupe"
+        except OSError as e:
+          logging.debug("Can't link " + dst + " to " + duplicate + ": " +
+                        str(e))
+
+      method = place_file(src, dst, self.strategy)
+      with self.lock:
+        self.by_inode[(info.st_dev, info.st_ino)] = dst
+        self.by_size.setdefault(info.st_size, []).append(dst)
+    return method
+
+  def _find_duplicate(self, src, info):
+    """Finds a placed file with the same content as src.
+
+    Args:
+      src: Path to source file
+      info: stat of src
+
+    Returns:
+      Path to the placed file, or None
+    """
+    with self.lock:
+      placed = self.by_inode.get((info.st_dev, info.st_ino))
+      candidates = list(self.by_size.get(info.st_size, []))
+    if placed and self._unchanged(placed, info):
+      return placed
+
+    digest = None
+    for candidate in candidates:
+      if not self._unchanged(candidate, info):
+        continue
+      digest = digest or file_digest(src)
+      with self.lock:
+        known = self.digests.get(candidate)
+      if not known:
+        known = file_digest(candidate)
+        with self.lock:
+          self.digests[candidate] = known
+      if known == digest:
+        return candidate
+    return None
+
+  def _unchanged(self, placed, info):  # pylint: disable=no-self-use
+    """Checks that a placed file still exists with the size of info."""
+    return isfile(placed) and stat(placed).st_size == info.st_size
+
+
+def create_placer(strategy):
+  """Creates a Placer from the media_placement config value.
+
+  Args:
+    strategy: Value of media_placement, None for the default
+
+  Returns:
+    Placer, copying files if strategy is not valid
+  """
+  try:
+    return Placer(strategy or "copy")
+  except ValueError as e:
+    click.echo(click.style(str(e) + ". Copying media files.", fg="red"))
+    logging.error(str(e))
+    return Placer("copy")
@@ -0,0 +1,225 @@
+# Copyright 2015 The Offline Content Packager Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Timings of the stages of a command.
+
+The commands record the time spent in each stage (reading the config,
+scanning, transforming HTML, copying media, downloading thumbnails,
+rendering templates, building zip and ISO files) on PROFILER, which does
+nothing until it is started. Files processed by several workers at the
+same time add up their own times, so the time of a stage can be more than
+the wall time of the command. A stage timed inside another one, such as a
+template rendered while a video is copied, is only counted in the inner
+stage.
+"""
+import contextlib
+from datetime import datetime
+import json
+import threading
+import time
+
+import click
+
+REPORT_VERSION = 1
+
+
+class Profiler(object):
+  """Accumulates time, files and bytes per stage, section and transformation.
+  """
+
+  def __init__(self):
+    """Instance variables."""
+    self.enabled = False
+    self.lock = threading.Lock()
+    # timers running in each thread, innermost last
+    self.local = threading.local()
+    self.command = None
+    self.started = None
+    self.start_time = None
+    self.wall = None
+    self.stages = {}
+    self.sections = {}
+    self.transformations = {}
+
+  def start(self, command):
+    """Clears the timings and starts recording.
+
+    Args:
+      command: Name of the profiled command
+    """
+    with self.lock:
+      self.enabled = True
+      self.command = command
+      self.started = datetime.now().isoformat()
+      self.start_time = time.time()
+      self.wall = None
+      self.stages = {}
+      self.sections = {}
+      self.transformations = {}
+
+  def stop(self):
+    """Stops recording and sets the wall time of the command."""
+    with self.lock:
+      if self.enabled:
+        self.wall = time.time() - self.start_time
+      self.enabled = False
+
+  def add(self, stage, seconds, files=0, size=0, section=None,
+          transformation=None):
+    """Records work done in a stage.
+
+    Args:
+      stage: Name of the stage
+      seconds: Time spent
+      files: Number of files processed
+      size: Number of bytes processed
+      section: Section the files belong to, if any
+      transformation: Transformation applied to the files, if any
+    """
+    if not self.enabled:
+      return
+    with self.lock:
+      totals = [self.stages.setdefault(stage, new_totals())]
+      if section is not None:
+        totals.append(self.sections.setdefault(section, new_totals()))
+      if transformation is not None:
+        totals.append(self.transformations.setdefault(transformation,
+                                                      new_totals()))
+      for total in totals:
+        total["seconds"] += seconds
+        total["calls"] += 1
+        total["files"] += files
+        total["bytes"] += size
+
+  @contextlib.contextmanager
+  def stage(self, name, files=0, size=0, section=None):
+    """Times the body of a with statement as a stage.
+
+    Args:
+      name: Name of the stage
+      files: Number of files processed
+      size: Number of bytes processed
+      section: Section the files belong to, if any
+
+    Yields:
+      Nothing
+    """
+    try:
+      with self.timer() as timer:
+        yield
+    finally:
+      self.add(name, timer.seconds, files, size, section)
+
+  @contextlib.contextmanager
+  def timer(self):
+    """Times the body of a with statement, leaving out the nested timers.
+
+    The time of the body is also left out of the timer it runs in, if any,
+    so that work waited for, or recorded in another stage, is only counted
+    once.
+
+    Yields:
+      Timer whose seconds are set when the body is done
+    """
+    timers = self.local.__dict__.setdefault("timers", [])
+    timer = Timer()
+    timers.append(timer)
+    start = time.time()
+    try:
+      yield timer
+    finally:
+      elapsed = time.time() - start
+      timers.pop()
+      if timers:
+        timers[-1].nested += elapsed
+      timer.seconds = elapsed - timer.nested
+
+  def report(self):
+    """Builds the report of the recorded timings.
+
+    Returns:
+      Dictionary of the command, its wall time and the totals with their
+      rates per stage, section and transformation
+    """
+    with self.lock:
+      wall = self.wall
+      if wall is None and self.start_time is not None:
+        wall = time.time() - self.start_time
+      return {
+          "version": REPORT_VERSION,
+          "command": self.command,
+          "started": self.started,
+          "wall_seconds": wall,
+          "stages": with_rates(self.stages),
+          "sections": with_rates(self.sections),
+          "transformations": with_rates(self.transformations)
+      }
+
+  def save(self, path):
+    """Writes the report to a JSON file.
+
+    Args:
+      path: Path to the report
+    """
+    with open(path, "w") as report_file:
+      json.dump(self.report(), report_file, indent=2, sort_keys=True)
+
+  def echo(self):
+    """Prints the time, files and rates of each stage."""
+    report = self.report()
+    click.echo("\nProfile of %s: %.2f s" % (report["command"],
+                                            report["wall_seconds"] or 0))
+    for name in sorted(report["stages"]):
+      total = report["stages"][name]
+      click.echo("  %-20s %9.3f s %7d files %10.1f files/s %9.2f MB/s" % (
+          name, total["seconds"], total["files"], total["files_per_second"],
+          total["bytes_per_second"] / 1000000.0))
+
+
+class Timer(object):
+  """Time spent in the body of Profiler.timer."""
+
+  def __init__(self):
+    """Instance variables."""
+    self.seconds = 0.0
+    self.nested = 0.0
+
+
+def new_totals():
+  """Empty totals of a stage, section or transformation."""
+  return {"seconds": 0.0, "calls": 0, "files": 0, "bytes": 0}
+
+
+def with_rates(totals):
+  """Copies totals, adding the files and bytes processed per second.
+
+  Args:
+    totals: Dictionary of totals by name
+
+  Returns:
+    Dictionary of totals with files_per_second and bytes_per_second
+  """
+  result = {}
+  for name, total in totals.items():
+    seconds = total["seconds"]
+    result[name] = dict(total)
+    result[name]["files_per_second"] = (total["files"] / seconds
+                                        if seconds else 0.0)
+    result[name]["bytes_per_second"] = (total["bytes"] / seconds
+                                        if seconds else 0.0)
+  return result
+
+
+# Profiler of the running command
+PROFILER = Profiler()
@@ -0,0 +1,349 @@
+# Copyright 2015 The Offline Content Packager Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Zip writer with Zip64 extensions and parallel compression.
+
+Media files that are already compressed (videos, images, ...) are stored,
+other files are deflated. Files are deflated on worker threads, zlib
+releases the interpreter lock while it compresses, and the archive is
+assembled in order by the calling thread, so the same files always give
+the same archive.
+"""
+import collections
+from os import stat
+from os.path import splitext
+import stat as stat_module
+import struct
+from tempfile import SpooledTemporaryFile
+import time
+import zlib
+
+from .engine import Engine
+
+STORED = 0
+DEFLATED = 8
+DEFAULT_LEVEL = 6
+BUFFER_SIZE = 1024 * 1024
+
+# sizes and offsets above this use Zip64 fields, as in the zipfile module
+ZIP64_LIMIT = (1 << 31) - 1
+ZIP_FILECOUNT_LIMIT = 0xFFFF
+
+# files that don't get smaller when deflated
+STORED_EXTENSIONS = frozenset([
+    ".3gp", ".avi", ".flv", ".m4v", ".mkv", ".mov", ".mp4", ".mpeg", ".mpg",
+    ".ogv", ".webm", ".wmv",
+    ".aac", ".flac", ".m4a", ".mp3", ".oga", ".ogg", ".opus",
+    ".gif", ".jpeg", ".jpg", ".png", ".webp",
+    ".7z", ".bz2", ".gz", ".iso", ".rar", ".xz", ".zip",
+    ".woff", ".woff2",
+])
+
+VERSION = 20
+VERSION_ZIP64 = 45
+# files made on Unix, with Unix permissions in the external attributes
+SYSTEM_UNIX = 3
+FLAG_UTF8 = 0x800
+DIRECTORY_ATTR = (0o40775 << 16) | 0x10
+
+LOCAL_HEADER = struct.Struct("<4s5H3L2H")
+CENTRAL_HEADER = struct.Struct("<4s6H3L5H2L")
+END_RECORD = struct.Struct("<4s4H2LH")
+ZIP64_END_RECORD = struct.Struct("<4sQ2H2L4Q")
+ZIP64_LOCATOR = struct.Struct("<4sLQL")
+
+
+class Member(object):
+  """Entry of the archive."""
+
+  def __init__(self, name, timestamp, external_attr, method=STORED):
+    """Instance variables.
+
+    Args:
+      name: Name in the archive, "/" separated, ending with "/" for
+            directories
+      timestamp: Modification time
+      external_attr: Permissions and file type
+      method: STORED or DEFLATED
+    """
+    self.name = name.encode("utf-8")
+    self.flags = 0 if len(self.name) == len(name) else FLAG_UTF8
+    self.date_time = dos_date_time(timestamp)
+    self.external_attr = external_attr
+    self.method = method
+    self.crc = 0
+    self.size = 0
+    self.compress_size = 0
+    self.offset = 0
+
+  @property
+  def zip64(self):
+    """True if the sizes need Zip64 fields."""
+    return self.size > ZIP64_LIMIT or self.compress_size > ZIP64_LIMIT
+
+  def local_header(self):
+    """Local file header, with a Zip64 extra field for big files."""
+    if self.zip64:
+      extra = struct.pack("<2H2Q", 1, 16, self.size, self.compress_size)
+      sizes = (0xFFFFFFFF, 0xFFFFFFFF)
+    else:
+      extra = b""
+      sizes = (self.compress_size, self.size)
+    return LOCAL_HEADER.pack(
+        b"PK\x03\x04", VERSION_ZIP64 if extra else VERSION, self.flags,
+        self.method, self.date_time[1], self.date_time[0], self.crc,
+        sizes[0], sizes[1], len(self.name), len(extra)) + self.name + extra
+
+  def central_header(self):
+    """Central directory header, with Zip64 fields where needed."""
+    fields = []
+    values = []
+    for value in (self.size, self.compress_size, self.offset):
+      if value > ZIP64_LIMIT:
+        fields.append(value)
+        values.append(0xFFFFFFFF)
+      else:
+        values.append(value)
+
+    extra = b""
+    if fields:
+      extra = struct.pack("<2H%dQ" % len(fields), 1, 8 * len(fields),
+                          *fields)
+    version = VERSION_ZIP64 if extra else VERSION
+    return CENTRAL_HEADER.pack(
+        b"PK\x01\x02", (SYSTEM_UNIX << 8) | version, version, self.flags,
+        self.method, self.date_time[1], self.date_time[0], self.crc,
+        values[1], values[0], len(self.name), len(extra), 0, 0, 0,
+        self.external_attr, values[2]) + self.name + extra
+
+
+class ZipWriter(object):
+  """Writes members one after another, then the central directory."""
+
+  def __init__(self, destination):
+    """Instance variables.
+
+    Args:
+      destination: Path to the zip file
+    """
+    self.out_file = open(destination, "wb")
+    self.members = []
+
+  def add_directory(self, name, info):
+    """Adds an empty directory.
+
+    Args:
+      name: Name in the archive, without the trailing "/"
+      info: stat result of the directory
+    """
+    member = Member(name + "/", info.st_mtime, DIRECTORY_ATTR)
+    self._start(member)
+
+  def add_stored(self, path, name, info):
+    """Copies a file into the archive, computing its CRC on the way.
+
+    Args:
+      path: Path to the file
+      name: Name in the archive
+      info: stat result of the file
+    """
+    member = Member(name, info.st_mtime, (info.st_mode & 0xFFFF) << 16)
+    member.size = member.compress_size = info.st_size
+    self._start(member)
+
+    crc = 0
+    size = 0
+    with open(path, "rb") as src_file:
+      while True:
+        block = src_file.read(BUFFER_SIZE)
+        if not block:
+          break
+        crc = zlib.crc32(block, crc)
+        size += len(block)
+        self.out_file.write(block)
+
+    zip64 = member.zip64
+    member.crc = crc & 0xFFFFFFFF
+    member.size = member.compress_size = size
+    if member.zip64 != zip64:
+      raise IOError(path + " changed size while writing the zip file")
+    end = self.out_file.tell()
+    self.out_file.seek(member.offset)
+    self.out_file.write(member.local_header())
+    self.out_file.seek(end)
+
+  def add_deflated(self, name, info, deflated):
+    """Adds a file deflated by deflate_file.
+
+    Args:
+      name: Name in the archive
+      info: stat result of the file
+      deflated: Result of deflate_file
+    """
+    data, crc, size = deflated
+    member = Member(name, info.st_mtime, (info.st_mode & 0xFFFF) << 16,
+                    DEFLATED)
+    member.crc = crc
+    member.size = size
+    member.compress_size = data.tell()
+    self._start(member)
+    data.seek(0)
+    while True:
+      block = data.read(BUFFER_SIZE)
+      if not block:
+        break
+      self.out_file.write(block)
+    data.close()
+
+  def _start(self, member):
+    """Writes the local header of a member."""
+    member.offset = self.out_file.tell()
+    self.out_file.write(member.local_header())
+    self.members.append(member)
+
+  def close(self):
+    """Writes the central directory and closes the file."""
+    start = self.out_file.tell()
+    for member in self.members:
+      self.out_file.write(member.central_header())
+    end = self.out_file.tell()
+
+    count = len(self.members)
+    size = end - start
+    if (count > ZIP_FILECOUNT_LIMIT or size > ZIP64_LIMIT or
+        start > ZIP64_LIMIT):
+      self.out_file.write(ZIP64_END_RECORD.pack(
+          b"PK\x06\x06", ZIP64_END_RECORD.size - 12,
+          (SYSTEM_UNIX << 8) | VERSION_ZIP64, VERSION_ZIP64, 0, 0, count,
+          count, size, start))
+      self.out_file.write(ZIP64_LOCATOR.pack(b"PK\x06\x07", 0, end, 1))
+      count = min(count, ZIP_FILECOUNT_LIMIT)
+      size = min(size, 0xFFFFFFFF)
+      start = min(start, 0xFFFFFFFF)
+    self.out_file.write(END_RECORD.pack(b"PK\x05\x06", 0, 0, count, count,
+                                        size, start, 0))
+    self.out_file.close()
+
+  def abort(self):
+    """Closes the file, leaving the archive unfinished if close wasn't
+    called."""
+    self.out_file.close()
+
+
+def dos_date_time(timestamp):
+  """Gets the (date, time) of a timestamp in MS-DOS format."""
+  date_time = time.localtime(timestamp)[:6]
+  if date_time[0] < 1980:
+    date_time = (1980, 1, 1, 0, 0, 0)
+  elif date_time[0] > 2107:
+    date_time = (2107, 12, 31, 23, 59, 59)
+  year, month, day, hour, minute, second = date_time
+  return ((year - 1980) << 9 | month << 5 | day,
+          hour << 11 | minute << 5 | second // 2)
+
+
+def compression_for(name, level=DEFAULT_LEVEL,
+                    stored_extensions=STORED_EXTENSIONS):
+  """Gets the compression method of a file.
+
+  Args:
+    name: File name
+    level: Compression level, 0 stores every file
+    stored_extensions: Extensions of the files that are stored
+
+  Returns:
+    STORED or DEFLATED
+  """
+  if not level or splitext(name)[1].lower() in stored_extensions:
+    return STORED
+  return DEFLATED
+
+
+def deflate_file(path, level=DEFAULT_LEVEL):
+  """Deflates a file into a temporary file.
+
+  Args:
+    path: Path to the file
+    level: Compression level
+
+  Returns:
+    (temporary file, CRC, size) tuple, or None if deflating doesn't make
+    the file smaller
+  """
+  compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+  data = SpooledTemporaryFile(BUFFER_SIZE)
+  crc = 0
+  size = 0
+  with open(path, "rb") as src_file:
+    while True:
+      block = src_file.read(BUFFER_SIZE)
+      if not block:
+        break
+      crc = zlib.crc32(block, crc)
+      size += len(block)
+      data.write(compressor.compress(block))
+  data.write(compressor.flush())
+
+  if data.tell() >= size:
+    data.close()
+    return None
+  return data, crc & 0xFFFFFFFF, size
+
+
+def write_zip(entries, destination, level=DEFAULT_LEVEL,
+              stored_extensions=STORED_EXTENSIONS, jobs=1):
+  """Writes a zip file.
+
+  Up to a few files per job are deflated ahead of the one being written.
+
+  Args:
+    entries: List of (path, name in the archive) tuples, of files and
+             empty directories
+    destination: Path to the zip file
+    level: Compression level of deflated files, 0 stores every file
+    stored_extensions: Extensions of the files that are stored
+    jobs: Number of files deflated at the same time
+  """
+  engine = Engine(jobs, processes=False)
+  writer = ZipWriter(destination)
+  pending = collections.deque()
+  entries = iter(entries)
+  try:
+    while True:
+      while len(pending) < 4 * engine.jobs:
+        entry = next(entries, None)
+        if entry is None:
+          break
+        path, name = entry
+        info = stat(path)
+        handle = None
+        if (not stat_module.S_ISDIR(info.st_mode) and
+            compression_for(name, level, stored_extensions) == DEFLATED):
+          handle = engine.run(deflate_file, (path, level))
+        pending.append((path, name, info, handle))
+      if not pending:
+        break
+
+      path, name, info, handle = pending.popleft()
+      deflated = handle.get() if handle else None
+      if stat_module.S_ISDIR(info.st_mode):
+        writer.add_directory(name, info)
+      elif deflated:
+        writer.add_deflated(name, info, deflated)
+      else:
+        writer.add_stored(path, name, info)
+    writer.close()
+  finally:
+    writer.abort()
+    engine.close()
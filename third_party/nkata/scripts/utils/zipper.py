@@ -15,27 +15,38 @@
 """Zip conversion script.
 """
 import logging
-from os import walk
+from os.path import getsize
 from os.path import isdir
-from os.path import join
 from os.path import normcase
 from os.path import sep
 from os.path import split
-import zipfile
+import time
 
 import click
+from .index import ContentIndex
+from .profiler import PROFILER
+from .zip64 import DEFAULT_LEVEL
+from .zip64 import STORED_EXTENSIONS
+from .zip64 import write_zip
 
 
 def to_zip(dir_path=None, zip_file_path=None, include_dir_in_path=True,
-           filelist=None):
+           filelist=None, level=DEFAULT_LEVEL,
+           stored_extensions=STORED_EXTENSIONS, jobs=1):
   """Verify path, the calls trim_path method.
 
+  Media files are stored as they are, other files are deflated, on several
+  threads if jobs is more than 1.
+
   Args:
     dir_path: Path to directory containing content to be zipped
     zip_file_path: Path to which Zipped file is to be written
     include_dir_in_path: Flag to indicate if the parent directory name should
                          be included in the zip file name
     filelist: :List of files to be included in the zip file
+    level: Compression level of deflated files, 0 stores every file
+    stored_extensions: Extensions of the files that are stored
+    jobs: Number of files compressed at the same time
 
   Raises:
     OSError: if dirPath is invalid or does not point to a directory
@@ -65,26 +76,16 @@ def to_zip(dir_path=None, zip_file_path=None, include_dir_in_path=True,
       archive_path = archive_path.replace(sep, "", 1)
     if not include_dir_in_path:
       archive_path = archive_path.replace(dir_to_zip + sep, "", 1)
-    return normcase(archive_path)
+    return normcase(archive_path).replace(sep, "/")
 
   if not filelist:
-    filelist = []
-    for (archive_dir_path, dir_names, file_names) in walk(dir_path):
-      for file_name in file_names:
-        filelist.append(join(archive_dir_path, file_name))
-
-      # getting empty directories as well
-      if not file_names and not dir_names:
-        filelist.append(archive_dir_path)
-  out_fil = zipfile.ZipFile(zip_file_path, "w",
-                            compression=zipfile.ZIP_DEFLATED, allowZip64=True)
-
-  for file_path in filelist:
-    if isdir(file_path):
-      zip_info = zipfile.ZipInfo(trim_path(file_path) + "/")
-      out_fil.writestr(zip_info, "")
-    else:
-      out_fil.write(file_path, trim_path(file_path))
+    # files and empty directories
+    index = ContentIndex(dir_path).scan()
+    filelist = [path for path, _, _ in index.files(dir_path)]
 
-  out_fil.close()
+  start = time.time()
+  write_zip([(file_path, trim_path(file_path)) for file_path in filelist],
+            zip_file_path, level, stored_extensions, jobs)
+  PROFILER.add("zip_build", time.time() - start, len(filelist),
+               getsize(zip_file_path))
   click.echo("Finished!")
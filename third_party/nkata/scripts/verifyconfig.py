@@ -86,7 +86,7 @@ def verify_and_extract_main_config(conf_data, important_keys, retprop):
     return conf_data
 
 
-def verify_section_config(src_dir, sections, video_src):
+def verify_section_config(src_dir, sections, video_src, index=None):
   """Performs sanity check.
 
   Performs sanity check on all the sections to be processed, and
@@ -96,11 +96,13 @@ def verify_section_config(src_dir, sections, video_src):
     src_dir: Source Directory
     sections: List of sections
     video_src: Directory holding videos
+    index: ContentIndex of the sources, files are checked on disk if None
   """
   error_list = []
   for section in sections:
     if not section.startswith(video_src):
-      if not isfile(join(src_dir, section, "section_config.yaml")):
+      config_path = join(src_dir, section, "section_config.yaml")
+      if not (index.isfile(config_path) if index else isfile(config_path)):
         error_list.append(section)
 
   if error_list:
@@ -111,7 +113,8 @@ def verify_section_config(src_dir, sections, video_src):
                   ", ".join(error_list))
     sys.exit(1)
 
-  if not exists(join(src_dir, video_src)):
+  video_path = join(src_dir, video_src)
+  if not (index.exists(video_path) if index else exists(video_path)):
     click.echo(click.style("\nError:" + video_src +
                            " ) specified doesn't exist\n", fg="red"))
     logging.error("Video Source Directory( " +
@@ -19,7 +19,7 @@ from setuptools import setup, find_packages
 setup(
     name='nkata',
     version='1.0.0',
-    packages=find_packages(),
+    packages=find_packages(exclude=['benchmarks']),
     include_package_data=True,
     install_requires=[
         'Click',
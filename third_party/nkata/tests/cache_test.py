@@ -0,0 +1,255 @@
+# Copyright 2015 The Offline Content Packager Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from os import listdir
+from os import makedirs
+from os import unlink
+from os import utime
+from os.path import exists
+from os.path import join
+import shutil
+import tempfile
+import unittest
+
+from scripts.transformations import HtmlTransformation
+from scripts.utils import BundleCache
+from scripts.utils import copy_files
+
+
+class BundleCacheTest(unittest.TestCase):
+
+  def setUp(self):
+    self.src_dir = tempfile.mkdtemp()
+    self.dst_dir = tempfile.mkdtemp()
+    self.store_dir = tempfile.mkdtemp()
+    self.src = join(self.src_dir, "page.html")
+    self.dst = join(self.dst_dir, "page.html")
+    self.write(self.src, "<html><body></body></html>")
+    self.write(self.dst, "transformed")
+
+  def tearDown(self):
+    shutil.rmtree(self.src_dir)
+    shutil.rmtree(self.dst_dir)
+    shutil.rmtree(self.store_dir)
+
+  def write(self, path, content):
+    with open(path, "w") as f:
+      f.write(content)
+
+  def test_unknown_file_is_not_current(self):
+    cache = BundleCache(self.dst_dir, store_dir=self.store_dir)
+    self.assertFalse(cache.is_current(self.src, self.dst, "params"))
+
+  def test_recorded_file_is_current_after_save(self):
+    cache = BundleCache(self.dst_dir, store_dir=self.store_dir)
+    cache.record(self.src, self.dst, "params")
+    cache.save()
+
+    cache = BundleCache(self.dst_dir, store_dir=self.store_dir)
+    self.assertTrue(cache.is_current(self.src, self.dst, "params"))
+    self.assertFalse(cache.is_current(self.src, self.dst, "other params"))
+
+  def test_force_ignores_manifest(self):
+    cache = BundleCache(self.dst_dir, store_dir=self.store_dir)
+    cache.record(self.src, self.dst, "params")
+    cache.save()
+
+    cache = BundleCache(self.dst_dir, store_dir=self.store_dir, force=True)
+    self.assertFalse(cache.is_current(self.src, self.dst, "params"))
+
+  def test_force_keeps_other_trees(self):
+    makedirs(join(self.dst_dir, "videos"))
+    cache = BundleCache(self.dst_dir, store_dir=self.store_dir)
+    key = cache.key(self.src, "params")
+    cache.put(key, "transformed")
+    cache.record(self.src, self.dst, "params")
+    cache.save()
+
+    # rebuilding only the videos keeps the manifest and store of the rest
+    cache = BundleCache(self.dst_dir, store_dir=self.store_dir, force=True)
+    cache.prune(join(self.dst_dir, "videos"))
+    cache.save()
+    cache = BundleCache(self.dst_dir, store_dir=self.store_dir)
+    self.assertTrue(cache.is_current(self.src, self.dst, "params"))
+    self.assertEqual(cache.get(key), "transformed")
+
+  def test_changed_source_is_not_current(self):
+    cache = BundleCache(self.dst_dir, store_dir=self.store_dir)
+    cache.digest(self.src)
+    cache.record(self.src, self.dst, "params")
+    self.write(self.src, "<html><body>changed</body></html>")
+    self.assertFalse(cache.is_current(self.src, self.dst, "params"))
+
+  def test_touched_source_is_current(self):
+    cache = BundleCache(self.dst_dir, store_dir=self.store_dir)
+    cache.digest(self.src)
+    cache.record(self.src, self.dst, "params")
+    utime(self.src, (0, 0))
+    self.assertTrue(cache.is_current(self.src, self.dst, "params"))
+
+  def test_store(self):
+    cache = BundleCache(self.dst_dir, store_dir=self.store_dir)
+    key = cache.key(self.src, "params")
+    self.assertIsNone(cache.get(key))
+    cache.put(key, "transformed")
+    self.assertEqual(cache.get(key), "transformed")
+    self.assertNotEqual(key, cache.key(self.src, "other params"))
+
+  def test_force_ignores_stored_content(self):
+    cache = BundleCache(self.dst_dir, store_dir=self.store_dir)
+    key = cache.key(self.src, "params")
+    cache.put(key, "stale")
+    cache = BundleCache(self.dst_dir, store_dir=self.store_dir, force=True)
+    self.assertIsNone(cache.get(key))
+    cache.put(key, "rebuilt")
+    cache = BundleCache(self.dst_dir, store_dir=self.store_dir)
+    self.assertEqual(cache.get(key), "rebuilt")
+
+  def test_aborted_write_leaves_no_file(self):
+    cache = BundleCache(self.dst_dir, store_dir=self.store_dir)
+    key = cache.key(self.src, "params")
+    store = cache.writer(key)
+    store.write("partial")
+    store.abort()
+    self.assertIsNone(cache.get(key))
+    self.assertEqual(listdir(join(self.store_dir, key[:2])), [])
+
+  def test_store_is_outside_the_destination(self):
+    old_store = join(self.dst_dir, ".nkata", "store")
+    makedirs(old_store)
+    cache = BundleCache(self.dst_dir, store_dir=self.store_dir)
+    cache.put(cache.key(self.src, "params"), "transformed")
+    cache.record(self.src, self.dst, "params", cache.digest(self.src))
+    cache.save()
+    self.assertFalse(exists(old_store))
+    self.assertEqual(len(listdir(self.store_dir)), 1)
+
+  def test_prune_removes_files_not_seen(self):
+    cache = BundleCache(self.dst_dir, store_dir=self.store_dir)
+    cache.record(self.src, self.dst, "params")
+    cache.save()
+
+    cache = BundleCache(self.dst_dir, store_dir=self.store_dir)
+    cache.prune(self.dst_dir)
+    self.assertFalse(exists(self.dst))
+    self.assertEqual(cache.entries, {})
+
+  def test_prune_removes_emptied_directories(self):
+    makedirs(join(self.dst_dir, "level1", "level2"))
+    dst = join(self.dst_dir, "level1", "level2", "page.html")
+    self.write(dst, "transformed")
+    cache = BundleCache(self.dst_dir, store_dir=self.store_dir)
+    cache.record(self.src, dst, "params")
+    cache.save()
+
+    cache = BundleCache(self.dst_dir, store_dir=self.store_dir)
+    cache.prune(self.dst_dir)
+    self.assertFalse(exists(join(self.dst_dir, "level1")))
+    self.assertTrue(exists(self.dst_dir))
+
+  def test_prune_removes_pages_no_longer_generated(self):
+    makedirs(join(self.dst_dir, "Chrome", "html_files"))
+    page = join(self.dst_dir, "Chrome", "html_files", "test_.mp4.html")
+    self.write(page, "video page")
+    cache = BundleCache(self.dst_dir, store_dir=self.store_dir)
+    cache.record_generated(page, self.src)
+    self.assertFalse(cache.is_current(self.src, page, None))
+    cache.save()
+
+    cache = BundleCache(self.dst_dir, store_dir=self.store_dir)
+    cache.prune(self.dst_dir)
+    self.assertFalse(exists(join(self.dst_dir, "Chrome")))
+
+  def test_prune_keeps_other_directories(self):
+    makedirs(join(self.dst_dir, "other"))
+    cache = BundleCache(self.dst_dir, store_dir=self.store_dir)
+    cache.record(self.src, self.dst, "params")
+    cache.save()
+
+    cache = BundleCache(self.dst_dir, store_dir=self.store_dir)
+    cache.prune(join(self.dst_dir, "other"))
+    self.assertTrue(exists(self.dst))
+
+
+class IncrementalCopyTest(unittest.TestCase):
+
+  def setUp(self):
+    self.src_dir = tempfile.mkdtemp()
+    self.dst_dir = tempfile.mkdtemp()
+    self.store_dir = tempfile.mkdtemp()
+    with open(join(self.src_dir, "page.html"), "w") as f:
+      f.write("<html><body><a href='http://x'>x</a></body></html>")
+    with open(join(self.src_dir, "notes.txt"), "w") as f:
+      f.write("Mary had a little lamb.\n")
+
+  def tearDown(self):
+    shutil.rmtree(self.src_dir)
+    shutil.rmtree(self.dst_dir)
+    shutil.rmtree(self.store_dir)
+
+  def bundle(self, dst):
+    cache = BundleCache(self.dst_dir, store_dir=self.store_dir)
+    transformation = HtmlTransformation(color="blue", code="", link=None,
+                                        cache=cache)
+    copy_files((self.src_dir, dst), "Books", [transformation], cache=cache)
+    cache.save()
+
+  def test_unchanged_files_are_skipped(self):
+    dst = join(self.dst_dir, "Books")
+    self.bundle(dst)
+    with open(join(dst, "page.html"), "w") as f:
+      f.write("left alone")
+    self.bundle(dst)
+    with open(join(dst, "page.html")) as f:
+      self.assertEqual(f.read(), "left alone")
+
+  def test_transformed_content_is_shared(self):
+    self.bundle(join(self.dst_dir, "disc1", "Books"))
+    self.bundle(join(self.dst_dir, "disc2", "Books"))
+    with open(join(self.dst_dir, "disc1", "Books", "page.html")) as f:
+      first = f.read()
+    with open(join(self.dst_dir, "disc2", "Books", "page.html")) as f:
+      second = f.read()
+    self.assertEqual(first, second)
+    self.assertIn("color: blue", first)
+    self.assertEqual(len(listdir(self.store_dir)), 1)
+
+  def test_failed_transformation_leaves_no_temporary_file(self):
+    cache = BundleCache(self.dst_dir, store_dir=self.store_dir)
+    transformation = HtmlTransformation(color="blue", code="", link=None,
+                                        cache=cache)
+    src = join(self.src_dir, "page.html")
+    key = cache.key(src, transformation.cache_key())
+
+    def fail(chunks, headers=True):  # pylint: disable=unused-argument
+      raise ValueError("broken page")
+      yield  # pylint: disable=unreachable
+
+    transformation.rewriter.rewrite = fail
+    self.assertRaises(ValueError, transformation.apply, src,
+                      join(self.dst_dir, "page.html"), None, None, None)
+    self.assertEqual(listdir(join(self.store_dir, key[:2])), [])
+
+  def test_deleted_source_is_removed(self):
+    dst = join(self.dst_dir, "Books")
+    self.bundle(dst)
+    self.assertTrue(exists(join(dst, "notes.txt")))
+    unlink(join(self.src_dir, "notes.txt"))
+    self.bundle(dst)
+    self.assertFalse(exists(join(dst, "notes.txt")))
+    self.assertTrue(exists(join(dst, "page.html")))
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -22,6 +22,7 @@ import unittest
 
 from scripts.transformations import HtmlTransformation
 from scripts.utils import copy_files
+from scripts.utils import Engine
 
 
 class CopyFileTest(unittest.TestCase):
@@ -52,6 +53,26 @@ class CopyFileTest(unittest.TestCase):
     result = open(join(self.dst_dir, self.filename)).read()
     self.assertEqual(result, expected)
 
+  def test_copy_files_parallel(self):
+    for i in range(20):
+      with open(join(self.src_dir, "page%d.html" % i), "w") as f:
+        f.write("<html><body><a href='http://x'>%d</a></body></html>" % i)
+    html_transformation = HtmlTransformation(
+        color="blue", code="", link="www.xxx.com")
+    engine = Engine(3)
+    try:
+      copy_files((self.src_dir, self.dst_dir), "Books", [html_transformation],
+                 engine=engine)
+    finally:
+      engine.close()
+
+    for i in range(20):
+      result = open(join(self.dst_dir, "page%d.html" % i)).read()
+      self.assertIn(">%d</a>" % i, result)
+      self.assertIn("color: blue", result)
+    result = open(join(self.dst_dir, self.filename)).read()
+    self.assertEqual(result, "Mary had a little lamb.\n")
+
 
 if __name__ == "__main__":
   unittest.main()
@@ -0,0 +1,171 @@
+# Copyright 2015 The Offline Content Packager Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from os.path import getmtime
+from os.path import join
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from scripts.utils import download_image
+from scripts.utils import Fetcher
+
+try:
+  from http.server import BaseHTTPRequestHandler
+  from http.server import HTTPServer
+except ImportError:
+  from BaseHTTPServer import BaseHTTPRequestHandler
+  from BaseHTTPServer import HTTPServer
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+  """Serves a few canned responses and counts the requests."""
+
+  requests = []
+  failures = {}
+  errors = {}
+  offline = False
+
+  def do_GET(self):  # pylint: disable=invalid-name
+    if StandInHandler.offline:
+      # drop the connection without a response
+      self.close_connection = True
+      return
+    StandInHandler.requests.append(self.path)
+    if StandInHandler.failures.get(self.path):
+      StandInHandler.failures[self.path] -= 1
+      self.send_response(503)
+      self.end_headers()
+      return
+    if self.path in StandInHandler.errors:
+      self.send_response(StandInHandler.errors[self.path])
+      self.end_headers()
+      return
+
+    if self.path == "/slow":
+      time.sleep(1)
+    if self.path == "/thumb.jpg":
+      if self.headers.get("If-None-Match") == '"v1"':
+        self.send_response(304)
+        self.end_headers()
+        return
+      body = b"jpeg data"
+    elif self.path == "/oembed":
+      body = b'{"title": "Intro"}'
+    else:
+      body = b"plain data"
+
+    self.send_response(200)
+    if self.path == "/thumb.jpg":
+      self.send_header("ETag", '"v1"')
+    self.send_header("Content-Length", str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def log_message(self, *args):  # pylint: disable=arguments-differ
+    pass
+
+
+class FetcherTest(unittest.TestCase):
+
+  def setUp(self):
+    self.server = HTTPServer(("127.0.0.1", 0), StandInHandler)
+    self.thread = threading.Thread(target=self.server.serve_forever)
+    self.thread.daemon = True
+    self.thread.start()
+    self.url = "http://127.0.0.1:%d" % self.server.server_address[1]
+    self.cache_dir = tempfile.mkdtemp()
+    StandInHandler.requests = []
+    StandInHandler.failures = {}
+    StandInHandler.errors = {}
+    StandInHandler.offline = False
+
+  def tearDown(self):
+    self.server.shutdown()
+    self.server.server_close()
+    shutil.rmtree(self.cache_dir)
+
+  def fetch(self, path, **kwargs):
+    fetcher = Fetcher(self.cache_dir, **kwargs)
+    try:
+      return fetcher.fetch(self.url + path)
+    finally:
+      fetcher.close()
+
+  def test_revalidates_cached_content(self):
+    self.assertEqual(self.fetch("/thumb.jpg"), b"jpeg data")
+    self.assertEqual(self.fetch("/thumb.jpg"), b"jpeg data")
+    self.assertEqual(StandInHandler.requests, ["/thumb.jpg", "/thumb.jpg"])
+
+  def test_content_without_validators_is_reused_until_it_expires(self):
+    self.assertEqual(self.fetch("/plain"), b"plain data")
+    self.assertEqual(self.fetch("/plain"), b"plain data")
+    self.assertEqual(StandInHandler.requests, ["/plain"])
+    self.assertEqual(self.fetch("/plain", max_age=0), b"plain data")
+    self.assertEqual(StandInHandler.requests, ["/plain", "/plain"])
+
+  def test_cached_content_is_used_on_errors(self):
+    self.fetch("/oembed", max_age=0)
+    StandInHandler.errors["/oembed"] = 404
+    self.assertEqual(self.fetch("/oembed", max_age=0), b'{"title": "Intro"}')
+    self.assertEqual(len(StandInHandler.requests), 2)
+    fetcher = Fetcher(None)
+    self.assertIsNone(fetcher.fetch(self.url + "/oembed"))
+    fetcher.close()
+
+  def test_cached_content_is_used_when_offline(self):
+    self.fetch("/thumb.jpg")
+    StandInHandler.offline = True
+    self.assertEqual(self.fetch("/thumb.jpg", retries=0), b"jpeg data")
+    self.assertIsNone(self.fetch("/oembed", retries=0))
+
+  def test_retries(self):
+    StandInHandler.failures["/plain"] = 2
+    self.assertEqual(self.fetch("/plain"), b"plain data")
+    self.assertEqual(len(StandInHandler.requests), 3)
+
+  def test_timeout(self):
+    self.assertIsNone(self.fetch("/slow", timeout=0.2, retries=0))
+
+  def test_prefetch_requests_once(self):
+    fetcher = Fetcher(None, jobs=4)
+    fetcher.prefetch([self.url + "/oembed", self.url + "/plain"])
+    self.assertEqual(fetcher.fetch_json(self.url + "/oembed"),
+                     {"title": "Intro"})
+    self.assertEqual(fetcher.fetch(self.url + "/plain"), b"plain data")
+    fetcher.close()
+    self.assertEqual(sorted(StandInHandler.requests), ["/oembed", "/plain"])
+
+  def test_download_image(self):
+    fetcher = Fetcher(self.cache_dir, retries=0)
+    image = download_image(self.url + "/thumb.jpg", self.cache_dir, "intro",
+                           fetcher)
+    self.assertEqual(image, "intro.jpg")
+    path = join(self.cache_dir, "images", "intro.jpg")
+    with open(path, "rb") as f:
+      self.assertEqual(f.read(), b"jpeg data")
+    mtime = getmtime(path)
+    time.sleep(0.01)
+    download_image(self.url + "/thumb.jpg", self.cache_dir, "intro", fetcher)
+    self.assertEqual(getmtime(path), mtime)
+    StandInHandler.offline = True
+    self.assertFalse(download_image(self.url + "/other.jpg", self.cache_dir,
+                                    "other", fetcher))
+    fetcher.close()
+
+
+if __name__ == "__main__":
+  unittest.main()
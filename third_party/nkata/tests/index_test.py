@@ -0,0 +1,113 @@
+# Copyright 2015 The Offline Content Packager Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from os import makedirs
+from os import stat
+from os import symlink
+from os import walk
+from os.path import join
+import shutil
+import tempfile
+import unittest
+
+from scripts.utils import BundleCache
+from scripts.utils import ContentIndex
+from scripts.utils import load_yaml
+
+
+class ContentIndexTest(unittest.TestCase):
+
+  def setUp(self):
+    self.src_dir = tempfile.mkdtemp()
+    self.dst_dir = tempfile.mkdtemp()
+    self.store_dir = tempfile.mkdtemp()
+    makedirs(join(self.src_dir, "section", "images"))
+    makedirs(join(self.src_dir, "empty"))
+    self.files = {
+        join("section", "index.html"): "<html></html>",
+        join("section", "images", "logo.png"): "png data",
+        join("section", "section_config.yaml"): "title: Section\n",
+    }
+    for name, data in self.files.items():
+      with open(join(self.src_dir, name), "w") as f:
+        f.write(data)
+    self.index = ContentIndex(self.src_dir).scan()
+
+  def tearDown(self):
+    shutil.rmtree(self.src_dir)
+    shutil.rmtree(self.dst_dir)
+    shutil.rmtree(self.store_dir)
+
+  def test_walk_matches_os_walk(self):
+    self.assertEqual(list(self.index.walk(self.src_dir)),
+                     list(walk(self.src_dir)))
+
+  def test_lookups(self):
+    path = join(self.src_dir, "section", "index.html")
+    info = stat(path)
+    self.assertEqual(self.index.stat(path), (info.st_size, info.st_mtime))
+    self.assertTrue(self.index.isfile(path))
+    self.assertFalse(self.index.isdir(path))
+    self.assertTrue(self.index.isdir(join(self.src_dir, "empty")))
+    self.assertFalse(self.index.exists(join(self.src_dir, "missing")))
+    self.assertEqual(sorted(self.index.listdir(self.src_dir)),
+                     ["empty", "section"])
+    self.assertRaises(OSError, self.index.listdir, path)
+
+  def test_files_and_size(self):
+    files = sorted(self.index.files(self.src_dir))
+    self.assertEqual(files[0], (join(self.src_dir, "empty"), 0, True))
+    self.assertEqual(len(files), 4)
+    self.assertEqual(self.index.size(self.src_dir),
+                     sum([len(data) for data in self.files.values()]))
+
+  def test_symlinked_directory_is_not_followed(self):
+    symlink(join(self.src_dir, "section"), join(self.src_dir, "link"))
+    index = ContentIndex(self.src_dir).scan()
+    self.assertEqual(list(index.walk(self.src_dir)),
+                     list(walk(self.src_dir)))
+    self.assertEqual(len(index.files(self.src_dir)), 4)
+
+  def test_save_and_load(self):
+    path = join(self.dst_dir, "index.json")
+    self.index.save(path)
+    index = ContentIndex.load(path)
+    self.assertEqual(index.root, self.src_dir)
+    self.assertEqual(index.dirs, self.index.dirs)
+    self.assertEqual(index.inodes, self.index.inodes)
+    self.assertIsNone(ContentIndex.load(join(self.dst_dir, "missing.json")))
+
+  def test_yaml_is_parsed_once(self):
+    path = join(self.src_dir, "section", "section_config.yaml")
+    self.assertEqual(load_yaml(path, self.index), {"title": "Section"})
+    with open(path, "w") as f:
+      f.write("title: Changed\n")
+    self.assertEqual(load_yaml(path, self.index), {"title": "Section"})
+    self.assertEqual(load_yaml(path), {"title": "Changed"})
+
+  def test_cache_reads_the_index(self):
+    src = join(self.src_dir, "section", "index.html")
+    dst = join(self.dst_dir, "section", "index.html")
+    makedirs(join(self.dst_dir, "section"))
+    shutil.copy(src, dst)
+    cache = BundleCache(self.dst_dir, store_dir=self.store_dir, index=self.index)
+    cache.record(src, dst, "copy")
+    self.assertTrue(cache.is_current(src, dst, "copy"))
+    # the source is only stated once, when it is scanned
+    entry = cache.entries["section/index.html"]
+    self.assertEqual((entry["size"], entry["mtime"]), self.index.stat(src))
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,208 @@
+# Copyright 2015 The Offline Content Packager Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from os import link
+from os import makedirs
+from os.path import getsize
+from os.path import join
+import shutil
+import struct
+import tempfile
+import unittest
+
+from scripts.utils import ContentIndex
+from scripts.utils import iso9660
+from scripts.utils import to_iso
+
+SECTOR = iso9660.SECTOR
+
+
+def read_directory(image, location, size):
+  """Parses directory records into a dict of identifier to records."""
+  records = {}
+  data = image[location * SECTOR:location * SECTOR + size]
+  pos = 0
+  while pos < len(data):
+    length = ord(data[pos:pos + 1])
+    if not length:
+      pos += SECTOR - pos % SECTOR
+      continue
+    extent, = struct.unpack("<I", data[pos + 2:pos + 6])
+    data_size, = struct.unpack("<I", data[pos + 10:pos + 14])
+    flags = ord(data[pos + 25:pos + 26])
+    ident = data[pos + 33:pos + 33 + ord(data[pos + 32:pos + 33])]
+    records.setdefault(ident, []).append((extent, data_size, flags))
+    pos += length
+  return records
+
+
+def root_directory(image, descriptor):
+  """Gets the root directory records of the volume descriptor."""
+  offset = (16 + descriptor) * SECTOR + 156
+  extent, = struct.unpack("<I", image[offset + 2:offset + 6])
+  size, = struct.unpack("<I", image[offset + 10:offset + 14])
+  return read_directory(image, extent, size)
+
+
+class IsoWriterTest(unittest.TestCase):
+
+  def setUp(self):
+    self.src_dir = tempfile.mkdtemp()
+    self.dst_dir = tempfile.mkdtemp()
+    makedirs(join(self.src_dir, "videos", "Android"))
+    makedirs(join(self.src_dir, "empty"))
+    with open(join(self.src_dir, "index.html"), "w") as f:
+      f.write("<html></html>")
+    with open(join(self.src_dir, "videos", "Android", "intro.mp4"), "wb") as f:
+      f.write(b"v" * 5000)
+
+  def tearDown(self):
+    shutil.rmtree(self.src_dir)
+    shutil.rmtree(self.dst_dir)
+
+  def write(self, name="goc.iso", filelist=None):
+    path = join(self.dst_dir, name)
+    self.assertTrue(to_iso(self.src_dir, path, filelist))
+    with open(path, "rb") as f:
+      return f.read()
+
+  def test_descriptors(self):
+    image = self.write()
+    self.assertEqual(image[16 * SECTOR:16 * SECTOR + 6], b"\x01CD001")
+    self.assertEqual(image[17 * SECTOR:17 * SECTOR + 6], b"\x02CD001")
+    self.assertEqual(image[18 * SECTOR:18 * SECTOR + 6], b"\xffCD001")
+    volume_size, = struct.unpack("<I", image[16 * SECTOR + 80:
+                                             16 * SECTOR + 84])
+    self.assertEqual(volume_size * SECTOR, len(image))
+    self.assertEqual(image[16 * SECTOR + 40:16 * SECTOR + 43], b"GOC")
+
+  def test_primary_and_joliet_names(self):
+    image = self.write()
+    primary = root_directory(image, 0)
+    self.assertIn(b"INDEX.HTM;1", primary)
+    self.assertIn(b"VIDEOS", primary)
+    joliet = root_directory(image, 1)
+    self.assertIn("index.html".encode("utf-16-be"), joliet)
+    self.assertIn("empty".encode("utf-16-be"), joliet)
+
+  def test_file_data(self):
+    image = self.write()
+    extent, size, _ = root_directory(image, 0)[b"INDEX.HTM;1"][0]
+    self.assertEqual(image[extent * SECTOR:extent * SECTOR + size],
+                     b"<html></html>")
+    self.assertEqual(root_directory(image, 1)[
+        "index.html".encode("utf-16-be")][0][:2], (extent, size))
+
+  def test_rerun_is_identical(self):
+    self.assertEqual(self.write(), self.write())
+
+  def test_hard_links_share_data(self):
+    link(join(self.src_dir, "index.html"), join(self.src_dir, "copy.html"))
+    image = self.write()
+    records = root_directory(image, 0)
+    self.assertEqual(records[b"INDEX.HTM;1"], records[b"COPY.HTM;1"])
+
+  def test_long_names_are_reported(self):
+    for name in ("a" * 70 + " part 1.mp4", "a" * 70 + " part 2.mp4"):
+      with open(join(self.src_dir, name), "w") as f:
+        f.write(name)
+    image = iso9660.IsoImage(self.src_dir)
+    joliet = sorted(name for _, name in image.renamed)
+    self.assertEqual(len(joliet), 2)
+    self.assertNotEqual(joliet[0], joliet[1])
+    self.assertEqual(len(root_directory(self.write(), 1)), 2 + 5)
+
+  def test_rock_ridge_names(self):
+    names = [u"a" * 100 + u".html", u"\u00e9" * 120 + u".html",
+             u"b" * 255]
+    for name in names:
+      with open(join(self.src_dir, name), "w") as f:
+        f.write("page")
+    image = self.write()
+    # the . record of the root starts the System Use Sharing Protocol
+    offset = 16 * SECTOR + 156
+    extent, = struct.unpack("<I", image[offset + 2:offset + 6])
+    self.assertEqual(image[extent * SECTOR + 34:extent * SECTOR + 41],
+                     b"SP\x07\x01\xbe\xef\x00")
+    self.assertIn(iso9660.RRIP_ID, image)
+    for name in names:
+      data = name.encode("utf-8")
+      self.assertIn(data[:iso9660.NM_MAX], image)
+      self.assertIn(data[iso9660.NM_MAX:], image)
+    self.assertEqual(self.write(), image)
+
+  def test_layout_reads_the_index(self):
+    link(join(self.src_dir, "index.html"), join(self.src_dir, "copy.html"))
+    expected = iso9660.IsoImage(self.src_dir)
+    index = ContentIndex(self.src_dir).scan()
+    filelist = [path for path, _, _ in index.files(self.src_dir)]
+    # the files are not stated again, so removing them goes unnoticed
+    shutil.rmtree(join(self.src_dir, "videos"))
+    image = iso9660.IsoImage(self.src_dir, filelist, index=index)
+    self.assertEqual(image.volume_size, expected.volume_size)
+    self.assertEqual(image.metadata(), expected.metadata())
+
+  def test_filelist(self):
+    image = self.write(filelist=[join(self.src_dir, "index.html")])
+    self.assertEqual(sorted(root_directory(image, 0)),
+                     [b"\x00", b"\x01", b"INDEX.HTM;1"])
+
+  def test_multi_extent(self):
+    max_extent = iso9660.MAX_EXTENT
+    iso9660.MAX_EXTENT = 2 * SECTOR
+    try:
+      image = self.write()
+    finally:
+      iso9660.MAX_EXTENT = max_extent
+    videos = root_directory(image, 0)[b"VIDEOS"][0]
+    android = read_directory(image, videos[0], videos[1])[b"ANDROID"][0]
+    records = read_directory(image, android[0], android[1])[b"INTRO.MP4;1"]
+    self.assertEqual([(size, flags) for _, size, flags in records],
+                     [(4096, 0x80), (904, 0)])
+    self.assertEqual(records[1][0], records[0][0] + 2)
+    self.assertEqual(getsize(join(self.dst_dir, "goc.iso")), len(image))
+
+
+class IsoNameTest(unittest.TestCase):
+
+  def test_iso_name(self):
+    used = set()
+    self.assertEqual(iso9660.iso_name("index.html", False, used),
+                     b"INDEX.HTM;1")
+    self.assertEqual(iso9660.iso_name("Index.htm", False, used),
+                     b"INDEX1.HTM;1")
+    self.assertEqual(iso9660.iso_name("Android Videos", True, used),
+                     b"ANDROID_")
+
+  def test_joliet_name(self):
+    used = set()
+    name = "a" * 70 + ".mp4"
+    first = iso9660.joliet_name(name, used).decode("utf-16-be")
+    second = iso9660.joliet_name(name, used).decode("utf-16-be")
+    self.assertEqual(len(first), iso9660.JOLIET_NAME_MAX)
+    self.assertTrue(first.endswith(".mp4"))
+    self.assertNotEqual(first, second)
+    self.assertEqual(iso9660.joliet_name("a:b", used), "a_b".encode(
+        "utf-16-be"))
+    self.assertEqual(iso9660.joliet_name("a_b", used), "a_b~1".encode(
+        "utf-16-be"))
+
+  def test_joliet_name_keeps_surrogate_pairs(self):
+    name = u"a" * 63 + u"\U0001F600" * 2
+    ident = iso9660.joliet_name(name, set())
+    self.assertEqual(ident.decode("utf-16-be"), u"a" * 63)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,101 @@
+# Copyright 2015 The Offline Content Packager Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from os import makedirs
+from os.path import dirname
+from os.path import getsize
+from os.path import join
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+from scripts.utils import packing
+from scripts.utils import to_iso
+from scripts.utils import to_zip
+
+SECTOR = packing.SECTOR
+
+
+class PlanVolumesTest(unittest.TestCase):
+
+  def setUp(self):
+    self.src_dir = tempfile.mkdtemp()
+    self.dst_dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.src_dir)
+    shutil.rmtree(self.dst_dir)
+
+  def write(self, path, size):
+    path = join(self.src_dir, path)
+    try:
+      makedirs(dirname(path))
+    except OSError:
+      pass
+    with open(path, "wb") as f:
+      f.write(b"x" * size)
+
+  def test_first_fit_decreasing(self):
+    # walk order fills the first volume with a, then b and d don't fit
+    for name, size in (("a", 6), ("b", 5), ("c", 4), ("d", 5)):
+      self.write(name, size * 1000)
+    volumes = packing.plan_volumes(self.src_dir, 10000, "files")
+    self.assertEqual(len(volumes), 2)
+    self.assertEqual(sorted([v.size for v in volumes]), [10000, 10000])
+
+  def test_keep_sections(self):
+    self.write(join("Logic", "a.html"), 3000)
+    self.write(join("Logic", "b.html"), 3000)
+    self.write(join("videos", "Android", "index.html"), 3000)
+    self.write(join("videos", "Android", "html_files", "v.html"), 3000)
+    self.write("index.html", 3000)
+    volumes = packing.plan_volumes(self.src_dir, 7000, "files", True,
+                                   ("videos",))
+    keys = sorted([sorted([item.key for item in v.items]) for v in volumes])
+    self.assertEqual(keys, [["Logic"], ["index.html"],
+                            [join("videos", "Android")]])
+
+  def test_oversized_section_is_split(self):
+    self.write(join("Logic", "a.html"), 3000)
+    self.write(join("Logic", "b.html"), 3000)
+    volumes = packing.plan_volumes(self.src_dir, 4000, "files", True)
+    self.assertEqual(len(volumes), 2)
+
+  def test_iso_volumes_fit(self):
+    for i in range(40):
+      self.write(join("s%d" % (i % 4), "file%d.html" % i), 900 * i)
+    capacity = 200 * SECTOR
+    volumes = packing.plan_volumes(self.src_dir, capacity, "iso")
+    for i, volume in enumerate(volumes):
+      path = join(self.dst_dir, "goc%d.iso" % i)
+      self.assertTrue(to_iso(self.src_dir, path, volume.paths))
+      self.assertEqual(getsize(path), volume.cost)
+      self.assertLessEqual(getsize(path), capacity)
+    self.assertEqual(sum([len(v.paths) for v in volumes]), 40)
+
+  def test_zip_volumes_fit(self):
+    for i in range(20):
+      self.write("file%d.mp4" % i, 1000 * i)
+    capacity = 40000
+    volumes = packing.plan_volumes(self.src_dir, capacity, "zip")
+    for i, volume in enumerate(volumes):
+      path = join(self.dst_dir, "goc%d.zip" % i)
+      to_zip(self.src_dir, path, False, filelist=volume.paths)
+      self.assertLessEqual(getsize(path), capacity)
+      self.assertIsNone(zipfile.ZipFile(path).testzip())
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,159 @@
+# Copyright 2015 The Offline Content Packager Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from os import listdir
+from os import makedirs
+from os import readlink
+from os import rename
+from os import stat
+from os.path import basename
+from os.path import isabs
+from os.path import islink
+from os.path import join
+import shutil
+import tempfile
+import threading
+import unittest
+
+from scripts.utils import copy_files
+from scripts.utils import create_placer
+from scripts.utils.placement import Placer
+
+
+class PlacerTest(unittest.TestCase):
+
+  def setUp(self):
+    self.src_dir = tempfile.mkdtemp()
+    self.dst_dir = tempfile.mkdtemp()
+    self.src = join(self.src_dir, "video.mp4")
+    self.write(self.src, "video data")
+
+  def tearDown(self):
+    shutil.rmtree(self.src_dir)
+    shutil.rmtree(self.dst_dir)
+
+  def write(self, path, content):
+    with open(path, "w") as f:
+      f.write(content)
+
+  def read(self, path):
+    with open(path) as f:
+      return f.read()
+
+  def test_strategies(self):
+    for strategy in ["copy", "hardlink", "reflink", "symlink"]:
+      dst = join(self.dst_dir, strategy + ".mp4")
+      method = Placer(strategy).place(self.src, dst)
+      self.assertIn(method, [strategy, "copy"])
+      self.assertEqual(self.read(dst), "video data")
+
+  def test_hardlink_shares_inode(self):
+    dst = join(self.dst_dir, "video.mp4")
+    self.assertEqual(Placer("hardlink").place(self.src, dst), "hardlink")
+    self.assertEqual(stat(dst).st_ino, stat(self.src).st_ino)
+
+  def test_symlink_points_to_source(self):
+    dst = join(self.dst_dir, "video.mp4")
+    self.assertEqual(Placer("symlink").place(self.src, dst), "symlink")
+    self.assertTrue(islink(dst))
+    self.assertFalse(isabs(readlink(dst)))
+
+  def test_symlinks_move_with_the_source(self):
+    top = tempfile.mkdtemp()
+    try:
+      makedirs(join(top, "src"))
+      makedirs(join(top, "out", "videos"))
+      self.write(join(top, "src", "a.mp4"), "video data")
+      self.write(join(top, "src", "b.mp4"), "video data")
+      placer = Placer("symlink")
+      placer.place(join(top, "src", "a.mp4"), join(top, "out", "a.mp4"))
+      self.assertEqual(placer.place(join(top, "src", "b.mp4"),
+                                    join(top, "out", "videos", "b.mp4")),
+                       "dedupe")
+      moved = top + "-moved"
+      rename(top, moved)
+      top = moved
+      self.assertEqual(self.read(join(top, "out", "a.mp4")), "video data")
+      self.assertEqual(self.read(join(top, "out", "videos", "b.mp4")),
+                       "video data")
+    finally:
+      shutil.rmtree(top)
+
+  def test_identical_files_placed_at_the_same_time_are_stored_once(self):
+    sources = []
+    for i in range(8):
+      sources.append(join(self.src_dir, "%d.mp4" % i))
+      self.write(sources[-1], "same data")
+    placer = Placer("copy")
+    threads = [threading.Thread(target=placer.place,
+                                args=(src, join(self.dst_dir, basename(src))))
+               for src in sources]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    inodes = set([stat(join(self.dst_dir, basename(src))).st_ino
+                  for src in sources])
+    self.assertEqual(len(inodes), 1)
+
+  def test_identical_files_are_stored_once(self):
+    other = join(self.src_dir, "copy of video.mp4")
+    self.write(other, "video data")
+    self.write(join(self.src_dir, "other.mp4"), "other data")
+    placer = Placer("copy")
+    first = join(self.dst_dir, "first.mp4")
+    second = join(self.dst_dir, "second.mp4")
+    self.assertEqual(placer.place(self.src, first), "copy")
+    self.assertEqual(placer.place(other, second), "dedupe")
+    self.assertEqual(stat(first).st_ino, stat(second).st_ino)
+    self.assertEqual(placer.place(join(self.src_dir, "other.mp4"),
+                                  join(self.dst_dir, "third.mp4")), "copy")
+
+  def test_identical_files_are_stored_once_with_every_strategy(self):
+    other = join(self.src_dir, "copy of video.mp4")
+    self.write(other, "video data")
+    for strategy in ["hardlink", "reflink", "symlink"]:
+      placer = Placer(strategy)
+      first = join(self.dst_dir, strategy + "-first.mp4")
+      second = join(self.dst_dir, strategy + "-second.mp4")
+      self.assertIn(placer.place(self.src, first), [strategy, "copy"])
+      self.assertEqual(placer.place(other, second), "dedupe")
+      self.assertEqual(stat(first).st_ino, stat(second).st_ino)
+      self.assertEqual(self.read(second), "video data")
+
+  def test_replacing_link_leaves_source_alone(self):
+    dst = join(self.dst_dir, "video.mp4")
+    Placer("hardlink").place(self.src, dst)
+    new_src = join(self.src_dir, "new.mp4")
+    self.write(new_src, "new data")
+    Placer("copy").place(new_src, dst)
+    self.assertEqual(self.read(dst), "new data")
+    self.assertEqual(self.read(self.src), "video data")
+
+  def test_invalid_strategy(self):
+    self.assertRaises(ValueError, Placer, "teleport")
+    self.assertEqual(create_placer("teleport").strategy, "copy")
+    self.assertEqual(create_placer(None).strategy, "copy")
+
+  def test_copy_files_with_placer(self):
+    dst = join(self.dst_dir, "Videos")
+    copy_files((self.src_dir, dst), "Videos", [],
+               placer=create_placer("hardlink"))
+    self.assertEqual(listdir(dst), ["video.mp4"])
+    self.assertEqual(stat(join(dst, "video.mp4")).st_ino,
+                     stat(self.src).st_ino)
+
+
+if __name__ == "__main__":
+  unittest.main()
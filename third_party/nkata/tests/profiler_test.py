@@ -0,0 +1,96 @@
+# Copyright 2015 The Offline Content Packager Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+from os import makedirs
+from os.path import join
+import shutil
+import tempfile
+import time
+import unittest
+
+from scripts.utils import copy_files
+from scripts.utils import PROFILER
+from scripts.utils.profiler import Profiler
+
+
+class ProfilerTest(unittest.TestCase):
+
+  def setUp(self):
+    self.tmp_dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    PROFILER.stop()
+    shutil.rmtree(self.tmp_dir)
+
+  def test_nothing_is_recorded_until_started(self):
+    profiler = Profiler()
+    profiler.add("scan", 1.0, 10)
+    profiler.start("bundle")
+    self.assertEqual(profiler.report()["stages"], {})
+
+  def test_totals_and_rates(self):
+    profiler = Profiler()
+    profiler.start("bundle")
+    profiler.add("media_copy", 1.0, 1, 1000, "Android", "media_copy")
+    profiler.add("media_copy", 1.0, 1, 3000, "Chrome", "media_copy")
+    with profiler.stage("config_read", 1):
+      pass
+    profiler.stop()
+
+    report = profiler.report()
+    self.assertEqual(report["command"], "bundle")
+    self.assertGreaterEqual(report["wall_seconds"], 0)
+    copy = report["stages"]["media_copy"]
+    self.assertEqual((copy["calls"], copy["files"], copy["bytes"]),
+                     (2, 2, 4000))
+    self.assertEqual(copy["bytes_per_second"], 2000)
+    self.assertEqual(copy["files_per_second"], 1)
+    self.assertEqual(report["sections"]["Chrome"]["bytes"], 3000)
+    self.assertEqual(report["transformations"]["media_copy"]["files"], 2)
+    self.assertEqual(report["stages"]["config_read"]["calls"], 1)
+
+    path = join(self.tmp_dir, "profile.json")
+    profiler.save(path)
+    with open(path) as report_file:
+      self.assertEqual(json.load(report_file)["stages"]["media_copy"]["bytes"],
+                       4000)
+
+  def test_nested_stages_are_counted_once(self):
+    profiler = Profiler()
+    profiler.start("bundle-videos")
+    with profiler.stage("media_copy", 1):
+      with profiler.stage("template_render", 1):
+        time.sleep(0.2)
+      with profiler.timer():
+        time.sleep(0.2)
+    stages = profiler.report()["stages"]
+    self.assertGreaterEqual(stages["template_render"]["seconds"], 0.2)
+    self.assertLess(stages["media_copy"]["seconds"], 0.1)
+
+  def test_copied_files_are_recorded_by_section(self):
+    src_dir = join(self.tmp_dir, "src")
+    makedirs(src_dir)
+    for name in ("a.png", "b.png"):
+      with open(join(src_dir, name), "w") as f:
+        f.write("data")
+    PROFILER.start("bundle")
+    copy_files((src_dir, join(self.tmp_dir, "dst")), "images", [])
+    report = PROFILER.report()
+    self.assertEqual(report["sections"]["images"]["files"], 2)
+    self.assertEqual(report["stages"]["media_copy"]["bytes"], 8)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -14,6 +14,8 @@
 
 import unittest
 from scripts.transformations import HtmlTransformation
+from scripts.transformations.htmlstream import HtmlRewriter
+from scripts.transformations.htmlstream import join_pieces
 
 
 class TestHtmlTransformHelpers(unittest.TestCase):
@@ -104,5 +106,58 @@ class TestHtmlTransformPublic(unittest.TestCase):
     self.assertNotEqual(self.t.tracking_code, result)
 
 
+class TestHtmlRewriter(unittest.TestCase):
+
+  def setUp(self):
+    self.rewriter = HtmlRewriter("green", "<div>header</div>")
+
+  def rewrite(self, html, size=None, headers=True):
+    size = size or len(html) or 1
+    chunks = [html[i:i + size] for i in range(0, len(html), size)]
+    return join_pieces(self.rewriter.rewrite(chunks, headers), "[T]")
+
+  def test_rewrite(self):
+    html_in = ("<html><BODY class='x'><a href='http://a' target='_self'>a</a>"
+               "<a style='font: 1' href=\"https://b\">b</A ></body></html>")
+    html_out = ("<html><BODY class='x'><div>header</div>"
+                "<a href='http://a' target='_blank' style='color: green' >a</a>"
+                "<a style='font: 1; color: green' href=\"https://b\" "
+                "target='_blank' >b</A >[T]</body></html>")
+    self.assertEqual(self.rewrite(html_in), html_out)
+
+  def test_chunk_boundaries(self):
+    html_in = ("<html><body><p>x</p><a href='http://a'>a</a>\n"
+               "<a href='/b'>b</a></body></html>")
+    html_out = self.rewrite(html_in)
+    for size in range(1, len(html_in)):
+      self.assertEqual(self.rewrite(html_in, size), html_out)
+
+  def test_unclosed_link(self):
+    html_in = "<body><a href='http://a'>a</body>"
+    html_out = "<body><div>header</div><a href='http://a'>a[T]</body>"
+    self.assertEqual(self.rewrite(html_in, 3), html_out)
+
+  def test_link_closed_too_far_away(self):
+    self.rewriter = HtmlRewriter("green", "", max_link=40)
+    html_in = ("<a href='http://a'>" + "x" * 30 + "</a>"
+               "<a href='http://b'>b</a>")
+    html_out = ("<a href='http://a'>" + "x" * 30 + "</a>"
+                "<a href='http://b' target='_blank'  style='color: green' >"
+                "b</a>")
+    for size in (3, 16, len(html_in)):
+      self.assertEqual(self.rewrite(html_in, size), html_out)
+
+  def test_many_unclosed_links(self):
+    html_in = "<body>" + "<a href='http://a'>a" * 1000 + "</body>"
+    html_out = ("<body><div>header</div>" + "<a href='http://a'>a" * 1000 +
+                "[T]</body>")
+    self.assertEqual(self.rewrite(html_in, 64), html_out)
+
+  def test_tracking_only(self):
+    html_in = "<body><a href='http://a'>a</a></body>"
+    html_out = "<body><a href='http://a'>a</a>[T]</body>"
+    self.assertEqual(self.rewrite(html_in, 4, headers=False), html_out)
+
+
 if __name__ == "__main__":
   unittest.main()
@@ -22,6 +22,7 @@ import unittest
 
 import jinja2
 from scripts.transformations import VideoTransformation
+from scripts.utils import BundleCache
 import yaml
 
 
@@ -93,6 +94,32 @@ class VideoTestCase(unittest.TestCase):
 
     self.assertEquals(output, expected_output)
 
+  def test_empty_video_list_is_written(self):
+    self.setUpTemplate("templates/videos_list.html",
+                       "{% for video in list %}{{ video[0] }}{% endfor %}")
+    cache = BundleCache(self.dst_dir, store_dir=join(self.src_dir, "store"))
+    transformation = VideoTransformation(self.tracking_code,
+                                         self.JINJA_ENVIRONMENT, cache)
+    section_dir = join(self.dst_dir, "Chrome")
+    transformation.generate_video_list_html(section_dir, [], "", "", None)
+
+    with open(join(section_dir, "index.html")) as f:
+      self.assertEqual(f.read(), "")
+    self.assertIn(join("Chrome", "index.html"), cache.entries)
+
+  def test_list_videos(self):
+    transformation = self.createInstance()
+    results = [("Android", ("a", "html_files/a_.mp4.html", "a", "", "", None)),
+               ("intro", ("b", "intro/html_files/b_.mp4.html", "b", "", "",
+                          None)),
+               ("intro", ("c", "intro/html_files/c_.mp4.html", "c", "", "",
+                          None))]
+    list_of_videos = transformation.list_videos(results)
+
+    self.assertEqual([video[0] for video in list_of_videos],
+                     ["", "a", "", "b", "c"])
+    self.assertEqual(list_of_videos[2][5], "intro")
+
 
 if __name__ == "__main__":
   unittest.main()
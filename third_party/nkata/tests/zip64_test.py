@@ -0,0 +1,98 @@
+# Copyright 2015 The Offline Content Packager Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from os import makedirs
+from os import urandom
+from os.path import join
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+from scripts.utils import to_zip
+from scripts.utils import zip64
+
+
+class ZipWriterTest(unittest.TestCase):
+
+  def setUp(self):
+    self.src_dir = tempfile.mkdtemp()
+    self.dst_dir = tempfile.mkdtemp()
+    makedirs(join(self.src_dir, "videos", "Android"))
+    makedirs(join(self.src_dir, "empty"))
+    self.files = {
+        "index.html": b"<html>" + b"<p>text</p>" * 500 + b"</html>",
+        join("videos", "Android", "intro.mp4"): b"v" * 5000,
+        "random.txt": urandom(3000),
+    }
+    for name, data in self.files.items():
+      with open(join(self.src_dir, name), "wb") as f:
+        f.write(data)
+
+  def tearDown(self):
+    shutil.rmtree(self.src_dir)
+    shutil.rmtree(self.dst_dir)
+
+  def write(self, name="goc.zip", **kwargs):
+    path = join(self.dst_dir, name)
+    to_zip(self.src_dir, path, False, **kwargs)
+    return zipfile.ZipFile(path)
+
+  def test_content(self):
+    archive = self.write()
+    self.assertIsNone(archive.testzip())
+    self.assertEqual(sorted(archive.namelist()),
+                     ["empty/", "index.html", "random.txt",
+                      "videos/Android/intro.mp4"])
+    for name, data in self.files.items():
+      self.assertEqual(archive.read(name.replace("\\", "/")), data)
+
+  def test_compression_policy(self):
+    archive = self.write()
+    self.assertEqual(archive.getinfo("index.html").compress_type,
+                     zipfile.ZIP_DEFLATED)
+    self.assertEqual(archive.getinfo("videos/Android/intro.mp4").compress_type,
+                     zipfile.ZIP_STORED)
+    # deflate doesn't make random data smaller
+    self.assertEqual(archive.getinfo("random.txt").compress_type,
+                     zipfile.ZIP_STORED)
+
+  def test_level_zero_stores_everything(self):
+    archive = self.write(level=0)
+    self.assertEqual(set([info.compress_type for info in archive.infolist()]),
+                     set([zipfile.ZIP_STORED]))
+
+  def test_parallel_is_identical(self):
+    self.write("one.zip")
+    self.write("four.zip", jobs=4)
+    with open(join(self.dst_dir, "one.zip"), "rb") as f:
+      one = f.read()
+    with open(join(self.dst_dir, "four.zip"), "rb") as f:
+      self.assertEqual(f.read(), one)
+
+  def test_zip64(self):
+    limit = zip64.ZIP64_LIMIT
+    zip64.ZIP64_LIMIT = 1000
+    try:
+      archive = self.write()
+    finally:
+      zip64.ZIP64_LIMIT = limit
+    self.assertIsNone(archive.testzip())
+    info = archive.getinfo("videos/Android/intro.mp4")
+    self.assertEqual(info.file_size, 5000)
+    self.assertEqual(archive.read(info), b"v" * 5000)
+
+
+if __name__ == "__main__":
+  unittest.main()